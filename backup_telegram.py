@@ -16,8 +16,25 @@ from typing import Any, Dict, Iterable, Optional
 
 from dotenv import load_dotenv
 from telethon import TelegramClient
-from telethon.errors import SessionPasswordNeededError
-from telethon.utils import get_peer_id
+
+from catalog import refresh_catalog
+from entities import EntityCache
+from exporter import (
+    DEFAULT_MEDIA_WORKERS,
+    OUTPUT_FORMATS,
+    check_output_format,
+    export_messages,
+    open_sink,
+    relative_path,
+    resume_id,
+    scheduled_call,
+    sign_in,
+)
+from jsonl_writer import FSYNC_POLICIES
+from media_store import MediaStore
+from metrics import DEFAULT_PROGRESS_INTERVAL, METRICS_NAME, ChatMetrics, ExportMetrics
+from scheduler import RequestScheduler
+from sqlite_store import DB_NAME, SqliteStore
 
 
 def load_env() -> None:
@@ -36,32 +53,55 @@ def default_output_dir() -> Path:
     return desktop / "TelegramBackups" if desktop.exists() else Path.cwd() / "TelegramBackups"
 
 
-def message_to_dict(msg) -> Dict[str, Any]:
-    """Convierte un mensaje de Telethon en un dict JSON-friendly."""
-    data: Dict[str, Any] = {
-        "id": msg.id,
-        "date": msg.date.isoformat() if msg.date else None,
-        "message": msg.message,
-        "sender_id": msg.sender_id,
-        "chat_id": get_peer_id(msg.peer_id) if msg.peer_id else None,
-        "reply_to_msg_id": getattr(msg, "reply_to_msg_id", None),
-        "via_bot_id": getattr(msg, "via_bot_id", None),
-        "views": getattr(msg, "views", None),
-        "forwards": getattr(msg, "forwards", None),
-        "reactions": [r.to_dict() for r in msg.reactions.results] if getattr(msg, "reactions", None) else None,
-        "fwd_from": msg.fwd_from.to_dict() if msg.fwd_from else None,
-        "action": msg.action.to_dict() if getattr(msg, "action", None) else None,
-        "media_type": msg.media.__class__.__name__ if msg.media else None,
-    }
-    return data
+def expected_messages(dialog, start_id: int = 0, limit: Optional[int] = None) -> Optional[int]:
+    """
+    Mensajes que faltan por exportar, aproximados con el id del último mensaje.
+
+    Solo en canales y supergrupos, donde los ids son correlativos dentro del
+    chat; en chats privados y grupos básicos los ids son de toda la cuenta.
+    """
+    top = getattr(getattr(dialog, "message", None), "id", None)
+    if not top or not getattr(dialog, "is_channel", False):
+        return None
+    expected = max(0, top - start_id)
+    return min(expected, limit) if limit else expected
 
 
-async def export_dialog(client: TelegramClient, dialog, base_dir: Path, limit: Optional[int], skip_media: bool) -> Dict[str, Any]:
-    """Exporta un diálogo entero (mensajes + multimedia)."""
+async def export_dialog(
+    client: TelegramClient,
+    dialog,
+    base_dir: Path,
+    limit: Optional[int],
+    skip_media: bool,
+    media_workers: int = DEFAULT_MEDIA_WORKERS,
+    scheduler: Optional[RequestScheduler] = None,
+    incremental: bool = False,
+    fsync: str = "none",
+    media_store: Optional[MediaStore] = None,
+    sqlite_store: Optional[SqliteStore] = None,
+    output_format: str = "jsonl",
+    metrics: Optional[ChatMetrics] = None,
+    entities: Optional[EntityCache] = None,
+) -> Dict[str, Any]:
+    """
+    Exporta un diálogo entero (mensajes + multimedia) con `exporter.export_messages`.
+
+    `scheduler` (ver `scheduler.py`) reparte las peticiones a Telegram entre
+    todos los chats y gestiona las esperas por FloodWait.
+
+    Con `incremental` solo se piden los mensajes posteriores al último id
+    exportado (guardado en `state.json` junto a `chat.json`).
+
+    Con `media_store` la multimedia se guarda una sola vez en el almacén
+    compartido y `media_file` apunta allí (o a un enlace duro en `media/`).
+    `output_format` elige el destino de los mensajes (ver `exporter.open_sink`);
+    con "sqlite" van a `sqlite_store`, la base de datos del respaldo.
+    `metrics` recoge contadores y tiempos del chat (ver `metrics.py`) y
+    `entities` los nombres del chat y de sus remitentes (ver `entities.py`).
+    """
     chat_id = dialog.id
     chat_title = sanitize_name(dialog.name or f"chat_{chat_id}")
     chat_dir = base_dir / f"{chat_id}_{chat_title}"
-    media_dir = chat_dir / "media"
     chat_dir.mkdir(parents=True, exist_ok=True)
 
     # Guarda info básica del chat
@@ -71,33 +111,43 @@ async def export_dialog(client: TelegramClient, dialog, base_dir: Path, limit: O
         "title": dialog.name,
         "entity_type": dialog.entity.__class__.__name__,
     }
+    if media_store is not None:
+        meta["media_store"] = relative_path(media_store.root, chat_dir)
+    if sqlite_store is not None:
+        meta["sqlite"] = relative_path(sqlite_store.db_path, chat_dir)
+        sqlite_store.upsert_chat(chat_id, dialog.name, meta["entity_type"], str(chat_dir))
     meta_path.write_text(json.dumps(meta, ensure_ascii=False, indent=2), encoding="utf-8")
-
-    messages_path = chat_dir / "messages.jsonl"
-    written = 0
-    downloaded_media = 0
-
-    # Orden cronológico: reverse=True recorre del más antiguo al más nuevo.
-    async for msg in client.iter_messages(dialog.entity, limit=limit, reverse=True):
-        payload = message_to_dict(msg)
-
-        if not skip_media and msg.media:
-            media_dir.mkdir(parents=True, exist_ok=True)
-            file_path = await msg.download_media(file=media_dir)
-            if file_path:
-                # Guardamos ruta relativa para enlazar mensaje con archivo
-                payload["media_file"] = os.path.relpath(file_path, chat_dir)
-                downloaded_media += 1
-
-        with messages_path.open("a", encoding="utf-8") as f:
-            f.write(json.dumps(payload, ensure_ascii=False) + "\n")
-        written += 1
+    if entities is not None:
+        entities.add(dialog.entity)
+
+    start_id = resume_id(chat_dir, sqlite_store, chat_id) if incremental else 0
+    if metrics is not None:
+        metrics.expected = expected_messages(dialog, start_id, limit)
+    sink = open_sink(chat_dir, output_format, fsync, sqlite_store, chat_id)
+    counters = await export_messages(
+        client,
+        dialog.entity,
+        chat_dir,
+        sink,
+        limit,
+        skip_media,
+        media_workers,
+        scheduler,
+        media_store,
+        start_id=start_id,
+        state_path=chat_dir / "state.json" if incremental else None,
+        metrics=metrics,
+        entities=entities,
+    )
+    if entities is not None:
+        entities.save()
 
     return {
         "chat_id": chat_id,
         "title": dialog.name,
-        "messages": written,
-        "media": downloaded_media,
+        "messages": counters["messages"],
+        "media": counters["media"],
+        "last_id": counters["last_id"],
         "path": str(chat_dir),
     }
 
@@ -111,25 +161,36 @@ async def run_backup(
     limit: Optional[int],
     chats: Optional[Iterable[str]],
     skip_media: bool,
+    media_workers: int = DEFAULT_MEDIA_WORKERS,
+    parallel_chats: int = 1,
+    incremental: bool = False,
+    fsync: str = "none",
+    media_store_dir: Optional[Path] = None,
+    media_hardlink: bool = False,
+    output_format: str = "jsonl",
+    progress_interval: float = DEFAULT_PROGRESS_INTERVAL,
 ) -> None:
+    check_output_format(output_format)
     output_dir.mkdir(parents=True, exist_ok=True)
     session_path = output_dir / "sessions" / session_name
     session_path.parent.mkdir(parents=True, exist_ok=True)
 
     client = TelegramClient(str(session_path), api_id, api_hash)
 
-    await client.connect()
-    if not await client.is_user_authorized():
-        if not phone:
-            raise RuntimeError("Necesitas proporcionar --phone o la variable TG_PHONE para iniciar sesión.")
-        await client.send_code_request(phone)
-        try:
-            await client.sign_in(phone, input("Código de Telegram: "))
-        except SessionPasswordNeededError:
-            await client.sign_in(password=input("Tu contraseña 2FA: "))
+    await sign_in(client, phone)
+
+    parallel_chats = max(1, parallel_chats)
+    chat_slots = asyncio.Semaphore(parallel_chats)
+    # Como máximo --media-workers descargas y --parallel-chats historiales a la vez
+    # entre todos los chats; el planificador baja el cupo si Telegram pide esperar.
+    scheduler = RequestScheduler(max_downloads=media_workers, max_history=parallel_chats)
+
+    async def list_dialogs() -> list:
+        # Un FloodWait a mitad de la lista la vuelve a pedir entera.
+        return [d async for d in client.iter_dialogs()]
 
     dialogs = []
-    async for d in client.iter_dialogs():
+    for d in await scheduled_call(scheduler, "other", list_dialogs):
         if chats:
             # Permite filtrar por ID o parte del nombre
             match = str(d.id) in chats or any(q.lower() in (d.name or "").lower() for q in chats)
@@ -138,18 +199,76 @@ async def run_backup(
         dialogs.append(d)
 
     print(f"Se encontraron {len(dialogs)} chats/diálogos para exportar.")
+    sqlite_store = SqliteStore(output_dir / DB_NAME, fsync=fsync) if output_format == "sqlite" else None
+    media_store = None
+    if media_store_dir is not None and not skip_media:
+        media_store = MediaStore(media_store_dir, hardlink=media_hardlink)
+
+    entities = EntityCache(output_dir)
+    metrics = ExportMetrics(output_dir / METRICS_NAME, scheduler)
+    metrics.log(
+        "start",
+        chats=len(dialogs),
+        format=output_format,
+        media_workers=media_workers,
+        parallel_chats=parallel_chats,
+        incremental=incremental,
+    )
 
+    async def export_one(dialog) -> Dict[str, Any]:
+        chat_metrics = metrics.chat(dialog.id, dialog.name, expected_messages(dialog, limit=limit))
+        async with chat_slots:
+            info = await export_dialog(
+                client,
+                dialog,
+                output_dir,
+                limit,
+                skip_media,
+                media_workers,
+                scheduler,
+                incremental,
+                fsync,
+                media_store,
+                sqlite_store,
+                output_format,
+                chat_metrics,
+                entities,
+            )
+        metrics.finish_chat(chat_metrics)
+        return info
+
+    tasks = [asyncio.create_task(export_one(dialog)) for dialog in dialogs]
+    reporter = asyncio.create_task(metrics.report(progress_interval)) if progress_interval > 0 else None
     results = []
-    for dialog in dialogs:
-        print(f"- Exportando: {dialog.name} (id={dialog.id}) ...")
-        info = await export_dialog(client, dialog, output_dir, limit, skip_media)
-        results.append(info)
-        print(f"  > Mensajes: {info['messages']}, multimedia: {info['media']}, carpeta: {info['path']}")
+    try:
+        # Se informa en el orden de `dialogs` aunque los chats terminen en otro orden,
+        # así la consola y resumen.json son deterministas.
+        for dialog, task in zip(dialogs, tasks):
+            print(f"- Exportando: {dialog.name} (id={dialog.id}) ...")
+            info = await task
+            results.append(info)
+            print(f"  > Mensajes: {info['messages']}, multimedia: {info['media']}, carpeta: {info['path']}")
+    finally:
+        if reporter is not None:
+            tasks.append(reporter)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if sqlite_store is not None:
+            sqlite_store.close()
+        entities.save()
+        metrics.close()
+
+    if scheduler.total_wait:
+        print(f"Tiempo total en espera por FloodWait: {scheduler.total_wait:.0f}s ({scheduler.summary()})")
+    if media_store is not None and media_store.reused:
+        print(f"Archivos reutilizados del almacén compartido: {media_store.reused}")
 
     await client.disconnect()
 
     summary_path = output_dir / "resumen.json"
     summary_path.write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding="utf-8")
+    refresh_catalog(output_dir, [Path(info["path"]) for info in results])
     print(f"\nRespaldo finalizado. Resumen guardado en: {summary_path}")
 
 
@@ -165,6 +284,52 @@ def main() -> None:
     parser.add_argument("--output", type=Path, default=None, help="Ruta de salida (por defecto: Escritorio/TelegramBackups)")
     parser.add_argument("--limit", type=int, default=0, help="Máx. mensajes por chat (0 = todos)")
     parser.add_argument("--skip-media", action="store_true", help="No descargar multimedia, solo mensajes")
+    parser.add_argument(
+        "--media-workers",
+        type=int,
+        default=DEFAULT_MEDIA_WORKERS,
+        help=f"Descargas de multimedia simultáneas, compartidas entre chats (por defecto: {DEFAULT_MEDIA_WORKERS})",
+    )
+    parser.add_argument("--parallel-chats", type=int, default=1, help="Chats exportados a la vez (por defecto: 1)")
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Solo exporta mensajes nuevos desde el último id guardado en state.json de cada chat",
+    )
+    parser.add_argument(
+        "--fsync",
+        choices=FSYNC_POLICIES,
+        default="none",
+        help="Cuándo forzar el volcado de messages.jsonl a disco: none, close (al terminar cada chat) o flush (en cada bloque)",
+    )
+    parser.add_argument(
+        "--media-store",
+        nargs="?",
+        const="",
+        default=None,
+        metavar="RUTA",
+        help="Guarda la multimedia una sola vez en un almacén compartido (por defecto: <salida>/media_store)",
+    )
+    parser.add_argument(
+        "--media-hardlink",
+        action="store_true",
+        help="Con --media-store, crea además enlaces duros en la carpeta media/ de cada chat",
+    )
+    parser.add_argument(
+        "--format",
+        choices=OUTPUT_FORMATS,
+        default="jsonl",
+        help=(
+            "Formato de salida de los mensajes: messages.jsonl por chat, comprimido por bloques "
+            f"(jsonl.gz, jsonl.zst) o una base {DB_NAME} en la carpeta de salida"
+        ),
+    )
+    parser.add_argument(
+        "--progress-interval",
+        type=float,
+        default=DEFAULT_PROGRESS_INTERVAL,
+        help=f"Segundos entre líneas de progreso (0 = sin progreso; por defecto: {DEFAULT_PROGRESS_INTERVAL:g})",
+    )
     parser.add_argument("--chats", nargs="*", help="Filtrar por ID o parte del nombre (por defecto: todos)")
 
     args = parser.parse_args()
@@ -174,6 +339,9 @@ def main() -> None:
 
     output_dir = args.output or default_output_dir()
     limit = None if args.limit == 0 else args.limit
+    media_store_dir = None
+    if args.media_store is not None:
+        media_store_dir = Path(args.media_store) if args.media_store else output_dir / "media_store"
 
     asyncio.run(
         run_backup(
@@ -185,6 +353,14 @@ def main() -> None:
             limit=limit,
             chats=args.chats,
             skip_media=args.skip_media,
+            media_workers=args.media_workers,
+            parallel_chats=args.parallel_chats,
+            incremental=args.incremental,
+            fsync=args.fsync,
+            media_store_dir=media_store_dir,
+            media_hardlink=args.media_hardlink,
+            output_format=args.format,
+            progress_interval=args.progress_interval,
         )
     )
 
@@ -0,0 +1,557 @@
+#!/usr/bin/env python
+"""
+Banco de pruebas sin conexión para los exportadores y el visor.
+
+Sustituye `TelegramClient` por un cliente falso que genera diálogos, temas y
+mensajes sintéticos (tamaño del texto, multimedia, latencia por petición y
+FloodWait configurables) y mide `backup_telegram.run_backup`,
+`export_topics.run` y, sobre un chat generado, `viewer.load_messages` y
+`MessageModel.applyFilters`. Los datos salen siempre iguales para los mismos
+parámetros y cada prueba corre en un proceso aparte para medir su pico de RSS.
+
+  python benchmark.py --dialogs 4 --messages 20000 --json base.json
+  python benchmark.py --dialogs 4 --messages 20000 --compare base.json
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional
+
+from telethon.errors import FloodWaitError
+from telethon.tl import types
+from telethon.tl.functions.channels import GetForumTopicsRequest
+from telethon.utils import get_extension, get_peer_id
+
+from exporter import OUTPUT_FORMATS, check_output_format, message_to_dict, open_sink
+
+PAGE_SIZE = 100
+SENDERS = 37
+BASE_DATE = datetime(2020, 1, 1, tzinfo=timezone.utc)
+VOCABULARY = (
+    "hola curso metodo dinero telegram grupo canal video nuevo viejo rapido angel precio "
+    "enlace oferta pregunta respuesta gracias mañana semana clase tutorial archivo descarga "
+    "cuenta pago bono sesión página código ejemplo resultado prueba rendimiento memoria"
+).split()
+# Filtros que se miden en el visor: (etiqueta, texto, remitente, fecha, multimedia).
+VIEWER_FILTERS = (
+    ("texto", "cur", "", "", ""),
+    ("texto+", "curso", "", "", ""),
+    ("frase", '"hola viejo"', "", "", ""),
+    ("remitente", "", "17", "", ""),
+    ("fecha", "", "", "2020-01-1", ""),
+    ("rango", "", "", "2020-01-05..2020-01-20", ""),
+    ("multimedia", "", "", "", "nomedia"),
+    ("combinado", "video", "1", "2020", ""),
+)
+
+
+class BenchConfig(NamedTuple):
+    dialogs: int = 4
+    messages: int = 5000
+    topics: int = 4
+    topic_messages: int = 2000
+    text_words: int = 12
+    media_every: int = 10
+    media_size: int = 64 * 1024
+    large_every: int = 0
+    large_size: int = 40 * 1024 * 1024
+    latency: float = 0.0
+    download_latency: float = 0.0
+    flood_every: int = 0
+    flood_seconds: int = 1
+    output_format: str = "jsonl"
+    media_workers: int = 4
+    parallel: int = 1
+    viewer_messages: int = 100000
+
+
+def _text(chat: int, msg_id: int, words: int) -> str:
+    # Determinista y barato: el cliente falso no debe pesar en la medición.
+    if msg_id % 9 == 0:
+        return ""
+    size = len(VOCABULARY)
+    return " ".join(VOCABULARY[(msg_id * 7919 + i * 104729 + chat * 31) % size] for i in range(words))
+
+
+class FakeChannel:
+    """Entidad de un chat falso (`entity_type` en chat.json)."""
+
+    def __init__(self, channel_id: int, title: str) -> None:
+        self.id = get_peer_id(types.PeerChannel(channel_id))
+        self.channel_id = channel_id
+        self.title = title
+
+
+class FakeMessage:
+    """Mensaje con los atributos que lee `exporter.message_to_dict`."""
+
+    reply_to_msg_id = None
+    via_bot_id = None
+    views = None
+    forwards = None
+    reactions = None
+    fwd_from = None
+    action = None
+
+    def __init__(self, client: "FakeTelegramClient", channel: FakeChannel, msg_id: int) -> None:
+        config = client.config
+        self._client = client
+        self.id = msg_id
+        self.date = BASE_DATE + timedelta(minutes=msg_id)
+        self.message = _text(channel.channel_id, msg_id, config.text_words)
+        self.sender_id = 1000 + msg_id % SENDERS
+        # Como en Telethon, el remitente llega con la página de mensajes.
+        self.sender = client.senders[msg_id % SENDERS]
+        self.peer_id = types.PeerChannel(channel.channel_id)
+        self.media = None
+        if config.media_every and config.large_every and msg_id % (config.media_every * config.large_every) == 0:
+            # Vídeo grande: `chunked_download` lo pide por partes con `iter_download`.
+            document = types.Document(
+                id=channel.channel_id * 10**9 + msg_id,
+                access_hash=0,
+                file_reference=b"",
+                date=self.date,
+                mime_type="video/mp4",
+                size=config.large_size,
+                dc_id=1,
+                attributes=[types.DocumentAttributeFilename(file_name=f"video_{msg_id}.mp4")],
+            )
+            self.media = types.MessageMediaDocument(document=document)
+        elif config.media_every and msg_id % config.media_every == 0:
+            photo = types.Photo(
+                id=channel.channel_id * 10**9 + msg_id,
+                access_hash=0,
+                file_reference=b"",
+                date=self.date,
+                sizes=[],
+                dc_id=1,
+            )
+            self.media = types.MessageMediaPhoto(photo=photo)
+
+    @property
+    def client(self) -> "FakeTelegramClient":
+        return self._client
+
+    async def download_media(self, file) -> Optional[str]:
+        client = self._client
+        await client.request()
+        if client.config.download_latency:
+            await asyncio.sleep(client.config.download_latency)
+        if isinstance(self.media, types.MessageMediaDocument):
+            # Documento por debajo de `LARGE_FILE_SIZE` (p. ej. `--large-size` pequeño): de una vez.
+            document = self.media.document
+            path = Path(file) / f"doc_{document.id}{get_extension(self.media)}"
+            path.write_bytes(client.large_payload)
+        else:
+            path = Path(file) / f"photo_{self.media.photo.id}.jpg"
+            path.write_bytes(client.payload)
+        return str(path)
+
+
+class FakeTelegramClient:
+    """
+    Sustituto de `TelegramClient` con los métodos que usan los exportadores.
+
+    Cada página de `iter_messages` (100 mensajes, como Telethon), cada descarga
+    y cada `GetForumTopicsRequest` cuentan como una petición: esperan
+    `latency` segundos y una de cada `flood_every` recibe un FloodWait. Como
+    Telethon, los que no pasan de `flood_sleep_threshold` se esperan aquí
+    mismo y el resto lanza `FloodWaitError`.
+    """
+
+    def __init__(self, config: BenchConfig) -> None:
+        self.config = config
+        self.payload = os.urandom(config.media_size)
+        self.large_payload = os.urandom(config.large_size) if config.large_every else b""
+        self.channels = [FakeChannel(1000 + i, f"Chat {i}") for i in range(config.dialogs)]
+        self.senders = [
+            types.User(id=1000 + i, first_name=VOCABULARY[i % len(VOCABULARY)].title(), last_name=f"{i}")
+            for i in range(SENDERS)
+        ]
+        self.requests = 0
+        self.flood_waits = 0
+        self.flood_sleep_threshold = 60
+
+    async def request(self) -> None:
+        self.requests += 1
+        if self.config.flood_every and self.requests % self.config.flood_every == 0:
+            self.flood_waits += 1
+            if self.config.flood_seconds <= self.flood_sleep_threshold:
+                await asyncio.sleep(self.config.flood_seconds)
+            else:
+                raise FloodWaitError(request=None, capture=self.config.flood_seconds)
+        if self.config.latency:
+            await asyncio.sleep(self.config.latency)
+
+    async def connect(self) -> None:
+        pass
+
+    async def is_user_authorized(self) -> bool:
+        return True
+
+    async def disconnect(self) -> None:
+        pass
+
+    async def iter_dialogs(self):
+        for channel in self.channels:
+            # `message` es el último mensaje del chat: con él se estima cuánto falta.
+            top = SimpleNamespace(id=self.config.messages)
+            yield SimpleNamespace(id=channel.id, name=channel.title, entity=channel, message=top, is_channel=True)
+
+    async def get_entity(self, chat_id: int) -> FakeChannel:
+        return FakeChannel(abs(chat_id) % 10**12, f"Foro {chat_id}")
+
+    async def __call__(self, request):
+        if not isinstance(request, GetForumTopicsRequest):
+            raise NotImplementedError(type(request).__name__)
+        await self.request()
+        first = request.offset_topic + 1
+        last = min(self.config.topics, request.offset_topic + request.limit)
+        topics = [
+            SimpleNamespace(id=topic_id, title=f"Tema {topic_id}", total_messages=self.config.topic_messages)
+            for topic_id in range(first, last + 1)
+        ]
+        return SimpleNamespace(topics=topics, users=[], chats=[])
+
+    async def iter_download(self, file, offset=0, limit=None, request_size=512 * 1024, file_size=None):
+        # Cada trozo de `request_size` bytes cuenta como una petición, como en Telethon.
+        end = len(self.large_payload) if limit is None else min(len(self.large_payload), offset + limit * request_size)
+        while offset < end:
+            await self.request()
+            yield self.large_payload[offset : offset + request_size]
+            offset += request_size
+
+    async def iter_messages(
+        self, entity, limit=None, reverse=False, offset_id=0, reply_to=None, wait_time=None, **kwargs
+    ):
+        total = self.config.topic_messages if reply_to else self.config.messages
+        end = total if limit is None else min(total, offset_id + limit)
+        next_id = offset_id + 1
+        while next_id <= end:
+            # Como Telethon: `wait_time` segundos entre una página y la siguiente.
+            if wait_time and next_id > offset_id + 1:
+                await asyncio.sleep(wait_time)
+            await self.request()
+            page_end = min(end, next_id + PAGE_SIZE - 1)
+            for msg_id in range(next_id, page_end + 1):
+                yield FakeMessage(self, entity, msg_id)
+            next_id = page_end + 1
+
+
+@contextlib.contextmanager
+def fake_client(module, config: BenchConfig) -> Iterator[None]:
+    """Reemplaza `module.TelegramClient` por el cliente falso mientras dura el bloque."""
+    original = module.TelegramClient
+    module.TelegramClient = lambda *args, **kwargs: FakeTelegramClient(config)
+    try:
+        yield
+    finally:
+        module.TelegramClient = original
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Pico de memoria residente del proceso en MB (None si no se puede medir)."""
+    try:
+        import resource
+    except ImportError:  # Windows
+        try:
+            import psutil
+        except ImportError:
+            return None
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss) / 1e6
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux lo da en KB y macOS en bytes.
+    return peak / 1e6 if sys.platform == "darwin" else peak / 1e3
+
+
+def _tree_size(root: Path) -> int:
+    return sum(f.stat().st_size for f in root.rglob("*") if f.is_file())
+
+
+def _result(name: str, seconds: float, messages: int = 0, size: int = 0, **extra) -> Dict[str, Any]:
+    result = {
+        "name": name,
+        "seconds": round(seconds, 4),
+        "messages": messages,
+        "bytes": size,
+        "msgs_per_s": round(messages / seconds, 1) if messages and seconds else None,
+        "mb_per_s": round(size / 1e6 / seconds, 2) if size and seconds else None,
+    }
+    result.update(extra)
+    return result
+
+
+def bench_backup(config: BenchConfig, workdir: Path) -> List[Dict[str, Any]]:
+    import backup_telegram
+
+    out = workdir / "backup"
+    shutil.rmtree(out, ignore_errors=True)
+    with fake_client(backup_telegram, config), contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        asyncio.run(
+            backup_telegram.run_backup(
+                api_id=1,
+                api_hash="bench",
+                phone=None,
+                session_name="bench",
+                output_dir=out,
+                limit=None,
+                chats=None,
+                skip_media=not config.media_every,
+                media_workers=config.media_workers,
+                parallel_chats=config.parallel,
+                output_format=config.output_format,
+            )
+        )
+        elapsed = time.perf_counter() - start
+    summary = json.loads((out / "resumen.json").read_text(encoding="utf-8"))
+    messages = sum(info["messages"] for info in summary)
+    media = sum(info["media"] for info in summary)
+    return [_result("backup", elapsed, messages, _tree_size(out), media=media)]
+
+
+def bench_topics(config: BenchConfig, workdir: Path) -> List[Dict[str, Any]]:
+    import export_topics
+
+    out = workdir / "topics"
+    shutil.rmtree(out, ignore_errors=True)
+    # run() lee las credenciales del entorno; con valores ya puestos, .env no los pisa.
+    os.environ["TG_API_ID"] = "1"
+    os.environ["TG_API_HASH"] = "bench"
+    chat_id = -1001000000999
+    with fake_client(export_topics, config), contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        asyncio.run(
+            export_topics.run(
+                None,
+                chat_id,
+                out,
+                None,
+                not config.media_every,
+                "bench",
+                output_format=config.output_format,
+                parallel_topics=config.parallel,
+                media_workers=config.media_workers,
+            )
+        )
+        elapsed = time.perf_counter() - start
+    base_dir = out / export_topics.sanitize_name(str(chat_id))
+    summary = json.loads((base_dir / "resumen_topics.json").read_text(encoding="utf-8"))
+    messages = sum(info["messages"] for info in summary)
+    media = sum(info["media"] for info in summary)
+    return [_result("topics", elapsed, messages, _tree_size(out), media=media)]
+
+
+def write_viewer_chat(config: BenchConfig, chat_dir: Path) -> None:
+    """Genera un chat de `viewer_messages` mensajes en el formato elegido, sin multimedia."""
+    shutil.rmtree(chat_dir, ignore_errors=True)
+    chat_dir.mkdir(parents=True)
+    client = FakeTelegramClient(config._replace(media_every=0, media_size=0, large_every=0))
+    channel = FakeChannel(2000, "Visor")
+    (chat_dir / "chat.json").write_text(json.dumps({"id": channel.id, "title": channel.title}), encoding="utf-8")
+    if config.output_format == "sqlite":
+        from sqlite_store import SqliteStore
+
+        store = SqliteStore(chat_dir / "backup.sqlite")
+        (chat_dir / "chat.json").write_text(
+            json.dumps({"id": channel.id, "title": channel.title, "sqlite": "backup.sqlite"}), encoding="utf-8"
+        )
+        sink = open_sink(chat_dir, "sqlite", sqlite_store=store, chat_id=channel.id)
+    else:
+        store = None
+        sink = open_sink(chat_dir, config.output_format)
+    try:
+        for msg_id in range(1, config.viewer_messages + 1):
+            sink.write(message_to_dict(FakeMessage(client, channel, msg_id)))
+        sink.close()
+    finally:
+        if store is not None:
+            store.close()
+
+
+def bench_viewer(config: BenchConfig, workdir: Path) -> List[Dict[str, Any]]:
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PySide6.QtCore import QCoreApplication, QEventLoop
+
+    import viewer
+
+    chat_dir = workdir / "viewer" / "-1002000_Visor"
+    write_viewer_chat(config, chat_dir)
+    size = sum(f.stat().st_size for f in chat_dir.iterdir() if f.name.startswith(("messages.jsonl", "backup.sqlite")))
+    results = []
+
+    start = time.perf_counter()
+    rows = viewer.load_messages(chat_dir, False)
+    results.append(_result("viewer.load_messages", time.perf_counter() - start, config.viewer_messages, size))
+    del rows
+
+    app = QCoreApplication.instance() or QCoreApplication([])
+    start = time.perf_counter()
+    index = viewer.MessageIndex(chat_dir, False)
+    results.append(_result("viewer.open", time.perf_counter() - start, len(index), size))
+    if index.search is not None:
+        # Los filtros de texto cambian de camino cuando el índice FTS está listo: se
+        # espera a que lo esté para que las cifras no dependan del momento.
+        start = time.perf_counter()
+        while not index.search.ready:
+            time.sleep(0.01)
+        results.append(_result("viewer.fts_index", time.perf_counter() - start, len(index)))
+
+    model = viewer.MessageModel(index)
+    loop = QEventLoop()
+    model.filteringChanged.connect(lambda: None if model.filtering else loop.quit())
+    for label, *filters in VIEWER_FILTERS:
+        start = time.perf_counter()
+        model.applyFilters(*filters)
+        if model.filtering:
+            loop.exec()
+        results.append(_result(f"viewer.filter:{label}", time.perf_counter() - start, len(index), matches=model.filtered))
+        # Cada filtro parte de la lista completa, como al escribirlo desde cero.
+        model.applyFilters("", "", "", "")
+    index.close()
+    app.processEvents()
+    return results
+
+
+BENCHMARKS = {"backup": bench_backup, "topics": bench_topics, "viewer": bench_viewer}
+
+
+def _run_isolated(name: str, config: BenchConfig, workdir: str) -> List[Dict[str, Any]]:
+    results = BENCHMARKS[name](config, Path(workdir))
+    peak = peak_rss_mb()
+    for result in results:
+        result["peak_rss_mb"] = round(peak, 1) if peak is not None else None
+    return results
+
+
+def run_benchmarks(names: List[str], config: BenchConfig, workdir: Path) -> List[Dict[str, Any]]:
+    """Ejecuta cada prueba en un proceso nuevo para que el pico de RSS sea solo suyo."""
+    results = []
+    context = multiprocessing.get_context("spawn")
+    for name in names:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            results.extend(pool.submit(_run_isolated, name, config, str(workdir)).result())
+    return results
+
+
+def compare(results: List[Dict[str, Any]], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Pruebas que tardaron más de `tolerance` (fracción) que en la línea base."""
+    previous = {r["name"]: r for r in baseline.get("results", [])}
+    regressions = []
+    for result in results:
+        base = previous.get(result["name"])
+        if not base or not base.get("seconds"):
+            continue
+        # Menos de 5 ms de diferencia es ruido, sea cual sea el porcentaje.
+        if result["seconds"] > base["seconds"] * (1 + tolerance) and result["seconds"] - base["seconds"] > 0.005:
+            change = result["seconds"] / base["seconds"] - 1
+            regressions.append(f"{result['name']}: {base['seconds']:.3f}s -> {result['seconds']:.3f}s (+{change:.0%})")
+    return regressions
+
+
+def print_table(results: List[Dict[str, Any]]) -> None:
+    print(f"{'prueba':<24} {'segundos':>9} {'msgs/s':>11} {'MB/s':>8} {'RSS MB':>8}  extra")
+    for r in results:
+        extra = {k: v for k, v in r.items() if k in ("media", "matches")}
+        print(
+            f"{r['name']:<24} {r['seconds']:>9.3f} {r['msgs_per_s'] or '-':>11} {r['mb_per_s'] or '-':>8} "
+            f"{r['peak_rss_mb'] or '-':>8}  {' '.join(f'{k}={v}' for k, v in extra.items())}"
+        )
+
+
+def main() -> None:
+    defaults = BenchConfig()
+    parser = argparse.ArgumentParser(description="Mide exportadores y visor con un cliente de Telegram falso.")
+    parser.add_argument("benchmarks", nargs="*", metavar="PRUEBA", help=f"Pruebas a ejecutar: {', '.join(BENCHMARKS)} (por defecto: todas)")
+    parser.add_argument("--dialogs", type=int, default=defaults.dialogs, help="Chats del respaldo falso")
+    parser.add_argument("--messages", type=int, default=defaults.messages, help="Mensajes por chat")
+    parser.add_argument("--topics", type=int, default=defaults.topics, help="Temas del foro falso")
+    parser.add_argument("--topic-messages", type=int, default=defaults.topic_messages, help="Mensajes por tema")
+    parser.add_argument("--text-words", type=int, default=defaults.text_words, help="Palabras por mensaje")
+    parser.add_argument("--media-every", type=int, default=defaults.media_every, help="Un mensaje con foto cada N (0 = sin multimedia)")
+    parser.add_argument("--media-size", type=int, default=defaults.media_size, help="Bytes de cada archivo multimedia")
+    parser.add_argument("--large-every", type=int, default=defaults.large_every, help="Uno de cada N archivos multimedia es un vídeo grande (0 = ninguno)")
+    parser.add_argument("--large-size", type=int, default=defaults.large_size, help="Bytes de cada vídeo grande")
+    parser.add_argument("--latency", type=float, default=defaults.latency, help="Segundos de espera por petición simulada")
+    parser.add_argument("--download-latency", type=float, default=defaults.download_latency, help="Segundos extra por descarga")
+    parser.add_argument("--flood-every", type=int, default=defaults.flood_every, help="Una de cada N peticiones lanza FloodWait (0 = nunca)")
+    parser.add_argument("--flood-seconds", type=int, default=defaults.flood_seconds, help="Segundos que pide cada FloodWait")
+    parser.add_argument("--format", choices=OUTPUT_FORMATS, default=defaults.output_format, help="Formato de salida")
+    parser.add_argument("--media-workers", type=int, default=defaults.media_workers, help="Descargas simultáneas")
+    parser.add_argument("--parallel", type=int, default=defaults.parallel, help="Chats o temas exportados a la vez")
+    parser.add_argument("--viewer-messages", type=int, default=defaults.viewer_messages, help="Mensajes del chat que abre el visor")
+    parser.add_argument("--workdir", type=Path, default=None, help="Carpeta para los datos generados (por defecto: temporal)")
+    parser.add_argument("--json", type=Path, default=None, help="Guarda los resultados en este archivo")
+    parser.add_argument("--compare", type=Path, default=None, help="Resultados anteriores (--json) con los que comparar")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Margen antes de contar una regresión (por defecto: 0.10)")
+    args = parser.parse_args()
+
+    unknown = [name for name in args.benchmarks if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"pruebas desconocidas: {', '.join(unknown)}")
+    check_output_format(args.format)
+    config = BenchConfig(
+        dialogs=args.dialogs,
+        messages=args.messages,
+        topics=args.topics,
+        topic_messages=args.topic_messages,
+        text_words=args.text_words,
+        media_every=args.media_every,
+        media_size=args.media_size,
+        large_every=args.large_every,
+        large_size=args.large_size,
+        latency=args.latency,
+        download_latency=args.download_latency,
+        flood_every=args.flood_every,
+        flood_seconds=args.flood_seconds,
+        output_format=args.format,
+        media_workers=args.media_workers,
+        parallel=args.parallel,
+        viewer_messages=args.viewer_messages,
+    )
+    names = args.benchmarks or list(BENCHMARKS)
+    if args.workdir is not None:
+        args.workdir.mkdir(parents=True, exist_ok=True)
+        results = run_benchmarks(names, config, args.workdir)
+    else:
+        with tempfile.TemporaryDirectory(prefix="tg_bench_") as tmp:
+            results = run_benchmarks(names, config, Path(tmp))
+    print_table(results)
+
+    report = {
+        "config": config._asdict(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+    if args.json is not None:
+        args.json.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    if args.compare is not None:
+        baseline = json.loads(args.compare.read_text(encoding="utf-8"))
+        if baseline.get("config") != report["config"]:
+            print("Aviso: la línea base se midió con otros parámetros.")
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("Regresiones:")
+            for line in regressions:
+                print(f"  {line}")
+            raise SystemExit(1)
+        print("Sin regresiones respecto a la línea base.")
+
+
+if __name__ == "__main__":
+    main()
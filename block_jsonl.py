@@ -0,0 +1,274 @@
+"""
+JSONL comprimido en bloques independientes.
+
+`messages.jsonl.gz` (o `.zst`) es una concatenación de bloques comprimidos por
+separado: el archivo completo sigue siendo un gzip/zstd válido (`zcat` lo lee
+entero), pero cada bloque se puede descomprimir por sí solo. Junto a él,
+`messages.jsonl.gz.idx` guarda una línea JSON por bloque con su posición,
+tamaño, número de mensajes y rango de ids y fechas, así que para llegar a un
+mensaje o a una fecha solo hay que descomprimir su bloque.
+
+zstd necesita el paquete opcional `zstandard`; gzip funciona siempre.
+"""
+import gzip
+import json
+import os
+import time
+from bisect import bisect_left
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+from jsonl_writer import FSYNC_POLICIES, dumps_record
+
+try:
+    import zstandard
+except ImportError:  # dependencia opcional
+    zstandard = None
+
+CODECS = {"gzip": ".gz", "zstd": ".zst"}
+INDEX_SUFFIX = ".idx"
+
+DEFAULT_BLOCK_RECORDS = 2000
+DEFAULT_BLOCK_BYTES = 4 * 1024 * 1024
+DEFAULT_MAX_DELAY = 30.0
+
+
+def block_path(folder: Path, codec: str) -> Path:
+    return Path(folder) / f"messages.jsonl{CODECS[codec]}"
+
+
+def index_path(path: Path) -> Path:
+    return path.with_name(path.name + INDEX_SUFFIX)
+
+
+def find_block_file(folder: Path) -> Optional[Path]:
+    """`messages.jsonl.gz` o `.zst` de una carpeta, si existe alguno."""
+    for codec in CODECS:
+        path = block_path(folder, codec)
+        if path.exists():
+            return path
+    return None
+
+
+def codec_for(path: Path) -> str:
+    for codec, suffix in CODECS.items():
+        if path.name.endswith(suffix):
+            return codec
+    raise ValueError(f"No es un JSONL comprimido por bloques: {path}")
+
+
+def check_codec(codec: str) -> None:
+    if codec not in CODECS:
+        raise ValueError(f"Compresión desconocida: {codec!r} (usa {', '.join(CODECS)})")
+    if codec == "zstd" and zstandard is None:
+        raise RuntimeError("La compresión zstd necesita el paquete zstandard (pip install zstandard)")
+
+
+def _compress(codec: str, data: bytes) -> bytes:
+    if codec == "zstd":
+        return zstandard.ZstdCompressor().compress(data)
+    # mtime=0: el mismo bloque produce siempre los mismos bytes.
+    return gzip.compress(data, compresslevel=6, mtime=0)
+
+
+def _decompress(codec: str, data: bytes) -> bytes:
+    if codec == "zstd":
+        check_codec(codec)
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+
+def load_index(path: Path) -> List[Dict[str, Any]]:
+    """
+    Entradas del índice cuyo bloque está completo en el archivo de datos.
+
+    Una línea a medio escribir o un bloque truncado (corte durante la
+    escritura) se ignoran.
+    """
+    idx = index_path(path)
+    if not idx.exists():
+        return []
+    size = path.stat().st_size if path.exists() else 0
+    blocks: List[Dict[str, Any]] = []
+    with idx.open("rb") as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                break
+            if entry["offset"] + entry["length"] > size:
+                break
+            blocks.append(entry)
+    return blocks
+
+
+class BlockJsonlWriter:
+    """
+    Misma interfaz que `JsonlWriter` (write/flush/close), pero cada vaciado del
+    búfer se escribe como un bloque comprimido y se anota en el índice.
+
+    Al abrir un archivo existente se recorta lo que quedara tras el último
+    bloque indexado, así que un corte no deja bloques huérfanos.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        codec: str = "gzip",
+        max_records: int = DEFAULT_BLOCK_RECORDS,
+        max_bytes: int = DEFAULT_BLOCK_BYTES,
+        max_delay: float = DEFAULT_MAX_DELAY,
+        fsync: str = "none",
+    ) -> None:
+        check_codec(codec)
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Política fsync desconocida: {fsync!r} (usa {', '.join(FSYNC_POLICIES)})")
+        self.path = Path(path)
+        self.codec = codec
+        self.max_records = max(1, max_records)
+        self.max_bytes = max(1, max_bytes)
+        self.max_delay = max_delay
+        self.fsync = fsync
+        # Primer y último registro del bloque en curso, para el índice.
+        self._first: Optional[Dict[str, Any]] = None
+        self._last: Optional[Dict[str, Any]] = None
+        self._buffer: List[str] = []
+        self._buffered_bytes = 0
+        self._last_flush = time.monotonic()
+        self._file = None
+        self._index = None
+        self.written = 0
+
+    def _open(self) -> None:
+        blocks = load_index(self.path)
+        end = blocks[-1]["offset"] + blocks[-1]["length"] if blocks else 0
+        self._file = self.path.open("ab")
+        self._file.truncate(end)
+        self._file.seek(end)
+        # Se reescribe el índice sin la posible línea incompleta del final.
+        idx = index_path(self.path)
+        tmp = idx.with_name(idx.name + ".tmp")
+        tmp.write_text("".join(json.dumps(b) + "\n" for b in blocks), encoding="utf-8")
+        os.replace(tmp, idx)
+        self._index = idx.open("a", encoding="utf-8")
+
+    def write(self, payload: Dict[str, Any]) -> None:
+        line = dumps_record(payload) + "\n"
+        if self._first is None:
+            self._first = payload
+        self._last = payload
+        self._buffer.append(line)
+        self._buffered_bytes += len(line)
+        if (
+            len(self._buffer) >= self.max_records
+            or self._buffered_bytes >= self.max_bytes
+            or time.monotonic() - self._last_flush >= self.max_delay
+        ):
+            self.flush()
+
+    def flush(self) -> None:
+        """Comprime lo acumulado como un bloque nuevo y lo añade al índice."""
+        self._last_flush = time.monotonic()
+        if not self._buffer:
+            return
+        if self._file is None:
+            self._open()
+        data = _compress(self.codec, "".join(self._buffer).encode("utf-8"))
+        offset = self._file.tell()
+        self._file.write(data)
+        self._file.flush()
+        if self.fsync == "flush":
+            os.fsync(self._file.fileno())
+        first, last = self._first, self._last
+        entry = {
+            "offset": offset,
+            "length": len(data),
+            "lines": len(self._buffer),
+            "first_id": first.get("id"),
+            "last_id": last.get("id"),
+            "first_date": first.get("date"),
+            "last_date": last.get("date"),
+        }
+        # El bloque va antes que su entrada: el índice nunca apunta a datos que faltan.
+        self._index.write(json.dumps(entry) + "\n")
+        self._index.flush()
+        if self.fsync == "flush":
+            os.fsync(self._index.fileno())
+        self.written += len(self._buffer)
+        self._first = self._last = None
+        self._buffer.clear()
+        self._buffered_bytes = 0
+
+    def close(self) -> None:
+        try:
+            self.flush()
+            if self._file is not None and self.fsync == "close":
+                os.fsync(self._file.fileno())
+                os.fsync(self._index.fileno())
+        finally:
+            if self._file is not None:
+                self._file.close()
+                self._index.close()
+                self._file = None
+                self._index = None
+
+    def __enter__(self) -> "BlockJsonlWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> Optional[bool]:
+        self.close()
+        return None
+
+
+class BlockJsonlReader:
+    """Lectura por bloques de un JSONL comprimido con su índice."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+        self.codec = codec_for(self.path)
+        self.blocks = load_index(self.path)
+        self._file = None
+
+    def __len__(self) -> int:
+        return sum(block["lines"] for block in self.blocks)
+
+    def read_block(self, block_no: int) -> List[bytes]:
+        """Líneas (sin decodificar) del bloque `block_no`."""
+        block = self.blocks[block_no]
+        if self._file is None:
+            self._file = self.path.open("rb")
+        self._file.seek(block["offset"])
+        return _decompress(self.codec, self._file.read(block["length"])).splitlines()
+
+    def iter_lines(self) -> Iterator[bytes]:
+        for block_no in range(len(self.blocks)):
+            yield from self.read_block(block_no)
+
+    def block_for_date(self, date: str) -> int:
+        """Primer bloque que puede contener mensajes de `date` (prefijo ISO) o posteriores."""
+        last_dates = [block.get("last_date") or "" for block in self.blocks]
+        return min(bisect_left(last_dates, date), max(len(self.blocks) - 1, 0))
+
+    def last_id(self) -> int:
+        return int(self.blocks[-1].get("last_id") or 0) if self.blocks else 0
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def iter_jsonl_lines(path: Path) -> Iterator[bytes]:
+    """Líneas de un `messages.jsonl`, comprimido por bloques o no."""
+    path = Path(path)
+    if path.suffix in CODECS.values():
+        reader = BlockJsonlReader(path)
+        try:
+            yield from reader.iter_lines()
+        finally:
+            reader.close()
+    else:
+        with path.open("rb") as f:
+            yield from f
@@ -0,0 +1,298 @@
+#!/usr/bin/env python
+"""
+Catálogo de chats de una carpeta de respaldo (`catalog.json`).
+
+Guarda, por cada chat o tema exportado, su título, número de mensajes, rango
+de fechas y si tiene multimedia, junto con las fechas de modificación con las
+que se calculó. Los exportadores lo actualizan al terminar y el visor lo lee
+para mostrar la lista de chats sin recorrer todo el respaldo; al refrescar solo
+se vuelven a medir los chats cuyo archivo o carpeta cambió.
+
+  python catalog.py "C:\\Users\\Administrador\\Desktop\\TelegramBackups"
+"""
+import argparse
+import json
+import os
+import sqlite3
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+from block_jsonl import BlockJsonlReader, find_block_file
+
+CATALOG_NAME = "catalog.json"
+CATALOG_VERSION = 1
+COUNT_CHUNK = 1024 * 1024
+TAIL_CHUNK = 64 * 1024
+
+
+def catalog_path(root: Path) -> Path:
+    return Path(root) / CATALOG_NAME
+
+
+def _read_json(path: Path) -> Dict[str, Any]:
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def _chat_meta(chat_dir: Path) -> Dict[str, Any]:
+    meta = _read_json(chat_dir / "chat.json")
+    return meta or _read_json(chat_dir / "topic.json")
+
+
+def _mtime(path: Path) -> float:
+    try:
+        return path.stat().st_mtime
+    except OSError:
+        return 0.0
+
+
+def _db_mtime(db_path: Path) -> float:
+    # En modo WAL los cambios recientes solo tocan el archivo -wal.
+    return max(_mtime(db_path), _mtime(db_path.with_name(db_path.name + "-wal")))
+
+
+def _count_lines(path: Path, start: int = 0) -> int:
+    count = 0
+    with path.open("rb") as f:
+        f.seek(start)
+        for chunk in iter(lambda: f.read(COUNT_CHUNK), b""):
+            count += chunk.count(b"\n")
+    return count
+
+
+def _line_date(line: bytes) -> Optional[str]:
+    try:
+        return json.loads(line).get("date")
+    except (ValueError, AttributeError):
+        return None
+
+
+def _first_date(path: Path) -> Optional[str]:
+    with path.open("rb") as f:
+        return _line_date(f.readline())
+
+
+def _last_date(path: Path) -> Optional[str]:
+    with path.open("rb") as f:
+        end = f.seek(0, os.SEEK_END)
+        tail = b""
+        pos = end
+        while pos > 0 and tail.count(b"\n") < 2:
+            step = min(TAIL_CHUNK, pos)
+            pos -= step
+            f.seek(pos)
+            tail = f.read(step) + tail
+    for line in reversed(tail.splitlines()):
+        date = _line_date(line)
+        if date:
+            return date
+    return None
+
+
+def has_local_media(chat_dir: Path, meta: Optional[Dict[str, Any]] = None) -> bool:
+    """True si `media/` tiene al menos un archivo o el chat usa el almacén compartido."""
+    try:
+        with os.scandir(chat_dir / "media") as it:
+            if next(it, None) is not None:
+                return True
+    except OSError:
+        pass
+    if meta is None:
+        meta = _chat_meta(chat_dir)
+    return bool(meta.get("media_store"))
+
+
+def describe_chat(chat_dir: Path, previous: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+    """
+    Entrada del catálogo para un chat o tema, o None si no tiene mensajes.
+
+    Con `previous` y un `messages.jsonl` que solo creció, se cuentan únicamente
+    las líneas nuevas.
+    """
+    meta = _chat_meta(chat_dir)
+    entry: Dict[str, Any] = {
+        "title": meta.get("title") or chat_dir.name,
+        "dir_mtime": _mtime(chat_dir),
+    }
+    messages_path = chat_dir / "messages.jsonl"
+    block_file = find_block_file(chat_dir)
+    if messages_path.exists():
+        stat = messages_path.stat()
+        entry["messages_size"] = stat.st_size
+        entry["messages_mtime"] = stat.st_mtime
+        prev_size = (previous or {}).get("messages_size")
+        if previous and "compressed" not in previous and prev_size is not None and prev_size <= stat.st_size:
+            entry["messages"] = previous.get("messages", 0) + _count_lines(messages_path, prev_size)
+            entry["first_date"] = previous.get("first_date") or _first_date(messages_path)
+        else:
+            entry["messages"] = _count_lines(messages_path)
+            entry["first_date"] = _first_date(messages_path)
+        entry["last_date"] = _last_date(messages_path) if stat.st_size else None
+    elif block_file is not None:
+        # JSONL comprimido: conteo y fechas salen del índice de bloques, sin descomprimir.
+        stat = block_file.stat()
+        reader = BlockJsonlReader(block_file)
+        blocks = reader.blocks
+        entry["compressed"] = block_file.name
+        entry["messages_size"] = stat.st_size
+        entry["messages_mtime"] = stat.st_mtime
+        entry["messages"] = len(reader)
+        entry["first_date"] = blocks[0].get("first_date") if blocks else None
+        entry["last_date"] = blocks[-1].get("last_date") if blocks else None
+    elif meta.get("sqlite"):
+        db_path = chat_dir / meta["sqlite"]
+        chat_id = meta.get("chat_id", meta.get("id"))
+        topic_id = meta.get("topic_id", 0) if "chat_id" in meta else 0
+        entry["sqlite"] = meta["sqlite"]
+        entry["messages_mtime"] = _db_mtime(db_path)
+        conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+        try:
+            count, first, last = conn.execute(
+                "SELECT COUNT(*), MIN(date), MAX(date) FROM messages WHERE chat_id = ? AND topic_id = ?",
+                (chat_id, topic_id),
+            ).fetchone()
+        finally:
+            conn.close()
+        entry.update(messages=count, first_date=first, last_date=last)
+    else:
+        return None
+    entry["has_media"] = has_local_media(chat_dir, meta)
+    return entry
+
+
+def _is_current(entry: Dict[str, Any], chat_dir: Path) -> bool:
+    if entry.get("dir_mtime") != _mtime(chat_dir):
+        return False
+    messages_path = chat_dir / entry.get("compressed", "messages.jsonl")
+    if "messages_size" in entry:
+        try:
+            stat = messages_path.stat()
+        except OSError:
+            return False
+        return stat.st_size == entry["messages_size"] and stat.st_mtime == entry["messages_mtime"]
+    if "sqlite" in entry:
+        return _db_mtime(chat_dir / entry["sqlite"]) == entry["messages_mtime"]
+    return False
+
+
+def load_catalog(root: Path) -> Dict[str, Any]:
+    data = _read_json(catalog_path(root))
+    if data.get("version") != CATALOG_VERSION:
+        return {"version": CATALOG_VERSION, "chats": {}, "folder_mtimes": {}}
+    return data
+
+
+def save_catalog(root: Path, catalog: Dict[str, Any]) -> None:
+    path = catalog_path(root)
+    tmp = path.with_suffix(".json.tmp")
+    tmp.write_text(json.dumps(catalog, ensure_ascii=False, indent=2), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def _refresh_entry(root: Path, chats: Dict[str, Any], rel: str, parent: Optional[str]) -> bool:
+    chat_dir = root / rel
+    old = chats.get(rel)
+    if old is not None and _is_current(old, chat_dir):
+        return False
+    try:
+        entry = describe_chat(chat_dir, old)
+    except (OSError, sqlite3.Error) as e:
+        print(f"catalog: no se pudo leer {chat_dir}: {e}")
+        entry = None
+    if entry is None:
+        return chats.pop(rel, None) is not None
+    if parent is not None:
+        entry["parent"] = parent
+    chats[rel] = entry
+    return True
+
+
+def refresh_catalog(root: Path, chat_dirs: Optional[Iterable[Path]] = None, save: bool = True) -> Dict[str, Any]:
+    """
+    Pone al día el catálogo de `root` y lo guarda si algo cambió.
+
+    Sin `chat_dirs` revisa todo el respaldo, pero solo busca temas en las
+    carpetas cuya fecha de modificación cambió y solo mide los chats cuyos
+    mensajes cambiaron; con `chat_dirs` (lo que acaba de exportar un proceso)
+    solo actualiza esas entradas.
+    """
+    root = Path(root)
+    catalog = load_catalog(root)
+    chats: Dict[str, Any] = catalog["chats"]
+    changed = False
+
+    if chat_dirs is not None:
+        for chat_dir in chat_dirs:
+            rel = Path(chat_dir).relative_to(root).as_posix()
+            parent = rel.rsplit("/", 1)[0] if "/" in rel else None
+            changed |= _refresh_entry(root, chats, rel, parent)
+    else:
+        # Listar la raíz es barato; lo caro (temas y conteos) solo se repite si cambió.
+        top = {d.name for d in root.iterdir() if d.is_dir()}
+        known_topics: Dict[str, List[str]] = {}
+        for rel in chats:
+            if "/" in rel:
+                known_topics.setdefault(rel.split("/", 1)[0], []).append(rel)
+        folder_mtimes: Dict[str, float] = catalog.setdefault("folder_mtimes", {})
+        for name in sorted(top):
+            folder = root / name
+            if not folder.is_dir():
+                continue
+            changed |= _refresh_entry(root, chats, name, None)
+            mtime = _mtime(folder)
+            if folder_mtimes.get(name) != mtime:
+                topics = [f"{name}/{sub.name}" for sub in folder.glob("topic_*") if sub.is_dir()]
+                folder_mtimes[name] = mtime
+                changed = True
+            else:
+                topics = known_topics.get(name, [])
+            for rel in topics:
+                changed |= _refresh_entry(root, chats, rel, name)
+        for rel in [rel for rel in chats if rel.split("/", 1)[0] not in top]:
+            del chats[rel]
+            changed = True
+        for name in [name for name in folder_mtimes if name not in top]:
+            del folder_mtimes[name]
+            changed = True
+
+    if changed and save:
+        try:
+            save_catalog(root, catalog)
+        except OSError as e:
+            print(f"catalog: no se pudo guardar {catalog_path(root)}: {e}")
+    return catalog
+
+
+def catalog_chats(root: Path, catalog: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Lista de chats del catálogo para el visor, con la ruta absoluta."""
+    chats = []
+    for rel, entry in sorted(catalog.get("chats", {}).items()):
+        parent = entry.get("parent")
+        title = f"{parent} / {Path(rel).name}" if parent else Path(rel).name
+        chats.append(
+            {
+                "title": title,
+                "path": str(Path(root) / rel),
+                "messages": entry.get("messages", 0),
+                "first_date": entry.get("first_date"),
+                "last_date": entry.get("last_date"),
+                "has_media": entry.get("has_media", False),
+            }
+        )
+    return chats
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Genera o actualiza el catálogo de chats de un respaldo.")
+    parser.add_argument("root", type=Path, help="Carpeta base del respaldo (TelegramBackups o TelegramBackupsTopics)")
+    args = parser.parse_args()
+    root = args.root.expanduser()
+    catalog = refresh_catalog(root)
+    total = sum(entry.get("messages", 0) for entry in catalog["chats"].values())
+    print(f"Catálogo: {len(catalog['chats'])} chats, {total} mensajes ({catalog_path(root)})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+Descarga por partes, en paralelo y reanudable, de los archivos grandes.
+
+`msg.download_media` baja cada archivo de un tirón y, si se corta, la siguiente
+ejecución empieza de cero. Los documentos de al menos `LARGE_FILE_SIZE` bytes
+se piden en su lugar con `client.iter_download` y desplazamientos: el archivo
+se divide en partes de `PART_SIZE` que se bajan de `PARALLEL_PARTS` en
+`PARALLEL_PARTS` a `<id>.part`, y el progreso de cada parte se anota en
+`<id>.part.json`. Al reanudar solo se piden los trozos que faltan, y el archivo
+recibe su nombre definitivo únicamente si su tamaño coincide con el que
+anuncia Telegram.
+"""
+import asyncio
+import json
+import os
+from pathlib import Path
+from typing import Dict, Optional
+
+from telethon import utils
+from telethon.tl import types
+
+# Máximo que Telegram entrega por petición; las partes son múltiplos de él.
+REQUEST_SIZE = 512 * 1024
+PART_SIZE = 16 * REQUEST_SIZE
+LARGE_FILE_SIZE = 4 * PART_SIZE
+PARALLEL_PARTS = 4
+
+# Descargas en curso por `.part`: el mismo documento dos veces en una carpeta
+# (p. ej. reenviado dentro del chat) se baja una sola vez.
+_inflight: Dict[Path, asyncio.Future] = {}
+
+
+def large_document(msg) -> Optional[types.Document]:
+    """Documento de `msg` si es lo bastante grande para bajarlo por partes."""
+    document = getattr(getattr(msg, "media", None), "document", None)
+    if isinstance(document, types.Document) and document.size >= LARGE_FILE_SIZE:
+        return document
+    return None
+
+
+def document_filename(document: types.Document) -> str:
+    for attr in document.attributes:
+        if isinstance(attr, types.DocumentAttributeFilename) and Path(attr.file_name).name:
+            return Path(attr.file_name).name
+    return f"document_{document.id}{utils.get_extension(document)}"
+
+
+def free_path(directory: Path, name: str) -> Path:
+    """`directory/name`, o `name (1)`, `name (2)`... si ya existe (como Telethon)."""
+    path = directory / name
+    counter = 1
+    while path.exists():
+        path = directory / f"{Path(name).stem} ({counter}){Path(name).suffix}"
+        counter += 1
+    return path
+
+
+def _load_progress(progress_path: Path, document: types.Document) -> Dict[int, int]:
+    """Bytes ya escritos de cada parte (vacío si no hay progreso válido)."""
+    try:
+        data = json.loads(progress_path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    if data.get("size") != document.size or data.get("part_size") != PART_SIZE:
+        return {}
+    return {int(index): written for index, written in data.get("done", {}).items()}
+
+
+def _save_progress(progress_path: Path, document: types.Document, done: Dict[int, int]) -> None:
+    tmp_path = progress_path.with_name(progress_path.name + ".tmp")
+    data = {"id": document.id, "size": document.size, "part_size": PART_SIZE, "done": done}
+    tmp_path.write_text(json.dumps(data), encoding="utf-8")
+    os.replace(tmp_path, progress_path)
+
+
+async def download_large(
+    client, msg, document: types.Document, target: Path, parallel_parts: int = PARALLEL_PARTS
+) -> str:
+    """
+    Descarga `document` en la carpeta `target` por partes y devuelve su ruta.
+
+    Si se interrumpe (error, FloodWait o cancelación) deja el `.part` y su
+    progreso para continuar en el siguiente intento.
+    """
+    target.mkdir(parents=True, exist_ok=True)
+    part_path = target / f"{document.id}.part"
+    if part_path in _inflight:
+        return await asyncio.shield(_inflight[part_path])
+    fut = asyncio.get_running_loop().create_future()
+    _inflight[part_path] = fut
+    try:
+        path = await _download_parts(client, msg, document, part_path, parallel_parts)
+    except BaseException as e:
+        fut.set_exception(e)
+        # Evita el aviso de "excepción nunca recuperada" si nadie esperaba.
+        fut.exception()
+        raise
+    else:
+        fut.set_result(path)
+    finally:
+        del _inflight[part_path]
+    return path
+
+
+async def _download_parts(client, msg, document: types.Document, part_path: Path, parallel_parts: int) -> str:
+    size = document.size
+    target = part_path.parent
+    progress_path = part_path.with_name(part_path.name + ".json")
+    done = _load_progress(progress_path, document) if part_path.exists() else {}
+    slots = asyncio.Semaphore(max(1, parallel_parts))
+
+    def part_length(index: int) -> int:
+        return min(PART_SIZE, size - index * PART_SIZE)
+
+    with part_path.open("r+b" if done else "wb") as f:
+
+        async def fetch_part(index: int) -> None:
+            async with slots:
+                start = index * PART_SIZE
+                length = part_length(index)
+                written = done.get(index, 0)
+                requests = -(-(length - written) // REQUEST_SIZE)
+                async for chunk in client.iter_download(
+                    msg.media, offset=start + written, limit=requests, request_size=REQUEST_SIZE, file_size=size
+                ):
+                    chunk = chunk[: length - written]
+                    # Sin `await` entre seek y write: las partes no se pisan.
+                    f.seek(start + written)
+                    f.write(chunk)
+                    written += len(chunk)
+                    done[index] = written
+                f.flush()
+                _save_progress(progress_path, document, done)
+
+        parts = -(-size // PART_SIZE)
+        tasks = [
+            asyncio.create_task(fetch_part(index))
+            for index in range(parts)
+            if done.get(index, 0) < part_length(index)
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            f.flush()
+            _save_progress(progress_path, document, done)
+
+    received = sum(done.values())
+    if received != size or part_path.stat().st_size != size:
+        part_path.unlink()
+        progress_path.unlink()
+        raise RuntimeError(f"Descarga incompleta del documento {document.id}: {received} de {size} bytes")
+    # Sin `await` entre elegir el nombre y renombrar: dos descargas no eligen el mismo.
+    final_path = free_path(target, document_filename(document))
+    os.replace(part_path, final_path)
+    progress_path.unlink()
+    return str(final_path)
+
+
+async def download_media(msg, target: Path) -> Optional[str]:
+    """Descarga la multimedia de `msg` en la carpeta `target`, por partes si es grande."""
+    document = large_document(msg)
+    if document is None:
+        return await msg.download_media(file=target)
+    return await download_large(msg.client, msg, document, target)
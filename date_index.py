@@ -0,0 +1,182 @@
+"""
+Índice de fechas de un chat para el visor (`date_index.json`).
+
+Los mensajes se exportan en orden cronológico, así que los de cada día ocupan
+filas consecutivas. `DateIndex` guarda por cada día su primera fila y cuántos
+mensajes tiene: con eso el visor salta a una fecha o acota un rango de fechas
+con una búsqueda binaria, sin recorrer el chat, y dibuja el histograma de la
+línea de tiempo. Se calcula una vez y se guarda junto al chat, con una firma de
+la fuente de mensajes para saber cuándo hay que recalcularlo.
+"""
+import json
+import os
+from array import array
+from bisect import bisect_left
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+DATE_INDEX_NAME = "date_index.json"
+DATE_INDEX_VERSION = 1
+DAY_WIDTH = 10
+RANGE_SEPARATOR = ".."
+# Mayor que cualquier carácter de una fecha ISO: `p + DATE_MAX` acota las que empiezan por `p`.
+DATE_MAX = "\uffff"
+TIMELINE_BARS = 120
+
+# (desde, hasta): fechas ISO `desde <= fecha < hasta`; hasta=None es sin límite.
+DateBounds = Tuple[str, Optional[str]]
+
+
+def date_bounds(date_filter: str) -> DateBounds:
+    """
+    Límites de un filtro de fecha: un prefijo ISO (`2021`, `2021-03`,
+    `2021-03-15`) o un rango `desde..hasta` con ambos extremos incluidos
+    (`2021-03..2021-06-15`); un extremo vacío no limita.
+    """
+    date_filter = date_filter.strip()
+    if RANGE_SEPARATOR in date_filter:
+        start, end = (part.strip() for part in date_filter.split(RANGE_SEPARATOR, 1))
+    else:
+        start = end = date_filter
+    return start, (end + DATE_MAX if end else None)
+
+
+def bounds_within(inner: DateBounds, outer: DateBounds) -> bool:
+    """Si toda fecha dentro de `inner` está también dentro de `outer`."""
+    if inner[0] < outer[0]:
+        return False
+    return outer[1] is None or (inner[1] is not None and inner[1] <= outer[1])
+
+
+def in_bounds(value: str, bounds: DateBounds) -> bool:
+    start, end = bounds
+    return bool(value) and start <= value and (end is None or value < end)
+
+
+def _periods(first: str, last: str, width: int) -> List[str]:
+    """Días, meses o años (según `width`) seguidos de `first` a `last`, ambos incluidos."""
+    if width == 4:
+        return [str(year) for year in range(int(first), int(last) + 1)]
+    if width == 7:
+        year, month = int(first[:4]), int(first[5:7])
+        periods = []
+        while True:
+            period = f"{year:04d}-{month:02d}"
+            periods.append(period)
+            if period >= last:
+                return periods
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    day, end = date.fromisoformat(first), date.fromisoformat(last)
+    return [(day + timedelta(days=n)).isoformat() for n in range((end - day).days + 1)]
+
+
+class DateIndex:
+    """
+    Días de un chat (`days`, ordenados) con la primera fila (`first_rows`) y el
+    número de mensajes (`counts`) de cada uno. `ordered` indica que los días
+    aparecen en orden en las filas, cada uno en un tramo seguido; si no, solo
+    sirven los conteos.
+    """
+
+    def __init__(
+        self, days: List[str], first_rows: Sequence[int], counts: Sequence[int], rows: int, ordered: bool
+    ) -> None:
+        self.days = days
+        self.first_rows = array("L", first_rows)
+        self.counts = array("L", counts)
+        self.rows = rows
+        self.ordered = ordered
+
+    @classmethod
+    def from_days(cls, days: Iterable[str]) -> "DateIndex":
+        """Índice a partir del día (`YYYY-MM-DD`, o vacío si no tiene) de cada fila, en orden."""
+        first_rows: Dict[str, int] = {}
+        counts: Dict[str, int] = {}
+        ordered = True
+        previous = ""
+        rows = 0
+        for row_no, day in enumerate(days):
+            rows += 1
+            if not day:
+                # Fila sin fecha: los rangos ya no pueden tomarse como tramos seguidos.
+                ordered = False
+                continue
+            if day not in counts:
+                first_rows[day] = row_no
+                counts[day] = 0
+                if day < previous:
+                    ordered = False
+                previous = day
+            elif day != previous:
+                ordered = False
+            counts[day] += 1
+        sorted_days = sorted(counts)
+        return cls(
+            sorted_days, [first_rows[day] for day in sorted_days], [counts[day] for day in sorted_days], rows, ordered
+        )
+
+    def _row_at(self, position: int) -> int:
+        return self.first_rows[position] if position < len(self.days) else self.rows
+
+    def row_range(self, bounds: DateBounds) -> Optional[Tuple[int, int]]:
+        """
+        Tramo de filas `[inicio, fin)` de los días que tocan `bounds` (None si
+        el índice no está ordenado). Si los límites no son más finos que un día,
+        todas las filas del tramo los cumplen.
+        """
+        if not self.ordered:
+            return None
+        start, end = bounds
+        first = bisect_left(self.days, start[:DAY_WIDTH])
+        last = len(self.days) if end is None else bisect_left(self.days, end)
+        if last <= first:
+            return self._row_at(first), self._row_at(first)
+        return self._row_at(first), self._row_at(last)
+
+    def timeline(self, max_bars: int = TIMELINE_BARS) -> List[Dict[str, Any]]:
+        """
+        Mensajes por día, mes o año (lo más fino que quepa en `max_bars`
+        barras), incluidos los periodos vacíos: `[{"period", "count"}, ...]`.
+        """
+        days = [day for day in self.days if len(day) == DAY_WIDTH and day[:4].isdigit()]
+        if not days:
+            return []
+        for width in (DAY_WIDTH, 7, 4):
+            try:
+                periods = _periods(days[0][:width], days[-1][:width], width)
+            except ValueError:
+                continue
+            if len(periods) <= max_bars or width == 4:
+                break
+        counts = dict.fromkeys(periods, 0)
+        for day, count in zip(self.days, self.counts):
+            if day[:width] in counts:
+                counts[day[:width]] += count
+        return [{"period": period, "count": count} for period, count in counts.items()]
+
+    @classmethod
+    def load(cls, path: Path, signature: List[int]) -> Optional["DateIndex"]:
+        """Índice guardado en `path` si corresponde a la fuente con `signature`."""
+        try:
+            data = json.loads(Path(path).read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        if data.get("version") != DATE_INDEX_VERSION or data.get("signature") != signature:
+            return None
+        return cls(data["days"], data["first_rows"], data["counts"], data["rows"], data["ordered"])
+
+    def save(self, path: Path, signature: List[int]) -> None:
+        path = Path(path)
+        data = {
+            "version": DATE_INDEX_VERSION,
+            "signature": signature,
+            "rows": self.rows,
+            "ordered": self.ordered,
+            "days": self.days,
+            "first_rows": self.first_rows.tolist(),
+            "counts": self.counts.tolist(),
+        }
+        tmp_path = path.with_name(path.name + ".tmp")
+        tmp_path.write_text(json.dumps(data), encoding="utf-8")
+        os.replace(tmp_path, path)
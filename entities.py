@@ -0,0 +1,114 @@
+"""
+Nombres de remitentes, grupos y canales de un respaldo (`entities.json`).
+
+Los mensajes exportados solo guardan `sender_id`. Cada página de
+`iter_messages` ya trae de Telegram los usuarios y chats que aparecen en ella,
+y Telethon los deja en `msg.sender`, así que los exportadores anotan aquí esos
+nombres sin hacer peticiones extra. El archivo vive en la raíz del respaldo y lo
+comparten todos los chats y temas; el visor lo carga una vez para mostrar
+nombres y filtrar por ellos.
+"""
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from telethon.utils import get_peer_id
+
+ENTITIES_NAME = "entities.json"
+ENTITIES_VERSION = 1
+
+
+def entity_record(entity) -> Dict[str, Any]:
+    """Nombre, usuario y tipo de un usuario, bot, grupo o canal de Telethon."""
+    first = getattr(entity, "first_name", None)
+    last = getattr(entity, "last_name", None)
+    name = " ".join(part for part in (first, last) if part) or getattr(entity, "title", None) or ""
+    if getattr(entity, "bot", False):
+        kind = "bot"
+    elif hasattr(entity, "first_name"):
+        kind = "user"
+    elif getattr(entity, "broadcast", False):
+        kind = "channel"
+    else:
+        kind = "group"
+    return {"name": name, "username": getattr(entity, "username", None), "type": kind}
+
+
+def _read_entities(path: Path) -> Dict[str, Dict[str, Any]]:
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(data, dict) or data.get("version") != ENTITIES_VERSION:
+        return {}
+    return data.get("entities", {})
+
+
+def find_entities_file(chat_dir: Path) -> Optional[Path]:
+    """`entities.json` de la raíz del respaldo de un chat (o de un tema, dos niveles arriba)."""
+    for folder in (chat_dir.parent, chat_dir.parent.parent, chat_dir):
+        path = folder / ENTITIES_NAME
+        if path.exists():
+            return path
+    return None
+
+
+def load_sender_names(chat_dir: Path) -> Dict[int, str]:
+    """Nombre para mostrar de cada id del respaldo de `chat_dir` (vacío si no hay archivo)."""
+    path = find_entities_file(chat_dir)
+    if path is None:
+        return {}
+    names: Dict[int, str] = {}
+    for key, record in _read_entities(path).items():
+        name = record.get("name") or (f"@{record['username']}" if record.get("username") else "")
+        if name:
+            try:
+                names[int(key)] = name
+            except ValueError:
+                continue
+    return names
+
+
+class EntityCache:
+    """
+    Entidades vistas durante una exportación, guardadas en `<raíz>/entities.json`.
+
+    Cada id se anota una vez por ejecución (así los nombres cambiados se
+    actualizan sin recalcularlos en cada mensaje). Al guardar se combinan con
+    lo que haya en disco, por si otro exportador escribió mientras tanto.
+    """
+
+    def __init__(self, root: Path) -> None:
+        self.path = Path(root) / ENTITIES_NAME
+        self._seen: set = set()
+        self._changed: Dict[str, Dict[str, Any]] = {}
+        self._known = _read_entities(self.path)
+
+    def add(self, entity) -> None:
+        if entity is None:
+            return
+        try:
+            peer_id = get_peer_id(entity)
+        except (TypeError, ValueError):
+            return
+        if peer_id in self._seen:
+            return
+        self._seen.add(peer_id)
+        key = str(peer_id)
+        record = entity_record(entity)
+        if self._known.get(key) != record:
+            self._known[key] = record
+            self._changed[key] = record
+
+    def save(self) -> None:
+        if not self._changed:
+            return
+        entities = _read_entities(self.path)
+        entities.update(self._changed)
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        data = {"version": ENTITIES_VERSION, "entities": entities}
+        tmp_path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp_path, self.path)
+        self._known = entities
+        self._changed = {}
@@ -12,6 +12,13 @@ Parámetros:
   --output     Ruta base de salida (por defecto Escritorio/TelegramBackupsTopics)
   --limit      Límite de mensajes por tema (0 = todos)
   --skip-media No descargar multimedia
+  --fsync      none | close | flush: cuándo forzar el volcado de messages.jsonl a disco
+  --media-store [RUTA]  Almacén de multimedia compartido y sin duplicados
+  --format     jsonl | jsonl.gz | jsonl.zst | sqlite
+  --parallel-topics N  Temas exportados a la vez (por defecto 1)
+  --media-workers N    Descargas simultáneas compartidas entre todos los temas
+  --incremental        Solo mensajes nuevos desde el último id exportado de cada tema
+  --progress-interval S  Segundos entre líneas de progreso (0 = sin progreso)
 """
 import argparse
 import asyncio
@@ -19,13 +26,32 @@ import json
 import os
 import re
 from pathlib import Path
-from typing import Optional
+from typing import Any, Dict, Optional
 
 from dotenv import load_dotenv
 from telethon import TelegramClient
-from telethon.errors import SessionPasswordNeededError
+from telethon.errors import FloodWaitError
 from telethon.tl.functions.channels import GetForumTopicsRequest
 
+from catalog import refresh_catalog
+from entities import EntityCache
+from exporter import (
+    DEFAULT_MEDIA_WORKERS,
+    OUTPUT_FORMATS,
+    check_output_format,
+    export_messages,
+    open_sink,
+    relative_path,
+    resume_id,
+    scheduled_call,
+    sign_in,
+)
+from jsonl_writer import FSYNC_POLICIES
+from media_store import MediaStore
+from metrics import DEFAULT_PROGRESS_INTERVAL, METRICS_NAME, ChatMetrics, ExportMetrics
+from scheduler import RequestScheduler
+from sqlite_store import DB_NAME, SqliteStore
+
 
 def parse_link(link: str) -> Optional[int]:
     m = re.search(r"#-?(\d+)", link) or re.search(r"=(\-?\d+)", link)
@@ -42,9 +68,31 @@ def sanitize_name(name: str) -> str:
     return name[:80] or "tema"
 
 
-async def export_topic(client, entity, topic, base_dir: Path, limit: Optional[int], skip_media: bool):
+async def export_topic(
+    client,
+    entity,
+    topic,
+    base_dir: Path,
+    limit: Optional[int],
+    skip_media: bool,
+    fsync: str = "none",
+    media_store: Optional[MediaStore] = None,
+    sqlite_store: Optional[SqliteStore] = None,
+    chat_id: Optional[int] = None,
+    media_workers: int = DEFAULT_MEDIA_WORKERS,
+    scheduler: Optional[RequestScheduler] = None,
+    incremental: bool = False,
+    output_format: str = "jsonl",
+    metrics: Optional[ChatMetrics] = None,
+    entities: Optional[EntityCache] = None,
+):
+    """
+    Exporta un tema con `exporter.export_messages`, igual que los chats de
+    `backup_telegram.py`. `scheduler` se comparte entre todos los temas;
+    `metrics` recoge contadores y tiempos del tema y `entities` los nombres
+    de los remitentes.
+    """
     folder = base_dir / f"topic_{topic.id}_{sanitize_name(topic.title or 'tema')}"
-    media_dir = folder / "media"
     folder.mkdir(parents=True, exist_ok=True)
 
     meta = {
@@ -52,36 +100,64 @@ async def export_topic(client, entity, topic, base_dir: Path, limit: Optional[in
         "title": topic.title,
         "messages_count": topic.total_messages,
     }
+    if media_store is not None:
+        meta["media_store"] = relative_path(media_store.root, folder)
+    if sqlite_store is not None:
+        meta["chat_id"] = chat_id
+        meta["sqlite"] = relative_path(sqlite_store.db_path, folder)
+        sqlite_store.upsert_topic(chat_id, topic.id, topic.title, topic.total_messages, str(folder))
     (folder / "topic.json").write_text(json.dumps(meta, ensure_ascii=False, indent=2), encoding="utf-8")
 
-    messages_path = folder / "messages.jsonl"
-    written = 0
-    downloaded = 0
-    async for msg in client.iter_messages(entity, reply_to=topic.id, reverse=True, limit=limit):
-        payload = {
-            "id": msg.id,
-            "date": msg.date.isoformat() if msg.date else None,
-            "message": msg.message,
-            "sender_id": msg.sender_id,
-            "reply_to_msg_id": getattr(msg, "reply_to_msg_id", None),
-            "views": getattr(msg, "views", None),
-            "forwards": getattr(msg, "forwards", None),
-            "media_type": msg.media.__class__.__name__ if msg.media else None,
-        }
-        if not skip_media and msg.media:
-            media_dir.mkdir(parents=True, exist_ok=True)
-            file_path = await msg.download_media(file=media_dir)
-            if file_path:
-                payload["media_file"] = os.path.relpath(file_path, folder)
-                downloaded += 1
-        with messages_path.open("a", encoding="utf-8") as f:
-            f.write(json.dumps(payload, ensure_ascii=False) + "\n")
-        written += 1
-
-    return {"topic_id": topic.id, "title": topic.title, "messages": written, "media": downloaded, "path": str(folder)}
-
-
-async def run(link: Optional[str], chat_id: Optional[int], output: Path, limit: Optional[int], skip_media: bool, session_name: str):
+    start_id = resume_id(folder, sqlite_store, chat_id, topic.id) if incremental else 0
+    if metrics is not None and start_id:
+        # total_messages cuenta todo el tema, no lo que falta desde start_id.
+        metrics.expected = None
+    sink = open_sink(folder, output_format, fsync, sqlite_store, chat_id, topic.id)
+    counters = await export_messages(
+        client,
+        entity,
+        folder,
+        sink,
+        limit,
+        skip_media,
+        media_workers,
+        scheduler,
+        media_store,
+        reply_to=topic.id,
+        start_id=start_id,
+        state_path=folder / "state.json" if incremental else None,
+        metrics=metrics,
+        entities=entities,
+    )
+    if entities is not None:
+        entities.save()
+
+    return {
+        "topic_id": topic.id,
+        "title": topic.title,
+        "messages": counters["messages"],
+        "media": counters["media"],
+        "last_id": counters["last_id"],
+        "path": str(folder),
+    }
+
+
+async def run(
+    link: Optional[str],
+    chat_id: Optional[int],
+    output: Path,
+    limit: Optional[int],
+    skip_media: bool,
+    session_name: str,
+    fsync: str = "none",
+    media_store_dir: Optional[Path] = None,
+    media_hardlink: bool = False,
+    output_format: str = "jsonl",
+    parallel_topics: int = 1,
+    media_workers: int = DEFAULT_MEDIA_WORKERS,
+    incremental: bool = False,
+    progress_interval: float = DEFAULT_PROGRESS_INTERVAL,
+):
     load_dotenv()
     api_id = int(os.getenv("TG_API_ID", "0"))
     api_hash = os.getenv("TG_API_HASH", "")
@@ -94,36 +170,113 @@ async def run(link: Optional[str], chat_id: Optional[int], output: Path, limit:
     if not chat_id:
         raise SystemExit("Necesitas --link o --chat-id válido.")
 
+    check_output_format(output_format)
     output.mkdir(parents=True, exist_ok=True)
     session_dir = output / "sessions"
     session_dir.mkdir(parents=True, exist_ok=True)
 
     client = TelegramClient(str(session_dir / session_name), api_id, api_hash)
-    await client.connect()
-    if not await client.is_user_authorized():
-        if not phone:
-            raise RuntimeError("Proporciona TG_PHONE o --phone para iniciar sesión.")
-        await client.send_code_request(phone)
-        try:
-            await client.sign_in(phone, input("Código de Telegram: "))
-        except SessionPasswordNeededError:
-            await client.sign_in(password=input("Tu contraseña 2FA: "))
-
-    entity = await client.get_entity(chat_id)
+    await sign_in(client, phone)
+
+    topic_slots = asyncio.Semaphore(max(1, parallel_topics))
+    # Como máximo --media-workers descargas y --parallel-topics historiales a la vez
+    # entre todos los temas; el planificador baja el cupo si Telegram pide esperar.
+    scheduler = RequestScheduler(max_downloads=media_workers, max_history=parallel_topics)
+
+    entity = await scheduled_call(scheduler, "other", lambda: client.get_entity(chat_id))
     base_dir = output / sanitize_name(str(chat_id))
     base_dir.mkdir(parents=True, exist_ok=True)
+    media_store = None
+    if media_store_dir is not None and not skip_media:
+        media_store = MediaStore(media_store_dir, hardlink=media_hardlink)
+    sqlite_store = None
+    if output_format == "sqlite":
+        sqlite_store = SqliteStore(output / DB_NAME, fsync=fsync)
+        sqlite_store.upsert_chat(chat_id, getattr(entity, "title", None), entity.__class__.__name__, str(base_dir))
+
+    # Compartido con los demás chats del respaldo: los temas están un nivel más abajo.
+    entities = EntityCache(output)
+    entities.add(entity)
+    metrics = ExportMetrics(base_dir / METRICS_NAME, scheduler, label="temas")
+    metrics.log(
+        "start",
+        chat_id=chat_id,
+        format=output_format,
+        media_workers=media_workers,
+        parallel_topics=parallel_topics,
+        incremental=incremental,
+    )
+
+    async def export_one(topic) -> Dict[str, Any]:
+        expected = topic.total_messages
+        if limit and expected is not None:
+            expected = min(expected, limit)
+        topic_metrics = metrics.chat(topic.id, topic.title, expected)
+        async with topic_slots:
+            info = await export_topic(
+                client,
+                entity,
+                topic,
+                base_dir,
+                limit,
+                skip_media,
+                fsync,
+                media_store,
+                sqlite_store,
+                chat_id,
+                media_workers,
+                scheduler,
+                incremental,
+                output_format,
+                topic_metrics,
+                entities,
+            )
+        metrics.finish_chat(topic_metrics)
+        return info
+
+    tasks = []
     summary = []
-    offset_topic = 0
-    while True:
-        res = await client(GetForumTopicsRequest(entity, offset_date=None, offset_id=0, offset_topic=offset_topic, limit=100))
-        if not res.topics:
-            break
-        for t in res.topics:
-            info = await export_topic(client, entity, t, base_dir, limit, skip_media)
+    reporter = asyncio.create_task(metrics.report(progress_interval)) if progress_interval > 0 else None
+    try:
+        # Cada página de temas se empieza a exportar mientras se pide la siguiente.
+        offset_topic = 0
+        while True:
+            try:
+                async with scheduler.slot("topics"):
+                    res = await client(
+                        GetForumTopicsRequest(entity, offset_date=None, offset_id=0, offset_topic=offset_topic, limit=100)
+                    )
+            except FloodWaitError as e:
+                scheduler.flood("topics", e.seconds)
+                continue
+            await scheduler.success("topics")
+            if not res.topics:
+                break
+            # Los creadores de los temas vienen en la misma respuesta.
+            for peer in (*res.users, *res.chats):
+                entities.add(peer)
+            tasks.extend(asyncio.create_task(export_one(t)) for t in res.topics)
+            offset_topic = res.topics[-1].id
+        print(f"Se encontraron {len(tasks)} temas.")
+        for task in tasks:
+            info = await task
             summary.append(info)
-        offset_topic = res.topics[-1].id
+            print(f"- {info['title']}: {info['messages']} mensajes, {info['media']} multimedia")
+    finally:
+        if reporter is not None:
+            tasks.append(reporter)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if sqlite_store is not None:
+            sqlite_store.close()
+        entities.save()
+        metrics.close()
 
+    if scheduler.total_wait:
+        print(f"Tiempo total en espera por FloodWait: {scheduler.total_wait:.0f}s ({scheduler.summary()})")
     (base_dir / "resumen_topics.json").write_text(json.dumps(summary, ensure_ascii=False, indent=2), encoding="utf-8")
+    refresh_catalog(output, [Path(info["path"]) for info in summary])
     await client.disconnect()
     print(f"Exportados {len(summary)} temas. Ver {base_dir}")
 
@@ -136,6 +289,52 @@ def main():
     parser.add_argument("--limit", type=int, default=0, help="Máx. mensajes por tema (0 = todos)")
     parser.add_argument("--skip-media", action="store_true", help="No descargar multimedia")
     parser.add_argument("--session", default="topics_session", help="Nombre de archivo de sesión")
+    parser.add_argument(
+        "--fsync",
+        choices=FSYNC_POLICIES,
+        default="none",
+        help="Cuándo forzar el volcado de messages.jsonl a disco: none, close (al terminar cada tema) o flush (en cada bloque)",
+    )
+    parser.add_argument(
+        "--media-store",
+        nargs="?",
+        const="",
+        default=None,
+        metavar="RUTA",
+        help="Guarda la multimedia una sola vez en un almacén compartido (por defecto: <salida>/media_store)",
+    )
+    parser.add_argument(
+        "--media-hardlink",
+        action="store_true",
+        help="Con --media-store, crea además enlaces duros en la carpeta media/ de cada tema",
+    )
+    parser.add_argument(
+        "--format",
+        choices=OUTPUT_FORMATS,
+        default="jsonl",
+        help=(
+            "Formato de salida: messages.jsonl por tema, comprimido por bloques "
+            f"(jsonl.gz, jsonl.zst) o una base {DB_NAME} en la carpeta de salida"
+        ),
+    )
+    parser.add_argument("--parallel-topics", type=int, default=1, help="Temas exportados a la vez (por defecto: 1)")
+    parser.add_argument(
+        "--media-workers",
+        type=int,
+        default=DEFAULT_MEDIA_WORKERS,
+        help=f"Descargas de multimedia simultáneas, compartidas entre temas (por defecto: {DEFAULT_MEDIA_WORKERS})",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Solo exporta mensajes nuevos desde el último id guardado en state.json de cada tema",
+    )
+    parser.add_argument(
+        "--progress-interval",
+        type=float,
+        default=DEFAULT_PROGRESS_INTERVAL,
+        help=f"Segundos entre líneas de progreso (0 = sin progreso; por defecto: {DEFAULT_PROGRESS_INTERVAL:g})",
+    )
     args = parser.parse_args()
 
     desktop = Path.home() / "Desktop"
@@ -143,7 +342,28 @@ def main():
     out = args.output or default_out
     limit = None if args.limit == 0 else args.limit
 
-    asyncio.run(run(args.link, args.chat_id, out, limit, args.skip_media, args.session))
+    media_store_dir = None
+    if args.media_store is not None:
+        media_store_dir = Path(args.media_store) if args.media_store else out / "media_store"
+
+    asyncio.run(
+        run(
+            args.link,
+            args.chat_id,
+            out,
+            limit,
+            args.skip_media,
+            args.session,
+            args.fsync,
+            media_store_dir,
+            args.media_hardlink,
+            args.format,
+            args.parallel_topics,
+            args.media_workers,
+            args.incremental,
+            args.progress_interval,
+        )
+    )
 
 
 if __name__ == "__main__":
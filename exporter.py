@@ -0,0 +1,446 @@
+"""
+Núcleo común de `backup_telegram.py` y `export_topics.py`.
+
+Recorre los mensajes de un chat o de un tema, descarga su multimedia en
+paralelo y escribe cada registro, en orden, en un destino intercambiable
+(`messages.jsonl` o la base SQLite del respaldo). Ambos exportadores usan la
+misma serialización, el mismo estado incremental y el mismo planificador de
+peticiones (`scheduler.py`), así que generan registros idénticos para el visor.
+
+Formatos de salida (`OUTPUT_FORMATS`): `jsonl`, `jsonl.gz` / `jsonl.zst`
+(comprimido por bloques, ver `block_jsonl.py`) y `sqlite`.
+"""
+import asyncio
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+from telethon.errors import FloodWaitError, SessionPasswordNeededError
+from telethon.utils import get_peer_id
+
+from block_jsonl import BlockJsonlReader, BlockJsonlWriter, block_path, check_codec, find_block_file
+from chunked_download import download_media
+from entities import EntityCache
+from jsonl_writer import JsonlWriter
+from media_store import MediaStore
+from metrics import ChatMetrics
+from scheduler import HISTORY_PAGE, RequestScheduler
+from sqlite_store import SqliteStore
+
+DEFAULT_MEDIA_WORKERS = 4
+PENDING_PER_WORKER = 32
+STATE_SAVE_EVERY = 200
+TAIL_CHUNK = 64 * 1024
+# FloodWait que Telethon espera sin avisar; 0 = todos pasan por `RequestScheduler.flood`.
+FLOOD_SLEEP_THRESHOLD = 0
+
+OUTPUT_FORMATS = ("jsonl", "jsonl.gz", "jsonl.zst", "sqlite")
+# Formatos de JSONL comprimido por bloques y su compresión.
+COMPRESSED_FORMATS = {"jsonl.gz": "gzip", "jsonl.zst": "zstd"}
+
+T = TypeVar("T")
+
+
+async def sign_in(client, phone: Optional[str]) -> None:
+    """Conecta el cliente y, si la sesión no está autorizada, pide el código (y la 2FA)."""
+    await client.connect()
+    if not await client.is_user_authorized():
+        if not phone:
+            raise RuntimeError("Necesitas proporcionar --phone o la variable TG_PHONE para iniciar sesión.")
+        await client.send_code_request(phone)
+        try:
+            await client.sign_in(phone, input("Código de Telegram: "))
+        except SessionPasswordNeededError:
+            await client.sign_in(password=input("Tu contraseña 2FA: "))
+    # Telethon duerme por su cuenta los FloodWait de hasta 60 s con el cupo ocupado;
+    # a partir de aquí todos llegan como FloodWaitError y el planificador ajusta el
+    # ritmo. Por eso cada petición posterior pasa por él (ver `scheduled_call`).
+    client.flood_sleep_threshold = FLOOD_SLEEP_THRESHOLD
+
+
+async def scheduled_call(scheduler: RequestScheduler, kind: str, call: Callable[[], Awaitable[T]]) -> T:
+    """Ejecuta `call()` en el cupo de `kind`; tras un FloodWait espera y la repite."""
+    while True:
+        try:
+            async with scheduler.slot(kind):
+                result = await call()
+        except FloodWaitError as e:
+            scheduler.flood(kind, e.seconds)
+            continue
+        await scheduler.success(kind)
+        return result
+
+
+def relative_path(path, start, pathmod=os.path) -> str:
+    """
+    Ruta de `path` relativa a `start`; absoluta si no la hay (en Windows, si
+    están en unidades distintas, p. ej. `--media-store` en otro disco).
+    """
+    try:
+        return pathmod.relpath(path, start)
+    except ValueError:
+        return pathmod.abspath(path)
+
+
+def message_to_dict(msg) -> Dict[str, Any]:
+    """Convierte un mensaje de Telethon en un dict JSON-friendly."""
+    data: Dict[str, Any] = {
+        "id": msg.id,
+        "date": msg.date.isoformat() if msg.date else None,
+        "message": msg.message,
+        "sender_id": msg.sender_id,
+        "chat_id": get_peer_id(msg.peer_id) if msg.peer_id else None,
+        "reply_to_msg_id": getattr(msg, "reply_to_msg_id", None),
+        "via_bot_id": getattr(msg, "via_bot_id", None),
+        "views": getattr(msg, "views", None),
+        "forwards": getattr(msg, "forwards", None),
+        "reactions": [r.to_dict() for r in msg.reactions.results] if getattr(msg, "reactions", None) else None,
+        "fwd_from": msg.fwd_from.to_dict() if msg.fwd_from else None,
+        "action": msg.action.to_dict() if getattr(msg, "action", None) else None,
+        "media_type": msg.media.__class__.__name__ if msg.media else None,
+    }
+    return data
+
+
+async def _download_with_backoff(
+    msg,
+    media_dir: Path,
+    scheduler: RequestScheduler,
+    store: Optional[MediaStore] = None,
+    metrics: Optional[ChatMetrics] = None,
+) -> Optional[str]:
+    async def download(target: Path) -> Optional[str]:
+        path = await download_media(msg, target)
+        # Solo cuentan los bytes bajados de verdad, no los que `MediaStore` reutiliza.
+        if metrics is not None and path:
+            metrics.media_bytes += os.path.getsize(path)
+        return path
+
+    while True:
+        try:
+            async with scheduler.slot("download"):
+                started = time.monotonic()
+                # Telethon (o `chunked_download` en los archivos grandes) elige el nombre y
+                # crea el archivo sin ceder el control al event loop, así que varias
+                # descargas en la misma carpeta no chocan.
+                if store is not None:
+                    file_path = await store.fetch(msg, download, media_dir)
+                else:
+                    file_path = await download(media_dir)
+                if metrics is not None:
+                    metrics.download_seconds += time.monotonic() - started
+        except FloodWaitError as e:
+            # Quien espera una descarga compartida (el mismo archivo en `chunked_download`
+            # o en `MediaStore`) recibe la misma excepción que quien la hacía: cada
+            # FloodWait se anota una sola vez, y todos reintentan tras la pausa.
+            if not getattr(e, "reported", False):
+                e.reported = True
+                scheduler.flood("download", e.seconds)
+                if metrics is not None:
+                    metrics.flood_wait(e.seconds)
+            continue
+        await scheduler.success("download")
+        return file_path
+
+
+async def _media_worker(
+    queue: asyncio.Queue,
+    media_dir: Path,
+    scheduler: RequestScheduler,
+    store: Optional[MediaStore] = None,
+    metrics: Optional[ChatMetrics] = None,
+) -> None:
+    """Descarga multimedia de la cola y resuelve el futuro asociado a cada mensaje."""
+    while True:
+        msg, fut = await queue.get()
+        try:
+            file_path = await _download_with_backoff(msg, media_dir, scheduler, store, metrics)
+        except Exception as e:
+            if not fut.done():
+                fut.set_exception(e)
+        else:
+            if not fut.done():
+                fut.set_result(file_path)
+        finally:
+            queue.task_done()
+
+
+def load_state(state_path: Path) -> Dict[str, Any]:
+    """Lee el estado incremental de un chat (vacío si no existe o está dañado)."""
+    try:
+        return json.loads(state_path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def save_state(state_path: Path, state: Dict[str, Any]) -> None:
+    """Guarda el estado de forma atómica para que un corte no lo deje a medias."""
+    tmp_path = state_path.with_name(state_path.name + ".tmp")
+    tmp_path.write_text(json.dumps(state, ensure_ascii=False, indent=2), encoding="utf-8")
+    os.replace(tmp_path, state_path)
+
+
+def recover_last_id(messages_path: Path) -> int:
+    """
+    Devuelve el id del último mensaje completo de `messages.jsonl`.
+
+    Si el proceso murió a mitad de una línea, la recorta para que la siguiente
+    ejecución no deje un registro corrupto en medio del archivo.
+    """
+    if not messages_path.exists():
+        return 0
+    with messages_path.open("rb+") as f:
+        end = f.seek(0, os.SEEK_END)
+        tail = b""
+        pos = end
+        # Lee hacia atrás hasta tener al menos una línea completa.
+        while pos > 0 and tail.count(b"\n") < 2:
+            step = min(TAIL_CHUNK, pos)
+            pos -= step
+            f.seek(pos)
+            tail = f.read(step) + tail
+        if tail and not tail.endswith(b"\n"):
+            cut = tail.rfind(b"\n") + 1
+            f.truncate(pos + cut)
+            tail = tail[:cut]
+    for line in reversed(tail.splitlines()):
+        try:
+            return int(json.loads(line)["id"])
+        except (ValueError, KeyError, TypeError):
+            continue
+    return 0
+
+
+def check_output_format(output_format: str) -> None:
+    """Termina antes de conectar si el formato es desconocido o pide una compresión no instalada."""
+    if output_format not in OUTPUT_FORMATS:
+        raise SystemExit(f"Formato de salida desconocido: {output_format!r} (usa {', '.join(OUTPUT_FORMATS)})")
+    if output_format in COMPRESSED_FORMATS:
+        try:
+            check_codec(COMPRESSED_FORMATS[output_format])
+        except RuntimeError as e:
+            raise SystemExit(str(e))
+
+
+def open_sink(
+    folder: Path,
+    output_format: str = "jsonl",
+    fsync: str = "none",
+    sqlite_store: Optional[SqliteStore] = None,
+    chat_id: Optional[int] = None,
+    topic_id: int = 0,
+):
+    """
+    Destino de los registros de un chat o tema según `output_format`. Todos
+    tienen la misma interfaz (`write`/`flush`/`close`), así que
+    `export_messages` no distingue entre ellos.
+    """
+    if output_format == "sqlite":
+        if sqlite_store is None:
+            raise ValueError("El formato sqlite necesita un SqliteStore")
+        return sqlite_store.writer(chat_id, topic_id)
+    if output_format == "jsonl":
+        return JsonlWriter(folder / "messages.jsonl", fsync=fsync)
+    if output_format in COMPRESSED_FORMATS:
+        codec = COMPRESSED_FORMATS[output_format]
+        return BlockJsonlWriter(block_path(folder, codec), codec, fsync=fsync)
+    raise ValueError(f"Formato de salida desconocido: {output_format!r} (usa {', '.join(OUTPUT_FORMATS)})")
+
+
+def resume_id(
+    folder: Path, sqlite_store: Optional[SqliteStore] = None, chat_id: Optional[int] = None, topic_id: int = 0
+) -> int:
+    """
+    Último id exportado de un chat o tema, para `--incremental`.
+
+    El destino manda sobre state.json: puede ir por delante si hubo un corte
+    entre escribir la línea y guardar el estado.
+    """
+    compressed = find_block_file(folder)
+    if sqlite_store is not None:
+        exported_id = sqlite_store.last_id(chat_id, topic_id)
+    elif compressed is not None:
+        reader = BlockJsonlReader(compressed)
+        exported_id = reader.last_id()
+        reader.close()
+    else:
+        exported_id = recover_last_id(folder / "messages.jsonl")
+    return max(int(load_state(folder / "state.json").get("last_id") or 0), exported_id)
+
+
+async def _write_in_order(
+    pending: asyncio.Queue,
+    writer,
+    chat_dir: Path,
+    counters: Dict[str, int],
+    state_path: Optional[Path] = None,
+    metrics: Optional[ChatMetrics] = None,
+) -> None:
+    """
+    Escribe los registros en el orden de llegada, esperando su multimedia si la tienen.
+
+    Con `state_path` se guarda periódicamente el último id escrito para poder
+    reanudar el chat tras un corte; antes se vacía el búfer para que el estado
+    nunca vaya por delante del archivo.
+    """
+    unsaved = 0
+    try:
+        while True:
+            item = await pending.get()
+            if item is None:
+                return
+            payload, fut = item
+            if fut is not None:
+                waited = time.monotonic()
+                file_path = await fut
+                if metrics is not None:
+                    metrics.media_wait_seconds += time.monotonic() - waited
+                if file_path:
+                    # Guardamos ruta relativa para enlazar mensaje con archivo
+                    payload["media_file"] = relative_path(file_path, chat_dir)
+                    counters["media"] += 1
+            started = time.monotonic()
+            writer.write(payload)
+            counters["messages"] += 1
+            counters["last_id"] = max(counters["last_id"], payload["id"])
+            unsaved += 1
+            if state_path and unsaved >= STATE_SAVE_EVERY:
+                writer.flush()
+                save_state(state_path, {"last_id": counters["last_id"]})
+                unsaved = 0
+            if metrics is not None:
+                metrics.write_seconds += time.monotonic() - started
+                metrics.messages = counters["messages"]
+                metrics.media = counters["media"]
+    finally:
+        started = time.monotonic()
+        writer.close()
+        if metrics is not None:
+            metrics.write_seconds += time.monotonic() - started
+        if state_path and unsaved:
+            save_state(state_path, {"last_id": counters["last_id"]})
+
+
+async def export_messages(
+    client,
+    entity,
+    folder: Path,
+    sink,
+    limit: Optional[int],
+    skip_media: bool,
+    media_workers: int = DEFAULT_MEDIA_WORKERS,
+    scheduler: Optional[RequestScheduler] = None,
+    media_store: Optional[MediaStore] = None,
+    reply_to: Optional[int] = None,
+    start_id: int = 0,
+    state_path: Optional[Path] = None,
+    metrics: Optional[ChatMetrics] = None,
+    entities: Optional[EntityCache] = None,
+) -> Dict[str, int]:
+    """
+    Exporta los mensajes de `entity` (o solo los del tema `reply_to`) a `sink`.
+
+    `iter_messages` sigue leyendo mientras `media_workers` tareas descargan en
+    paralelo; cada registro se escribe, en orden, cuando su archivo ya está
+    descargado. Las peticiones pasan por `scheduler` (compartido entre chats o
+    temas), que decide cuántas van a la vez y las pausa ante un FloodWait; el
+    historial se pide por tramos del tamaño que marque.
+
+    Con `start_id` solo se piden los mensajes posteriores a ese id y, con
+    `state_path`, se guarda periódicamente el último id escrito. Con `metrics`
+    se van sumando los contadores y tiempos del chat (ver `metrics.py`). Con
+    `entities` se anota el remitente de cada mensaje, que Telegram ya envía con
+    cada página del historial (ver `entities.py`).
+
+    Devuelve los contadores `messages`, `media` y `last_id`.
+    """
+    media_dir = folder / "media"
+    counters = {"messages": 0, "media": 0, "last_id": start_id}
+    media_workers = max(1, media_workers)
+    scheduler = scheduler or RequestScheduler(media_workers)
+
+    if metrics is not None:
+        metrics.start()
+    loop = asyncio.get_running_loop()
+    downloads: asyncio.Queue = asyncio.Queue(maxsize=media_workers * 2)
+    # Limita cuántos mensajes pueden esperar su multimedia antes de escribirse.
+    pending: asyncio.Queue = asyncio.Queue(maxsize=media_workers * PENDING_PER_WORKER)
+    writer = asyncio.create_task(_write_in_order(pending, sink, folder, counters, state_path, metrics))
+    workers = []
+    if not skip_media:
+        if media_store is None:
+            media_dir.mkdir(parents=True, exist_ok=True)
+        workers = [
+            asyncio.create_task(_media_worker(downloads, media_dir, scheduler, media_store, metrics))
+            for _ in range(media_workers)
+        ]
+
+    async def put(queue: asyncio.Queue, item) -> None:
+        # Si el escritor falla (p. ej. error de descarga) no hay que quedarse bloqueado.
+        put_task = asyncio.ensure_future(queue.put(item))
+        await asyncio.wait({put_task, writer}, return_when=asyncio.FIRST_COMPLETED)
+        if not put_task.done():
+            put_task.cancel()
+            writer.result()
+
+    try:
+        last_id = start_id
+        read = 0
+        while limit is None or read < limit:
+            chunk = scheduler.history_chunk if limit is None else min(scheduler.history_chunk, limit - read)
+            chunk_read = 0
+            try:
+                # Cada tramo vuelve a pedir turno: con el cupo lleno, los chats se alternan.
+                async with scheduler.slot("history"):
+                    fetch_started = time.monotonic()
+                    # Orden cronológico: reverse=True recorre del más antiguo al más nuevo.
+                    # Cada tramo (y el reintento tras un FloodWait) sigue justo después
+                    # del último id leído.
+                    async for msg in client.iter_messages(
+                        entity,
+                        limit=chunk,
+                        reverse=True,
+                        offset_id=last_id,
+                        reply_to=reply_to,
+                        wait_time=scheduler.history_delay,
+                    ):
+                        if metrics is not None:
+                            # Solo el tiempo esperando a Telegram, no el de encolar el mensaje.
+                            metrics.fetch_seconds += time.monotonic() - fetch_started
+                        payload = message_to_dict(msg)
+                        if entities is not None:
+                            entities.add(msg.sender)
+                        fut = None
+                        if not skip_media and msg.media:
+                            fut = loop.create_future()
+                            await put(downloads, (msg, fut))
+                        await put(pending, (payload, fut))
+                        last_id = msg.id
+                        read += 1
+                        chunk_read += 1
+                        fetch_started = time.monotonic()
+                    if metrics is not None:
+                        # La última petición, la que termina el tramo.
+                        metrics.fetch_seconds += time.monotonic() - fetch_started
+            except FloodWaitError as e:
+                scheduler.flood("history", e.seconds)
+                if metrics is not None:
+                    metrics.flood_wait(e.seconds)
+                continue
+            await scheduler.success("history", max(1, -(-chunk_read // HISTORY_PAGE)))
+            if chunk_read < chunk:
+                # Tramo incompleto: no quedan más mensajes.
+                break
+        await put(pending, None)
+        await writer
+        if metrics is not None:
+            metrics.finish()
+    finally:
+        for task in workers:
+            task.cancel()
+        if not writer.done():
+            writer.cancel()
+        await asyncio.gather(writer, *workers, return_exceptions=True)
+    return counters
@@ -0,0 +1,101 @@
+"""
+Escritor JSONL con búfer compartido por los exportadores.
+
+En vez de abrir y cerrar `messages.jsonl` por cada mensaje, mantiene el archivo
+abierto y acumula líneas en memoria hasta alcanzar un número de registros, un
+tamaño en bytes o un tiempo máximo; al cerrar siempre vacía lo pendiente.
+"""
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+FSYNC_POLICIES = ("none", "close", "flush")
+
+DEFAULT_MAX_RECORDS = 500
+DEFAULT_MAX_BYTES = 1024 * 1024
+DEFAULT_MAX_DELAY = 2.0
+
+# Un solo codificador para todos los registros: `json.dumps` con opciones crea uno nuevo en cada llamada.
+_ENCODER = json.JSONEncoder(ensure_ascii=False)
+
+
+def dumps_record(payload: Dict[str, Any]) -> str:
+    """Serializa un mensaje exportado; lo comparten todos los destinos."""
+    return _ENCODER.encode(payload)
+
+
+class JsonlWriter:
+    """
+    Añade registros a un archivo JSONL en bloques.
+
+    `fsync` controla cuándo se fuerza el volcado a disco:
+      - "none": nunca (lo decide el sistema operativo).
+      - "close": una vez al cerrar.
+      - "flush": en cada vaciado del búfer (más seguro, más lento).
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        max_records: int = DEFAULT_MAX_RECORDS,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        max_delay: float = DEFAULT_MAX_DELAY,
+        fsync: str = "none",
+    ) -> None:
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Política fsync desconocida: {fsync!r} (usa {', '.join(FSYNC_POLICIES)})")
+        self.path = Path(path)
+        self.max_records = max(1, max_records)
+        self.max_bytes = max(1, max_bytes)
+        self.max_delay = max_delay
+        self.fsync = fsync
+        self._buffer: List[str] = []
+        self._buffered_bytes = 0
+        self._last_flush = time.monotonic()
+        self._file = None
+        self.written = 0
+
+    def write(self, payload: Dict[str, Any]) -> None:
+        line = dumps_record(payload) + "\n"
+        self._buffer.append(line)
+        self._buffered_bytes += len(line)
+        if (
+            len(self._buffer) >= self.max_records
+            or self._buffered_bytes >= self.max_bytes
+            or time.monotonic() - self._last_flush >= self.max_delay
+        ):
+            self.flush()
+
+    def flush(self) -> None:
+        """Escribe lo acumulado; tras volver, todo lo escrito está en el archivo."""
+        self._last_flush = time.monotonic()
+        if not self._buffer:
+            return
+        if self._file is None:
+            self._file = self.path.open("a", encoding="utf-8")
+        self._file.write("".join(self._buffer))
+        self._file.flush()
+        if self.fsync == "flush":
+            os.fsync(self._file.fileno())
+        self.written += len(self._buffer)
+        self._buffer.clear()
+        self._buffered_bytes = 0
+
+    def close(self) -> None:
+        try:
+            self.flush()
+            if self._file is not None and self.fsync == "close":
+                os.fsync(self._file.fileno())
+        finally:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def __enter__(self) -> "JsonlWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> Optional[bool]:
+        self.close()
+        return None
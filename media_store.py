@@ -0,0 +1,169 @@
+"""
+Almacén de multimedia compartido y direccionado por contenido.
+
+Cada archivo se guarda una sola vez en `<raíz>/objects/` con el id de la foto o
+documento de Telegram como nombre, así el mismo vídeo reenviado a 30 grupos se
+descarga una vez. Tras descargar se calcula su SHA-256: si otro id ya tenía el
+mismo contenido se reutiliza ese objeto y se borra la copia.
+
+El índice (`index.jsonl`) es de solo añadido y se carga entero al abrir el
+almacén; varias ejecuciones pueden compartir la misma raíz.
+"""
+import asyncio
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+HASH_CHUNK = 1024 * 1024
+
+
+def media_key(msg) -> Optional[str]:
+    """Clave estable de la multimedia de un mensaje (None si no es foto/documento)."""
+    media = getattr(msg, "media", None)
+    if media is None:
+        return None
+    # MessageMediaWebPage lleva la foto/documento dentro de `webpage`.
+    holder = getattr(media, "webpage", None) or media
+    photo = getattr(holder, "photo", None)
+    if photo is not None and getattr(photo, "id", None):
+        return f"photo_{photo.id}"
+    document = getattr(holder, "document", None)
+    if document is not None and getattr(document, "id", None):
+        return f"doc_{document.id}"
+    return None
+
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class MediaStore:
+    """
+    Almacén de objetos compartido entre chats y temas.
+
+    Con `hardlink=True` cada chat recibe además un enlace duro en su carpeta
+    `media/`, de modo que la exportación sigue siendo autocontenida sin ocupar
+    espacio extra (si el sistema de archivos no lo permite se apunta al objeto).
+    """
+
+    def __init__(self, root: Path, hardlink: bool = False) -> None:
+        self.root = Path(root)
+        self.hardlink = hardlink
+        self.objects_dir = self.root / "objects"
+        self.tmp_dir = self.root / "tmp"
+        self.index_path = self.root / "index.jsonl"
+        self.objects_dir.mkdir(parents=True, exist_ok=True)
+        self.tmp_dir.mkdir(parents=True, exist_ok=True)
+        self._by_key: Dict[str, Dict[str, Any]] = {}
+        self._by_hash: Dict[str, str] = {}
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.reused = 0
+        self._load_index()
+
+    def _load_index(self) -> None:
+        if not self.index_path.exists():
+            return
+        with self.index_path.open(encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                self._by_key[entry["key"]] = entry
+                self._by_hash.setdefault(entry["sha256"], entry["path"])
+
+    def _append_index(self, entry: Dict[str, Any]) -> None:
+        self._by_key[entry["key"]] = entry
+        self._by_hash.setdefault(entry["sha256"], entry["path"])
+        with self.index_path.open("a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def lookup(self, key: str) -> Optional[Path]:
+        """Ruta del objeto ya almacenado para `key`, si existe en disco."""
+        entry = self._by_key.get(key)
+        if not entry:
+            return None
+        path = self.root / entry["path"]
+        return path if path.exists() else None
+
+    async def fetch(
+        self,
+        msg,
+        download: Callable[[Path], Awaitable[Optional[str]]],
+        link_dir: Optional[Path] = None,
+    ) -> Optional[str]:
+        """
+        Devuelve la ruta local de la multimedia de `msg`, descargándola solo si
+        el almacén aún no la tiene. `download(carpeta)` hace la descarga real.
+        """
+        key = media_key(msg)
+        if key is None:
+            # Sin id estable (contactos, encuestas...): descarga normal.
+            target = link_dir or self.tmp_dir
+            target.mkdir(parents=True, exist_ok=True)
+            return await download(target)
+
+        path = self.lookup(key)
+        if path is not None:
+            self.reused += 1
+        elif key in self._inflight:
+            # Otro chat lo está descargando ahora mismo: se espera a ese resultado.
+            path = await asyncio.shield(self._inflight[key])
+            self.reused += 1
+        else:
+            fut = asyncio.get_running_loop().create_future()
+            self._inflight[key] = fut
+            try:
+                path = await self._download(key, download)
+            except BaseException as e:
+                fut.set_exception(e)
+                # Evita el aviso de "excepción nunca recuperada" si nadie esperaba.
+                fut.exception()
+                raise
+            else:
+                fut.set_result(path)
+            finally:
+                del self._inflight[key]
+        if path is None:
+            return None
+        return str(self._link(path, link_dir))
+
+    async def _download(self, key: str, download: Callable[[Path], Awaitable[Optional[str]]]) -> Optional[Path]:
+        tmp = await download(self.tmp_dir)
+        if not tmp:
+            return None
+        tmp_path = Path(tmp)
+        sha256 = await asyncio.to_thread(file_sha256, tmp_path)
+        size = tmp_path.stat().st_size
+        existing = self._by_hash.get(sha256)
+        if existing and (self.root / existing).exists():
+            tmp_path.unlink()
+            self.reused += 1
+            rel = existing
+        else:
+            shard = self.objects_dir / sha256[:2]
+            shard.mkdir(exist_ok=True)
+            final = shard / f"{key}{tmp_path.suffix}"
+            os.replace(tmp_path, final)
+            rel = final.relative_to(self.root).as_posix()
+        self._append_index({"key": key, "sha256": sha256, "size": size, "path": rel})
+        return self.root / rel
+
+    def _link(self, path: Path, link_dir: Optional[Path]) -> Path:
+        if not self.hardlink or link_dir is None:
+            return path
+        link_dir.mkdir(parents=True, exist_ok=True)
+        link = link_dir / path.name
+        if link.exists():
+            return link
+        try:
+            os.link(path, link)
+        except OSError:
+            return path
+        return link
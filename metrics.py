@@ -0,0 +1,209 @@
+"""
+Métricas de progreso y rendimiento de una exportación.
+
+Cada chat o tema lleva sus contadores (`ChatMetrics`): mensajes, multimedia y
+bytes descargados, y el tiempo que pasó pidiendo mensajes a Telegram,
+descargando, esperando su multimedia para escribir, escribiendo en disco y en
+FloodWait. `ExportMetrics` los reúne, muestra una línea de progreso cada pocos
+segundos con la velocidad y el tiempo estimado, y lo registra todo en
+`metrics.jsonl` (una línea JSON por evento) junto a `resumen.json`.
+
+Los tiempos de descarga son acumulados entre todas las descargas simultáneas,
+así que pueden superar la duración real del chat.
+"""
+import asyncio
+import json
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+METRICS_NAME = "metrics.jsonl"
+DEFAULT_PROGRESS_INTERVAL = 10.0
+
+
+def _rate(amount: float, seconds: float) -> float:
+    return amount / seconds if seconds > 0 else 0.0
+
+
+def _format_duration(seconds: float) -> str:
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    return f"{hours}h{minutes:02d}m" if hours else f"{minutes}m{seconds:02d}s"
+
+
+class ChatMetrics:
+    """Contadores de un chat o tema; los actualiza `exporter.export_messages`."""
+
+    def __init__(self, chat_id: Optional[int], title: Optional[str], expected: Optional[int] = None) -> None:
+        self.chat_id = chat_id
+        self.title = title
+        # Mensajes que se esperan (aproximado), para estimar el tiempo restante.
+        self.expected = expected
+        self.messages = 0
+        self.media = 0
+        self.media_bytes = 0
+        self.fetch_seconds = 0.0
+        self.download_seconds = 0.0
+        self.media_wait_seconds = 0.0
+        self.write_seconds = 0.0
+        self.flood_waits = 0
+        self.flood_seconds = 0.0
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+
+    def start(self) -> None:
+        self.started = time.monotonic()
+
+    def finish(self) -> None:
+        self.finished = time.monotonic()
+
+    def flood_wait(self, seconds: float) -> None:
+        self.flood_waits += 1
+        self.flood_seconds += seconds
+
+    @property
+    def elapsed(self) -> float:
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.monotonic()) - self.started
+
+    def remaining(self) -> Optional[int]:
+        if self.expected is None:
+            return None
+        return max(0, self.expected - self.messages)
+
+    def to_dict(self) -> Dict[str, Any]:
+        elapsed = self.elapsed
+        return {
+            "chat_id": self.chat_id,
+            "title": self.title,
+            "messages": self.messages,
+            "media": self.media,
+            "media_bytes": self.media_bytes,
+            "seconds": round(elapsed, 3),
+            "msgs_per_s": round(_rate(self.messages, elapsed), 1),
+            "media_mb_per_s": round(_rate(self.media_bytes / 1e6, elapsed), 3),
+            "fetch_s": round(self.fetch_seconds, 3),
+            "download_s": round(self.download_seconds, 3),
+            "media_wait_s": round(self.media_wait_seconds, 3),
+            "write_s": round(self.write_seconds, 3),
+            "flood_waits": self.flood_waits,
+            "flood_wait_s": round(self.flood_seconds, 1),
+        }
+
+
+class ExportMetrics:
+    """
+    Métricas de una ejecución completa y su registro en `metrics.jsonl`.
+
+    `scheduler` (un `scheduler.RequestScheduler`) aporta el tiempo total en
+    pausa por FloodWait, que se comparte entre todos los chats. `label` nombra las
+    unidades en la línea de progreso ("chats" o "temas").
+    """
+
+    def __init__(self, path: Optional[Path], scheduler=None, label: str = "chats") -> None:
+        self.path = Path(path) if path is not None else None
+        self.label = label
+        self.scheduler = scheduler
+        self.chats: List[ChatMetrics] = []
+        self.started = time.monotonic()
+        self._file = self.path.open("a", encoding="utf-8") if self.path is not None else None
+        # Última muestra (instante, mensajes, bytes) para la velocidad reciente.
+        self._last_sample = (self.started, 0, 0)
+
+    def chat(self, chat_id: Optional[int], title: Optional[str], expected: Optional[int] = None) -> ChatMetrics:
+        chat = ChatMetrics(chat_id, title, expected)
+        self.chats.append(chat)
+        return chat
+
+    def log(self, event: str, **fields: Any) -> None:
+        if self._file is None:
+            return
+        record = {"event": event, "time": datetime.now(timezone.utc).isoformat(timespec="seconds")}
+        record.update(fields)
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+
+    def finish_chat(self, chat: ChatMetrics) -> None:
+        if chat.finished is None:
+            chat.finish()
+        self.log("chat", **chat.to_dict())
+
+    def totals(self) -> Dict[str, Any]:
+        elapsed = time.monotonic() - self.started
+        messages = sum(c.messages for c in self.chats)
+        media_bytes = sum(c.media_bytes for c in self.chats)
+        return {
+            "elapsed_s": round(elapsed, 1),
+            "chats": len(self.chats),
+            "chats_done": sum(1 for c in self.chats if c.finished is not None),
+            "messages": messages,
+            "media": sum(c.media for c in self.chats),
+            "media_bytes": media_bytes,
+            "msgs_per_s": round(_rate(messages, elapsed), 1),
+            "media_mb_per_s": round(_rate(media_bytes / 1e6, elapsed), 3),
+            "fetch_s": round(sum(c.fetch_seconds for c in self.chats), 1),
+            "download_s": round(sum(c.download_seconds for c in self.chats), 1),
+            "media_wait_s": round(sum(c.media_wait_seconds for c in self.chats), 1),
+            "write_s": round(sum(c.write_seconds for c in self.chats), 1),
+            "flood_wait_s": round(getattr(self.scheduler, "total_wait", 0.0), 1),
+        }
+
+    def progress(self) -> Dict[str, Any]:
+        """Totales más la velocidad desde la muestra anterior y el tiempo restante estimado."""
+        snapshot = self.totals()
+        now = time.monotonic()
+        last_time, last_messages, last_bytes = self._last_sample
+        interval = now - last_time
+        recent_rate = _rate(snapshot["messages"] - last_messages, interval)
+        snapshot["recent_msgs_per_s"] = round(recent_rate, 1)
+        snapshot["recent_media_mb_per_s"] = round(_rate((snapshot["media_bytes"] - last_bytes) / 1e6, interval), 3)
+        self._last_sample = (now, snapshot["messages"], snapshot["media_bytes"])
+        remaining = [c.remaining() for c in self.chats if c.finished is None]
+        snapshot["eta_s"] = None
+        if remaining and None not in remaining and recent_rate > 0:
+            snapshot["eta_s"] = round(sum(remaining) / recent_rate)
+        snapshot["active"] = [c.title for c in self.chats if c.started is not None and c.finished is None]
+        return snapshot
+
+    def format_progress(self, snapshot: Dict[str, Any]) -> str:
+        line = (
+            f"  · {snapshot['chats_done']}/{snapshot['chats']} {self.label}, {snapshot['messages']} mensajes "
+            f"({snapshot['recent_msgs_per_s']:.0f}/s), multimedia {snapshot['media_bytes'] / 1e6:.1f} MB "
+            f"({snapshot['recent_media_mb_per_s']:.2f} MB/s)"
+        )
+        if snapshot["flood_wait_s"]:
+            line += f", FloodWait {snapshot['flood_wait_s']:.0f}s"
+        if snapshot["eta_s"] is not None:
+            line += f", quedan ~{_format_duration(snapshot['eta_s'])}"
+        active = snapshot["active"]
+        if active:
+            shown = ", ".join(str(title) for title in active[:3])
+            line += f" | en curso: {shown}" + (f" y {len(active) - 3} más" if len(active) > 3 else "")
+        return line
+
+    async def report(self, interval: float = DEFAULT_PROGRESS_INTERVAL) -> None:
+        """Muestra y registra el progreso cada `interval` segundos hasta que se cancele."""
+        while True:
+            await asyncio.sleep(interval)
+            snapshot = self.progress()
+            print(self.format_progress(snapshot))
+            self.log("progress", **snapshot)
+
+    def close(self) -> Dict[str, Any]:
+        """Registra los totales, los muestra y cierra `metrics.jsonl`."""
+        totals = self.totals()
+        self.log("end", **totals)
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        print(
+            f"Total: {totals['messages']} mensajes en {_format_duration(totals['elapsed_s'])} "
+            f"({totals['msgs_per_s']:.0f}/s), multimedia {totals['media_bytes'] / 1e6:.1f} MB "
+            f"({totals['media_mb_per_s']:.2f} MB/s). Tiempo acumulado: API {totals['fetch_s']:.0f}s, "
+            f"descargas {totals['download_s']:.0f}s, espera de multimedia {totals['media_wait_s']:.0f}s, "
+            f"escritura {totals['write_s']:.0f}s"
+        )
+        return totals
@@ -0,0 +1,182 @@
+"""
+Lectura en paralelo de exportaciones JSONL grandes.
+
+`iter_parsed` reparte un `messages.jsonl` en tramos de líneas completas de unos
+`PARSE_CHUNK` bytes (buscando los saltos de línea sobre el archivo mapeado en
+memoria, sin leerlo) y los decodifica en un grupo de procesos; con un JSONL
+comprimido por bloques (`block_jsonl.py`) cada proceso descomprime y decodifica
+un grupo de bloques. Los resultados se entregan por tramos, en el orden del
+archivo (el de los ids en una exportación), así que el número de línea sigue
+siendo el de fila del visor.
+
+Cada proceso aplica además `transform` a cada mensaje y solo devuelve lo que
+esta necesita: pasar diccionarios completos de un proceso a otro cuesta casi
+lo mismo que decodificarlos. Los archivos pequeños se leen en el mismo proceso.
+
+Si está instalado, `orjson` decodifica varias veces más rápido que `json`.
+"""
+import json
+import mmap
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from block_jsonl import CODECS, BlockJsonlReader, load_index
+
+try:
+    import orjson
+except ImportError:  # dependencia opcional
+    orjson = None
+
+PARSE_CHUNK = 4 * 1024 * 1024
+BLOCKS_PER_TASK = 4
+# Por debajo de esto arrancar los procesos cuesta más de lo que ahorran.
+MIN_PARALLEL_BYTES = 4 * PARSE_CHUNK
+
+Transform = Callable[[Optional[Dict[str, Any]]], Any]
+
+
+def default_workers() -> int:
+    return os.cpu_count() or 1
+
+
+def decode_line(line: bytes) -> Optional[Dict[str, Any]]:
+    """Mensaje de una línea JSONL, o None si no es un objeto JSON válido."""
+    try:
+        obj = orjson.loads(line) if orjson is not None else json.loads(line)
+    except ValueError:
+        if orjson is None:
+            return None
+        # orjson rechaza algunos JSON que `json` acepta (p. ej. enteros enormes).
+        try:
+            obj = json.loads(line)
+        except ValueError:
+            return None
+    return obj if isinstance(obj, dict) else None
+
+
+def pick_fields(fields: Tuple[str, ...], obj: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Solo los campos `fields` del mensaje; usado con `functools.partial` como `transform`."""
+    if obj is None:
+        return None
+    return {field: obj.get(field) for field in fields}
+
+
+def _apply(lines: List[bytes], transform: Optional[Transform]) -> List[Any]:
+    if transform is None:
+        return [decode_line(line) for line in lines]
+    return [transform(decode_line(line)) for line in lines]
+
+
+def _parse_range(path: str, start: int, end: int, transform: Optional[Transform]) -> List[Any]:
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        lines = mm[start:end].split(b"\n")
+    if not lines[-1]:
+        lines.pop()
+    return _apply(lines, transform)
+
+
+def _parse_blocks(path: str, block_nos: List[int], transform: Optional[Transform]) -> List[Any]:
+    reader = BlockJsonlReader(Path(path))
+    try:
+        lines = [line for block_no in block_nos for line in reader.read_block(block_no)]
+    finally:
+        reader.close()
+    return _apply(lines, transform)
+
+
+def line_ranges(
+    path: Path, chunk_size: int = PARSE_CHUNK, start: int = 0, complete: bool = False
+) -> List[Tuple[int, int]]:
+    """
+    Tramos `[inicio, fin)` de líneas enteras de `path` desde el byte `start`.
+    Con `complete` se excluye una última línea sin salto de línea (a medio escribir).
+    """
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size <= start:
+            return []
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if complete:
+                size = mm.rfind(b"\n", start) + 1
+            ranges = []
+            while start < size:
+                end = min(start + chunk_size, size)
+                if end < size:
+                    newline = mm.find(b"\n", end - 1, size)
+                    end = size if newline == -1 else newline + 1
+                ranges.append((start, end))
+                start = end
+    return ranges
+
+
+def _tasks(path: Path, chunk_size: int, start: int, complete: bool) -> Tuple[Callable, List[Tuple[int, tuple]], int]:
+    """Función de los procesos, (byte final, argumentos) de cada tarea y bytes en total."""
+    if path.suffix in CODECS.values():
+        blocks = [(n, block) for n, block in enumerate(load_index(path)) if block["offset"] >= start]
+        tasks = []
+        for i in range(0, len(blocks), BLOCKS_PER_TASK):
+            group = blocks[i : i + BLOCKS_PER_TASK]
+            end = group[-1][1]["offset"] + group[-1][1]["length"]
+            tasks.append((end, ([n for n, _ in group],)))
+        return _parse_blocks, tasks, sum(block["length"] for _, block in blocks)
+    ranges = line_ranges(path, chunk_size, start, complete)
+    return _parse_range, [(end, (begin, end)) for begin, end in ranges], sum(end - begin for begin, end in ranges)
+
+
+def iter_parsed(
+    path: Path,
+    transform: Optional[Transform] = None,
+    workers: Optional[int] = None,
+    start: int = 0,
+    complete: bool = False,
+    chunk_size: int = PARSE_CHUNK,
+) -> Iterator[Tuple[int, List[Any]]]:
+    """
+    Decodifica `path` (JSONL plano o comprimido por bloques) desde el byte
+    `start` y entrega, tramo a tramo y en orden, `(byte final del tramo,
+    resultados)`: un resultado por línea, `transform(mensaje)` o el mensaje
+    (None si la línea no es válida).
+
+    `transform` debe ser una función de nivel de módulo (o un `partial` de
+    una) para poder enviarla a los procesos. Con `workers` <= 1 o un archivo
+    pequeño todo se hace en este proceso. Con `complete` se ignora una última
+    línea a medio escribir (solo en JSONL plano).
+    """
+    path = Path(path)
+    parse, tasks, total = _tasks(path, chunk_size, start, complete)
+    workers = default_workers() if workers is None else workers
+    if workers <= 1 or len(tasks) < 2 or total < MIN_PARALLEL_BYTES:
+        for end, args in tasks:
+            yield end, parse(str(path), *args, transform)
+        return
+    # "spawn" también en Linux: copiar con fork un proceso con hilos (el visor) no es seguro.
+    context = multiprocessing.get_context("spawn")
+    workers = min(workers, len(tasks))
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        # Como mucho dos tramos por proceso en vuelo: la memoria no depende del tamaño del archivo.
+        pending: deque = deque()
+        queued = iter(tasks)
+        try:
+            for end, args in queued:
+                pending.append((end, pool.submit(parse, str(path), *args, transform)))
+                if len(pending) >= workers * 2:
+                    break
+            while pending:
+                end, future = pending.popleft()
+                for next_end, args in queued:
+                    pending.append((next_end, pool.submit(parse, str(path), *args, transform)))
+                    break
+                yield end, future.result()
+        finally:
+            for _, future in pending:
+                future.cancel()
+
+
+def iter_objects(path: Path, transform: Optional[Transform] = None, workers: Optional[int] = None) -> Iterator[Any]:
+    """Como `iter_parsed`, pero un resultado por línea."""
+    for _, results in iter_parsed(path, transform, workers):
+        yield from results
@@ -24,6 +24,10 @@ Window {
     property color backgroundColor: "#0b1422"
     property real backgroundOpacity: 1.0
     property var backgroundPalette: ["#0b1422", "#0f1d2f", "#111c2d", "#1b2435", "#22324c"]
+    property var chatsModel: []
+    property var globalHits: []
+    property string globalQuery: ""
+    property bool globalSearching: false
 
     Rectangle {
         anchors.fill: parent
@@ -59,8 +63,14 @@ Window {
                         font.bold: true
                         Layout.fillWidth: true
                     }
-                    Label { text: "Total: " + messageModel.totalCount(); color: "#8fc1ff" }
-                    Label { text: "Filtrados: " + messageModel.filteredCount(); color: "#8fc1ff" }
+                    Label { text: "Total: " + messageModel.total; color: "#8fc1ff" }
+                    Label { text: "Filtrados: " + messageModel.filtered; color: "#8fc1ff" }
+                    BusyIndicator {
+                        running: messageModel.filtering
+                        visible: running
+                        Layout.preferredWidth: 24
+                        Layout.preferredHeight: 24
+                    }
                     ToolButton {
                         id: settingsBtn
                         text: "\u2699"
@@ -85,27 +95,36 @@ Window {
                         spacing: 8
                         TextField {
                             id: textFilter
-                            placeholderText: "Buscar en mensaje"
+                            placeholderText: "Buscar en mensaje (palabras o \"frase exacta\")"
                             Layout.fillWidth: true
-                            onTextChanged: applyFilters()
+                            onTextChanged: scheduleFilters()
                             background: Rectangle { radius: 8; color: "#0f1d2f"; border.color: "#1f3250" }
                             color: "#e6edf7"
                             placeholderTextColor: "#5f6f8c"
                         }
                         TextField {
                             id: senderFilter
-                            placeholderText: "Sender ID"
+                            placeholderText: "Remitente (id o nombre)"
                             Layout.preferredWidth: 150
-                            onTextChanged: applyFilters()
+                            onTextChanged: scheduleFilters()
                             background: Rectangle { radius: 8; color: "#0f1d2f"; border.color: "#1f3250" }
                             color: "#e6edf7"
                             placeholderTextColor: "#5f6f8c"
                         }
                         TextField {
                             id: dateFilter
-                            placeholderText: "YYYY-MM-DD"
-                            Layout.preferredWidth: 140
-                            onTextChanged: applyFilters()
+                            placeholderText: "Fecha o desde..hasta"
+                            Layout.preferredWidth: 180
+                            onTextChanged: scheduleFilters()
+                            background: Rectangle { radius: 8; color: "#0f1d2f"; border.color: "#1f3250" }
+                            color: "#e6edf7"
+                            placeholderTextColor: "#5f6f8c"
+                        }
+                        TextField {
+                            id: jumpField
+                            placeholderText: "Ir a fecha"
+                            Layout.preferredWidth: 120
+                            onAccepted: jumpToDate(text)
                             background: Rectangle { radius: 8; color: "#0f1d2f"; border.color: "#1f3250" }
                             color: "#e6edf7"
                             placeholderTextColor: "#5f6f8c"
@@ -123,6 +142,18 @@ Window {
                                 leftPadding: 8
                             }
                         }
+                        CheckBox {
+                            id: relevanceCheck
+                            text: "Relevancia"
+                            checked: false
+                            onCheckedChanged: messageModel.setSortByRelevance(checked)
+                            contentItem: Text {
+                                text: relevanceCheck.text
+                                color: "#e6edf7"
+                                verticalAlignment: Text.AlignVCenter
+                                leftPadding: relevanceCheck.indicator.width + 6
+                            }
+                        }
                     }
 
                     RowLayout {
@@ -141,6 +172,27 @@ Window {
                         Button { text: "Refrescar lista"; onClicked: { if (chatLoader) chatLoader.refreshChats(); } }
                     }
 
+                    RowLayout {
+                        spacing: 8
+                        Layout.fillWidth: true
+                        TextField {
+                            id: globalField
+                            placeholderText: "Buscar en todos los chats y temas de la carpeta base"
+                            Layout.fillWidth: true
+                            onAccepted: searchAllChats()
+                            background: Rectangle { radius: 8; color: "#0f1d2f"; border.color: "#1f3250" }
+                            color: "#e6edf7"
+                            placeholderTextColor: "#5f6f8c"
+                        }
+                        BusyIndicator {
+                            running: globalSearching
+                            visible: running
+                            Layout.preferredWidth: 24
+                            Layout.preferredHeight: 24
+                        }
+                        Button { text: "Buscar en todo"; onClicked: searchAllChats() }
+                    }
+
                     RowLayout {
                         spacing: 8
                         Layout.fillWidth: true
@@ -178,15 +230,24 @@ Window {
                                 anchors.verticalCenter: parent.verticalCenter
                                 anchors.left: parent.left
                                 anchors.leftMargin: 8
-                                text: model.title
+                                text: modelData.title
                                 color: "#e6edf7"
                             }
+                            Text {
+                                anchors.verticalCenter: parent.verticalCenter
+                                anchors.right: parent.right
+                                anchors.rightMargin: 8
+                                text: modelData.messages + " msgs"
+                                    + (modelData.last_date ? " · " + modelData.last_date.substring(0, 10) : "")
+                                    + (modelData.has_media ? " · media" : "")
+                                color: "#8fc1ff"
+                            }
                             MouseArea {
                                 anchors.fill: parent
                                 onClicked: {
                                     chatsList.currentIndex = index;
                                     if (chatLoader) {
-                                        chatLoader.loadChat(model.path);
+                                        chatLoader.loadChat(modelData.path);
                                     }
                                 }
                             }
@@ -196,6 +257,65 @@ Window {
             }
         }
 
+        // Mensajes por día, mes o año: clic para ir a ese periodo, clic derecho para filtrarlo.
+        Item {
+            id: timelineBar
+            Layout.fillWidth: true
+            Layout.preferredHeight: 64
+            visible: buckets.length > 1
+            property var buckets: messageModel.timeline
+            property int maxCount: buckets.reduce(function(m, b) { return Math.max(m, b.count); }, 1)
+
+            Row {
+                id: timelineBars
+                anchors.fill: parent
+                anchors.bottomMargin: 16
+                Repeater {
+                    model: timelineBar.buckets
+                    delegate: Item {
+                        width: timelineBars.width / timelineBar.buckets.length
+                        height: timelineBars.height
+                        Rectangle {
+                            anchors.bottom: parent.bottom
+                            anchors.horizontalCenter: parent.horizontalCenter
+                            width: Math.max(1, parent.width - 2)
+                            height: modelData.count > 0 ? Math.max(2, parent.height * modelData.count / timelineBar.maxCount) : 0
+                            radius: 2
+                            color: barArea.containsMouse ? "#8fc1ff" : "#3c5a82"
+                        }
+                        MouseArea {
+                            id: barArea
+                            anchors.fill: parent
+                            hoverEnabled: true
+                            acceptedButtons: Qt.LeftButton | Qt.RightButton
+                            ToolTip.visible: containsMouse
+                            ToolTip.text: modelData.period + ": " + modelData.count + " mensajes"
+                            onClicked: function(mouse) {
+                                if (mouse.button === Qt.RightButton)
+                                    dateFilter.text = modelData.period;
+                                else
+                                    jumpToDate(modelData.period);
+                            }
+                        }
+                    }
+                }
+            }
+            Text {
+                anchors.left: parent.left
+                anchors.bottom: parent.bottom
+                text: timelineBar.buckets.length ? timelineBar.buckets[0].period : ""
+                color: "#5f6f8c"
+                font.pixelSize: 11
+            }
+            Text {
+                anchors.right: parent.right
+                anchors.bottom: parent.bottom
+                text: timelineBar.buckets.length ? timelineBar.buckets[timelineBar.buckets.length - 1].period : ""
+                color: "#5f6f8c"
+                font.pixelSize: 11
+            }
+        }
+
         ListView {
             id: listView
             Layout.fillWidth: true
@@ -207,7 +327,9 @@ Window {
             ScrollBar.vertical: ScrollBar { policy: ScrollBar.AsNeeded }
 
             delegate: Item {
+                id: messageItem
                 width: listView.width
+                property bool isCurrent: ListView.isCurrentItem
                 property bool hasContent: (message && message.length > 0) || (hasMediaDir && media_abs)
                 visible: hasContent
                 height: hasContent ? bubble.implicitHeight : 0
@@ -217,7 +339,9 @@ Window {
                     anchors.horizontalCenter: parent.horizontalCenter
                     radius: 14
                     color: "#16243a"
-                    border.color: "#2e4b70"
+                    // Resalta el mensaje abierto desde la búsqueda global.
+                    border.color: messageItem.isCurrent ? "#8fc1ff" : "#2e4b70"
+                    border.width: messageItem.isCurrent ? 2 : 1
                     width: Math.min(listView.width * 0.85, 900)
                     implicitHeight: contentColumn.implicitHeight + 20
 
@@ -232,7 +356,7 @@ Window {
                             width: parent.width
                             spacing: 8
                             Text {
-                                text: sender ? ("Sender: " + sender) : "Sender: (desconocido)"
+                                text: "Sender: " + senderLabel(sender, sender_name)
                                 color: "#d8e6ff"
                                 font.bold: true
                                 wrapMode: Text.NoWrap
@@ -262,7 +386,7 @@ Window {
                                 }
                                 Timer { id: copyReset; interval: 1200; repeat: false; running: false; onTriggered: copyBtn.copied = false }
                                 onClicked: {
-                                    copyMessage(sender, date_display, time_display, message, media_file, media_abs);
+                                    copyMessage(senderLabel(sender, sender_name), date_display, time_display, message, media_file, media_abs);
                                     copyBtn.copied = true;
                                     copyReset.restart();
                                 }
@@ -287,23 +411,67 @@ Window {
                             color: "#22324c"
                             border.color: "#30486b"
                             width: parent.width
-                            implicitHeight: mediaRow.implicitHeight + 14
-                            Row {
-                                id: mediaRow
+                            implicitHeight: mediaColumn.implicitHeight + 14
+                            Column {
+                                id: mediaColumn
                                 anchors.fill: parent
                                 anchors.margins: 8
-                                spacing: 12
-                                Text {
-                                    id: mediaText
-                                    text: "Archivo: " + media_file
-                                    color: "#8fc1ff"
-                                    wrapMode: Text.Wrap
-                                    width: parent.width - openBtn.implicitWidth - 20
+                                spacing: 8
+
+                                // Vista previa: la miniatura se genera en segundo plano (thumbnails.py).
+                                // Alto fijo para que la lista no salte mientras se cargan.
+                                Item {
+                                    visible: media_preview !== "" && preview.status !== Image.Error
+                                    width: Math.min(parent.width, 320)
+                                    height: visible ? 240 : 0
+                                    Image {
+                                        id: preview
+                                        anchors.fill: parent
+                                        source: media_preview ? "image://thumbs/" + encodeURIComponent(media_abs) : ""
+                                        sourceSize.width: 320
+                                        sourceSize.height: 240
+                                        asynchronous: true
+                                        cache: false
+                                        fillMode: Image.PreserveAspectFit
+                                        horizontalAlignment: Image.AlignLeft
+                                    }
+                                    BusyIndicator {
+                                        anchors.centerIn: parent
+                                        running: preview.status === Image.Loading
+                                        visible: running
+                                    }
+                                    Text {
+                                        anchors.centerIn: parent
+                                        visible: media_preview === "video" && preview.status === Image.Ready
+                                        text: "\u25B6"
+                                        color: "white"
+                                        style: Text.Outline
+                                        styleColor: "#80000000"
+                                        font.pixelSize: 40
+                                    }
+                                    MouseArea {
+                                        anchors.fill: parent
+                                        cursorShape: Qt.PointingHandCursor
+                                        onClicked: Qt.openUrlExternally("file:///" + media_abs.replace(/\\/g, "/"))
+                                    }
                                 }
-                                Button {
-                                    id: openBtn
-                                    text: "Abrir"
-                                    onClicked: Qt.openUrlExternally("file:///" + media_abs.replace(/\\/g, "/"))
+
+                                Row {
+                                    id: mediaRow
+                                    width: parent.width
+                                    spacing: 12
+                                    Text {
+                                        id: mediaText
+                                        text: "Archivo: " + media_file
+                                        color: "#8fc1ff"
+                                        wrapMode: Text.Wrap
+                                        width: parent.width - openBtn.implicitWidth - 20
+                                    }
+                                    Button {
+                                        id: openBtn
+                                        text: "Abrir"
+                                        onClicked: Qt.openUrlExternally("file:///" + media_abs.replace(/\\/g, "/"))
+                                    }
                                 }
                             }
                         }
@@ -313,13 +481,68 @@ Window {
         }
     }
 
+    // Espera a que el usuario deje de escribir antes de relanzar el filtrado.
+    Timer {
+        id: filterDebounce
+        interval: 150
+        repeat: false
+        onTriggered: applyFilters()
+    }
+
+    function scheduleFilters() {
+        filterDebounce.restart();
+    }
+
     function applyFilters() {
+        filterDebounce.stop();
+        listView.currentIndex = -1;
         let mediaVal = "";
         if (mediaCombo.currentIndex === 1) mediaVal = "media";
         else if (mediaCombo.currentIndex === 2) mediaVal = "nomedia";
         messageModel.applyFilters(textFilter.text, senderFilter.text, dateFilter.text, mediaVal);
     }
 
+    function searchAllChats() {
+        if (!chatLoader) return;
+        globalQuery = globalField.text.trim();
+        globalSearching = globalQuery.length > 0;
+        chatLoader.searchAll(globalQuery);
+    }
+
+    function jumpToDate(date) {
+        let pos = messageModel.jumpToDate(date);
+        if (pos < 0) {
+            showToast("No hay mensajes para esa fecha");
+            return;
+        }
+        listView.currentIndex = pos;
+        listView.positionViewAtIndex(pos, ListView.Beginning);
+    }
+
+    function openGlobalHit(hit) {
+        globalPopup.close();
+        // Sin filtros, para que el mensaje esté en la lista.
+        textFilter.text = "";
+        senderFilter.text = "";
+        dateFilter.text = "";
+        mediaCombo.currentIndex = 0;
+        filterDebounce.stop();
+        if (!chatLoader.loadChat(hit.path)) {
+            showToast("No se pudo abrir el chat");
+            return;
+        }
+        let pos = messageModel.revealRow(hit.row);
+        if (pos >= 0) {
+            listView.currentIndex = pos;
+            listView.positionViewAtIndex(pos, ListView.Center);
+        }
+    }
+
+    function senderLabel(sender, name) {
+        if (!sender) return "(desconocido)";
+        return name ? name + " (" + sender + ")" : String(sender);
+    }
+
     function copyMessage(sender, date_display, time_display, message, media_file, media_abs) {
         let parts = [];
         if (sender) parts.push("Sender: " + sender);
@@ -400,6 +623,70 @@ Window {
         }
     }
 
+    Popup {
+        id: globalPopup
+        x: (parent.width - width) / 2
+        y: topColumn.height + 30
+        width: Math.min(parent.width - 40, 900)
+        height: Math.min(parent.height - y - 20, 520)
+        padding: 12
+        background: Rectangle { color: "#111c2d"; radius: 10; border.color: "#1d2f49" }
+
+        contentItem: ColumnLayout {
+            spacing: 8
+            Label {
+                text: globalHits.length
+                    ? globalHits.length + " resultados para \u00ab" + globalQuery + "\u00bb"
+                    : "Sin resultados para \u00ab" + globalQuery + "\u00bb"
+                color: "white"
+                font.pixelSize: 14
+            }
+            ListView {
+                id: globalList
+                Layout.fillWidth: true
+                Layout.fillHeight: true
+                clip: true
+                spacing: 6
+                model: globalHits
+                ScrollBar.vertical: ScrollBar { policy: ScrollBar.AsNeeded }
+                delegate: Rectangle {
+                    width: globalList.width
+                    implicitHeight: hitColumn.implicitHeight + 12
+                    radius: 6
+                    color: hitArea.containsMouse ? "#1f2f48" : "#16243a"
+                    Column {
+                        id: hitColumn
+                        anchors.left: parent.left
+                        anchors.right: parent.right
+                        anchors.top: parent.top
+                        anchors.margins: 6
+                        spacing: 2
+                        Text {
+                            width: parent.width
+                            text: modelData.title + " \u00b7 " + modelData.date + " " + modelData.time
+                                + (modelData.sender ? " \u00b7 " + senderLabel(modelData.sender, modelData.sender_name) : "")
+                            color: "#8fc1ff"
+                            elide: Text.ElideRight
+                        }
+                        Text {
+                            width: parent.width
+                            text: modelData.snippet
+                            textFormat: Text.StyledText
+                            color: "#e6edf7"
+                            wrapMode: Text.Wrap
+                        }
+                    }
+                    MouseArea {
+                        id: hitArea
+                        anchors.fill: parent
+                        hoverEnabled: true
+                        onClicked: openGlobalHit(modelData)
+                    }
+                }
+            }
+        }
+    }
+
     Rectangle {
         id: toast
         visible: false
@@ -431,6 +718,32 @@ Window {
         onTriggered: { toast.opacity = 0; toast.visible = false }
     }
 
+    Connections {
+        target: chatLoader
+        function onChatsUpdated(chats) { chatsModel = chats; }
+        function onGlobalResults(query, results) {
+            globalSearching = false;
+            globalHits = results;
+            if (query.length > 0) globalPopup.open();
+        }
+        function onGlobalSearchFailed(query) {
+            globalSearching = false;
+            showToast("No se pudo buscar en todos los chats");
+        }
+    }
+
+    Connections {
+        target: messageModel
+        // Mensaje de la búsqueda global que aún no estaba en la lista al abrir el chat.
+        function onRowRevealed(pos) {
+            if (pos < 0) return;
+            listView.currentIndex = pos;
+            listView.positionViewAtIndex(pos, ListView.Center);
+        }
+    }
+
+    Component.onCompleted: if (chatLoader) chatLoader.refreshChats()
+
     Connections {
         target: clipboardHelper
         function onCopied() { showToast("Copiado"); }
@@ -0,0 +1,150 @@
+"""
+Planificador central de peticiones a Telegram.
+
+Los exportadores hacen cuatro tipos de petición: páginas de historial
+(`iter_messages`), descargas (`download_media`), listas de temas
+(`GetForumTopicsRequest`) y peticiones sueltas (la lista de chats, resolver
+un chat). Telegram limita cada método por separado, así que
+un FloodWait solo pausa las peticiones de su tipo: si el historial tiene que
+esperar, las descargas pendientes de todos los chats siguen su curso, y al
+revés.
+
+Cada tipo tiene además un cupo de peticiones simultáneas que se ajusta solo
+(sube de uno en uno tras una racha sin FloodWait, se reduce a la mitad con
+cada uno). El historial se pide por tramos cuyo tamaño y pausa entre páginas
+(`wait_time` de Telethon) también se adaptan, y cada tramo vuelve a pasar por
+el cupo, de modo que varios chats se turnan en lugar de acaparar Telegram.
+"""
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict
+
+FLOOD_WAIT_MARGIN = 1.0
+KINDS = ("history", "download", "topics", "other")
+KIND_NAMES = {"history": "historial", "download": "descargas", "topics": "temas", "other": "otras"}
+# Peticiones seguidas sin FloodWait antes de subir el ritmo un escalón.
+INCREASE_AFTER = 20
+
+HISTORY_PAGE = 100
+MIN_HISTORY_CHUNK = HISTORY_PAGE
+MAX_HISTORY_CHUNK = 3000
+DEFAULT_HISTORY_CHUNK = 1000
+# Pausa mínima entre páginas tras el primer FloodWait y su máximo.
+MIN_HISTORY_DELAY = 0.5
+MAX_HISTORY_DELAY = 10.0
+
+
+class AdaptiveLimit:
+    """Semáforo cuyo cupo puede cambiar mientras hay tareas dentro."""
+
+    def __init__(self, maximum: int) -> None:
+        self.maximum = max(1, maximum)
+        self.limit = self.maximum
+        self.active = 0
+        self._changed = asyncio.Condition()
+
+    async def acquire(self) -> None:
+        async with self._changed:
+            await self._changed.wait_for(lambda: self.active < self.limit)
+            self.active += 1
+
+    async def release(self) -> None:
+        async with self._changed:
+            self.active -= 1
+            self._changed.notify_all()
+
+    def decrease(self) -> None:
+        self.limit = max(1, self.limit // 2)
+
+    async def increase(self) -> None:
+        if self.limit < self.maximum:
+            async with self._changed:
+                self.limit += 1
+                self._changed.notify_all()
+
+
+class RequestScheduler:
+    """
+    Pausas por FloodWait y cupos adaptativos por tipo de petición.
+
+    `max_downloads` es el máximo de descargas simultáneas entre todos los chats
+    y `max_history` el de chats pidiendo historial a la vez.
+    """
+
+    def __init__(self, max_downloads: int = 4, max_history: int = 1, max_topics: int = 1) -> None:
+        self._until: Dict[str, float] = {kind: 0.0 for kind in KINDS}
+        self._limits = {
+            "history": AdaptiveLimit(max_history),
+            "download": AdaptiveLimit(max_downloads),
+            "topics": AdaptiveLimit(max_topics),
+            "other": AdaptiveLimit(1),
+        }
+        self._streak: Dict[str, int] = {kind: 0 for kind in KINDS}
+        self.waits: Dict[str, float] = {kind: 0.0 for kind in KINDS}
+        self.floods: Dict[str, int] = {kind: 0 for kind in KINDS}
+        self.history_chunk = DEFAULT_HISTORY_CHUNK
+        # 0 = sin pausa entre páginas (Telethon pondría 1 s en historiales largos).
+        self.history_delay = 0.0
+
+    @property
+    def total_wait(self) -> float:
+        """Segundos en pausa por FloodWait, sumados por tipo de petición."""
+        return sum(self.waits.values())
+
+    def limit(self, kind: str) -> int:
+        return self._limits[kind].limit
+
+    async def wait(self, kind: str) -> None:
+        """Espera a que venza el FloodWait de `kind`, si lo hay."""
+        loop = asyncio.get_running_loop()
+        while True:
+            delay = self._until[kind] - loop.time()
+            if delay <= 0:
+                return
+            await asyncio.sleep(delay)
+
+    @asynccontextmanager
+    async def slot(self, kind: str) -> AsyncIterator[None]:
+        """Espera el FloodWait de `kind` y ocupa un lugar de su cupo."""
+        await self.wait(kind)
+        limit = self._limits[kind]
+        await limit.acquire()
+        try:
+            yield
+        finally:
+            await limit.release()
+
+    def flood(self, kind: str, seconds: float) -> None:
+        """Registra un FloodWait: pausa `kind` y reduce su ritmo."""
+        loop = asyncio.get_running_loop()
+        until = loop.time() + seconds + FLOOD_WAIT_MARGIN
+        if until > self._until[kind]:
+            self.waits[kind] += until - max(self._until[kind], loop.time())
+            self._until[kind] = until
+        self.floods[kind] += 1
+        self._streak[kind] = 0
+        self._limits[kind].decrease()
+        if kind == "history":
+            self.history_chunk = max(MIN_HISTORY_CHUNK, self.history_chunk // 2)
+            self.history_delay = min(MAX_HISTORY_DELAY, max(MIN_HISTORY_DELAY, self.history_delay * 2))
+        detail = f"cupo {self._limits[kind].limit}"
+        if kind == "history":
+            detail += f", tramos de {self.history_chunk}, pausa {self.history_delay:g}s"
+        print(f"  ! FloodWait ({KIND_NAMES[kind]}): Telegram pide esperar {seconds}s; {detail}")
+
+    async def success(self, kind: str, requests: int = 1) -> None:
+        """Anota peticiones sin FloodWait; tras una racha, sube el ritmo un escalón."""
+        self._streak[kind] += requests
+        if self._streak[kind] < INCREASE_AFTER:
+            return
+        self._streak[kind] = 0
+        await self._limits[kind].increase()
+        if kind == "history":
+            self.history_chunk = min(MAX_HISTORY_CHUNK, self.history_chunk * 2)
+            self.history_delay = self.history_delay / 2 if self.history_delay > MIN_HISTORY_DELAY else 0.0
+
+    def summary(self) -> str:
+        parts = [
+            f"{KIND_NAMES[kind]} {self.waits[kind]:.0f}s ({self.floods[kind]})" for kind in KINDS if self.floods[kind]
+        ]
+        return ", ".join(parts)
@@ -0,0 +1,451 @@
+#!/usr/bin/env python
+"""
+Índice de texto completo (SQLite FTS5) para los mensajes exportados.
+
+Se guarda junto a `messages.jsonl` (`messages.fts.sqlite`) y solo se reconstruye
+cuando el archivo cambia: si únicamente creció se indexan las líneas nuevas.
+Cada fila indexada conserva su número de línea, que es también el número de
+fila de `viewer.MessageIndex`.
+
+La búsqueda global del visor usa un único índice de todos los chats y temas
+del respaldo (`search.fts.sqlite` en la carpeta base, ver `GlobalSearch`), que
+se pone al día de la misma forma. Para crearlo o actualizarlo sin el visor:
+
+  python search_index.py "C:\\Users\\Administrador\\Desktop\\TelegramBackups" [consulta]
+
+Sintaxis de búsqueda: palabras sueltas (coinciden como prefijo, "cur" encuentra
+"curso"), todas obligatorias, y frases exactas entre comillas.
+"""
+import argparse
+import hashlib
+import re
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from block_jsonl import find_block_file
+from catalog import catalog_chats, load_catalog, refresh_catalog
+from parallel_jsonl import iter_parsed
+
+INDEX_NAME = "messages.fts.sqlite"
+GLOBAL_INDEX_NAME = "search.fts.sqlite"
+HEAD_BYTES = 4096
+INSERT_BATCH = 2000
+GLOBAL_RESULTS = 200
+SNIPPET_TOKENS = 16
+# Resultados leídos de una vez del cursor; entre tandas se comprueba la cancelación.
+SEARCH_FETCH = 2000
+# Cada cuántas instrucciones de SQLite se comprueba la cancelación durante la consulta.
+CANCEL_CHECK_STEPS = 10000
+# Marcas del fragmento resaltado; el visor las convierte en negrita.
+HIGHLIGHT_START = "\x02"
+HIGHLIGHT_END = "\x03"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sources (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    size INTEGER NOT NULL DEFAULT 0,
+    mtime REAL NOT NULL DEFAULT 0,
+    head TEXT NOT NULL DEFAULT '',
+    indexed_bytes INTEGER NOT NULL DEFAULT 0,
+    rows INTEGER NOT NULL DEFAULT 0
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS fts USING fts5(
+    message,
+    source_id UNINDEXED,
+    row_no UNINDEXED,
+    msg_id UNINDEXED,
+    sender_id UNINDEXED,
+    date UNINDEXED,
+    media_file UNINDEXED,
+    tokenize = 'unicode61 remove_diacritics 2'
+);
+"""
+
+_PHRASE_RE = re.compile(r'"([^"]*)"|(\S+)')
+
+
+class SearchHit(NamedTuple):
+    source: str
+    row_no: int
+    msg_id: Optional[int]
+    sender_id: Optional[int]
+    date: Optional[str]
+    media_file: Optional[str]
+    rank: float
+    snippet: Optional[str] = None
+
+
+def chat_index_path(messages_path: Path) -> Path:
+    return messages_path.with_name(INDEX_NAME)
+
+
+def fts_query(text: str) -> str:
+    """
+    Traduce lo que escribe el usuario a una expresión MATCH de FTS5.
+
+    Cada palabra se cita (así los signos no rompen la sintaxis) y lleva `*`
+    para buscar por prefijo; lo que va entre comillas se busca como frase.
+    """
+    terms = []
+    for phrase, word in _PHRASE_RE.findall(text):
+        if phrase.strip():
+            terms.append('"' + phrase.replace('"', "") + '"')
+        elif word:
+            cleaned = word.replace('"', "")
+            if cleaned:
+                terms.append('"' + cleaned + '"*')
+    return " AND ".join(terms)
+
+
+def substring_text(text: str) -> str:
+    """
+    Texto que se busca como substring cuando no hay índice: una consulta
+    `"frase exacta"` se busca sin las comillas (también con la de cierre aún
+    sin escribir).
+    """
+    if text.startswith('"') and '"' not in text[1:-1]:
+        return text[1:-1] if len(text) > 1 and text.endswith('"') else text[1:]
+    return text
+
+
+def _fts_fields(obj: Optional[Dict[str, Any]]) -> Optional[Tuple]:
+    """Campos que se indexan de un mensaje (None si no tiene texto); corre en los procesos de `parallel_jsonl`."""
+    if not obj or not obj.get("message"):
+        return None
+    return (obj["message"], obj.get("id"), obj.get("sender_id"), obj.get("date"), obj.get("media_file"))
+
+
+def _file_head(path: Path) -> str:
+    with path.open("rb") as f:
+        return hashlib.sha1(f.read(HEAD_BYTES)).hexdigest()
+
+
+class SearchIndex:
+    """
+    Índice FTS5 de uno o varios `messages.jsonl`.
+
+    Cada hilo usa su propia conexión, así que se puede actualizar en segundo
+    plano mientras otro hilo consulta (la base va en modo WAL). Los archivos
+    grandes se decodifican en `workers` procesos (ver `parallel_jsonl.py`).
+    """
+
+    def __init__(self, db_path: Path, workers: Optional[int] = None) -> None:
+        self.db_path = Path(db_path)
+        self.workers = workers
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        conn = self._conn()
+        conn.executescript(SCHEMA)
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.db_path), timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _source(self, messages_path: Path) -> Optional[tuple]:
+        return self._conn().execute(
+            "SELECT id, size, mtime, head, indexed_bytes, rows FROM sources WHERE path = ?", (str(messages_path),)
+        ).fetchone()
+
+    def is_current(self, messages_path: Path) -> bool:
+        """True si el índice ya cubre el archivo tal como está en disco."""
+        row = self._source(messages_path)
+        if row is None or not messages_path.exists():
+            return False
+        stat = messages_path.stat()
+        return row[1] == stat.st_size and row[2] == stat.st_mtime
+
+    def update(self, messages_path: Path) -> int:
+        """
+        Indexa lo que falte de `messages_path` (`messages.jsonl` o su versión
+        comprimida por bloques); devuelve cuántas líneas se añadieron.
+        """
+        messages_path = Path(messages_path)
+        with self._write_lock:
+            conn = self._conn()
+            stat = messages_path.stat()
+            head = _file_head(messages_path)
+            row = self._source(messages_path)
+            if row is not None and row[1] == stat.st_size and row[2] == stat.st_mtime:
+                return 0
+            if row is None:
+                cur = conn.execute("INSERT INTO sources (path) VALUES (?)", (str(messages_path),))
+                source_id, start, row_no = cur.lastrowid, 0, 0
+            else:
+                source_id, start, row_no = row[0], row[4], row[5]
+                # Si el archivo se reescribió (cambió el principio o encogió) se rehace entero.
+                if stat.st_size < start or row[3] != head:
+                    conn.execute("DELETE FROM fts WHERE source_id = ?", (source_id,))
+                    start, row_no = 0, 0
+            first_row = row_no
+            start, row_no = self._index_file(conn, messages_path, source_id, start, row_no)
+            conn.execute(
+                "UPDATE sources SET size = ?, mtime = ?, head = ?, indexed_bytes = ?, rows = ? WHERE id = ?",
+                (stat.st_size, stat.st_mtime, head, start, row_no, source_id),
+            )
+            conn.commit()
+            return row_no - first_row
+
+    def _index_file(
+        self, conn: sqlite3.Connection, messages_path: Path, source_id: int, start: int, row_no: int
+    ) -> Tuple[int, int]:
+        """
+        Indexa desde el byte `start` (bloques completos si está comprimido);
+        devuelve el nuevo (byte, fila). Una última línea a medio escribir se
+        deja para la próxima actualización.
+        """
+        batch: list = []
+        for start, results in iter_parsed(messages_path, _fts_fields, self.workers, start, complete=True):
+            for fields in results:
+                if fields is not None:
+                    message, msg_id, sender_id, date, media_file = fields
+                    batch.append((message, source_id, row_no, msg_id, sender_id, date, media_file))
+                    if len(batch) >= INSERT_BATCH:
+                        self._insert(conn, batch)
+                row_no += 1
+        self._insert(conn, batch)
+        return start, row_no
+
+    def sources(self) -> List[str]:
+        """Rutas de los archivos indexados."""
+        return [row[0] for row in self._conn().execute("SELECT path FROM sources")]
+
+    def remove(self, messages_path: Path) -> None:
+        """Quita del índice un archivo que ya no existe."""
+        with self._write_lock:
+            conn = self._conn()
+            row = self._source(messages_path)
+            if row is None:
+                return
+            conn.execute("DELETE FROM fts WHERE source_id = ?", (row[0],))
+            conn.execute("DELETE FROM sources WHERE id = ?", (row[0],))
+            conn.commit()
+
+    @staticmethod
+    def _insert(conn: sqlite3.Connection, batch: list) -> None:
+        if batch:
+            conn.executemany(
+                "INSERT INTO fts (message, source_id, row_no, msg_id, sender_id, date, media_file) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                batch,
+            )
+            batch.clear()
+
+    def search(
+        self,
+        text: str,
+        messages_path: Optional[Path] = None,
+        limit: Optional[int] = None,
+        ranked: bool = True,
+        snippets: bool = False,
+    ) -> List[SearchHit]:
+        """
+        Mensajes que cumplen la consulta. Con `ranked` van de más a menos
+        relevante (bm25); sin él se evita calcular la puntuación y salen en
+        orden de archivo. Con `snippets` cada resultado trae el fragmento del
+        texto que coincide, con las palabras entre `HIGHLIGHT_START`/`HIGHLIGHT_END`.
+        """
+        return list(self.iter_search(text, messages_path, limit, ranked, snippets))
+
+    def iter_search(
+        self,
+        text: str,
+        messages_path: Optional[Path] = None,
+        limit: Optional[int] = None,
+        ranked: bool = True,
+        snippets: bool = False,
+        cancelled: Optional[threading.Event] = None,
+    ) -> Iterator[SearchHit]:
+        """
+        Como `search`, pero lee los resultados por tandas. Con `cancelled`
+        activado se detiene en cuanto puede, también a mitad de la consulta
+        (p. ej. mientras ordena por relevancia).
+        """
+        match = fts_query(text)
+        if not match:
+            return
+        score = "bm25(fts)" if ranked else "0.0"
+        params: list = []
+        snippet = "NULL"
+        if snippets:
+            snippet = "snippet(fts, 0, ?, ?, '…', ?)"
+            params += [HIGHLIGHT_START, HIGHLIGHT_END, SNIPPET_TOKENS]
+        sql = (
+            f"SELECT s.path, f.row_no, f.msg_id, f.sender_id, f.date, f.media_file, {score} AS score, {snippet} "
+            "FROM fts f JOIN sources s ON s.id = f.source_id WHERE fts MATCH ?"
+        )
+        params.append(match)
+        if messages_path is not None:
+            sql += " AND s.path = ?"
+            params.append(str(messages_path))
+        sql += " ORDER BY score" if ranked else " ORDER BY f.source_id, f.rowid"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
+        conn = self._conn()
+        if cancelled is not None:
+            # Si devuelve True, SQLite interrumpe la consulta (OperationalError).
+            conn.set_progress_handler(cancelled.is_set, CANCEL_CHECK_STEPS)
+        try:
+            cur = conn.execute(sql, params)
+            while not (cancelled is not None and cancelled.is_set()):
+                rows = cur.fetchmany(SEARCH_FETCH)
+                if not rows:
+                    return
+                for row in rows:
+                    yield SearchHit(*row)
+        except sqlite3.OperationalError:
+            # Consulta que FTS5 no acepta (p. ej. solo signos) o cancelada: sin más resultados.
+            return
+        finally:
+            if cancelled is not None:
+                conn.set_progress_handler(None, 0)
+
+    def close(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+class ChatSearch:
+    """
+    Índice de un chat que se pone al día en un hilo aparte.
+
+    Mientras `ready` sea False el visor sigue filtrando recorriendo el archivo.
+    """
+
+    def __init__(self, messages_path: Path) -> None:
+        self.messages_path = Path(messages_path)
+        self.index = SearchIndex(chat_index_path(self.messages_path))
+        self._ready = threading.Event()
+        if self.index.is_current(self.messages_path):
+            self._ready.set()
+        else:
+            threading.Thread(target=self._build, name="fts-index", daemon=True).start()
+
+    def _build(self) -> None:
+        try:
+            self.index.update(self.messages_path)
+        except Exception as e:
+            print(f"search index error: {e}")
+            return
+        self._ready.set()
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    def search(
+        self, text: str, ranked: bool = True, cancelled: Optional[threading.Event] = None
+    ) -> Iterator[SearchHit]:
+        return self.index.iter_search(text, self.messages_path, ranked=ranked, cancelled=cancelled)
+
+
+class GlobalHit(NamedTuple):
+    chat_dir: str
+    title: str
+    row_no: int
+    msg_id: Optional[int]
+    sender_id: Optional[int]
+    date: Optional[str]
+    snippet: str
+
+
+class GlobalSearch:
+    """
+    Índice único de todos los chats y temas de una carpeta de respaldo.
+
+    La lista de chats sale del catálogo (`catalog.py`); cada `update` solo
+    indexa los archivos que cambiaron desde la vez anterior (las líneas nuevas
+    si solo crecieron) y quita los chats que ya no existen. Los respaldos en
+    formato SQLite no se incluyen.
+    """
+
+    def __init__(self, root: Path, workers: Optional[int] = None) -> None:
+        self.root = Path(root).resolve()
+        self.index = SearchIndex(self.root / GLOBAL_INDEX_NAME, workers)
+        self._titles: Dict[str, str] = {}
+
+    def _chats(self, catalog: Dict[str, Any]) -> Dict[Path, str]:
+        """Archivo de mensajes de cada chat del catálogo y su título."""
+        files: Dict[Path, str] = {}
+        for chat in catalog_chats(self.root, catalog):
+            chat_dir = Path(chat["path"])
+            messages_path = chat_dir / "messages.jsonl"
+            if not messages_path.exists():
+                messages_path = find_block_file(chat_dir)
+            if messages_path is not None:
+                files[messages_path] = chat["title"]
+        return files
+
+    def update(self, catalog: Optional[Dict[str, Any]] = None, cancelled: Optional[threading.Event] = None) -> int:
+        """Pone al día el índice; devuelve cuántas líneas se añadieron."""
+        if catalog is None:
+            catalog = refresh_catalog(self.root)
+        files = self._chats(catalog)
+        self._titles = {str(path.parent): title for path, title in files.items()}
+        added = 0
+        for messages_path in files:
+            if cancelled is not None and cancelled.is_set():
+                return added
+            if self.index.is_current(messages_path):
+                continue
+            try:
+                added += self.index.update(messages_path)
+            except (OSError, sqlite3.Error) as e:
+                print(f"search index: no se pudo indexar {messages_path}: {e}")
+        known = {str(path) for path in files}
+        for source in self.index.sources():
+            if source not in known:
+                self.index.remove(Path(source))
+        return added
+
+    def _title(self, chat_dir: str) -> str:
+        if not self._titles:
+            self._titles = {str(path.parent): title for path, title in self._chats(load_catalog(self.root)).items()}
+        return self._titles.get(chat_dir, Path(chat_dir).name)
+
+    def search(self, text: str, limit: int = GLOBAL_RESULTS) -> List[GlobalHit]:
+        """Mensajes de cualquier chat que cumplen la consulta, de más a menos relevante."""
+        hits = []
+        for hit in self.index.search(text, limit=limit, snippets=True):
+            chat_dir = str(Path(hit.source).parent)
+            hits.append(
+                GlobalHit(chat_dir, self._title(chat_dir), hit.row_no, hit.msg_id, hit.sender_id, hit.date, hit.snippet or "")
+            )
+        return hits
+
+    def close(self) -> None:
+        self.index.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Crea o actualiza el índice de búsqueda global de un respaldo.")
+    parser.add_argument("root", type=Path, help="Carpeta base del respaldo (TelegramBackups o TelegramBackupsTopics)")
+    parser.add_argument("query", nargs="?", help="Consulta a buscar después de actualizar el índice")
+    parser.add_argument("--limit", type=int, default=20, help="Resultados a mostrar (por defecto: 20)")
+    parser.add_argument(
+        "--workers", type=int, default=None, help="Procesos para decodificar los JSONL grandes (por defecto: uno por núcleo)"
+    )
+    args = parser.parse_args()
+    search = GlobalSearch(args.root.expanduser(), args.workers)
+    added = search.update()
+    print(f"Índice global: {added} mensajes nuevos ({search.index.db_path})")
+    if args.query:
+        for hit in search.search(args.query, limit=args.limit):
+            snippet = hit.snippet.replace(HIGHLIGHT_START, "[").replace(HIGHLIGHT_END, "]").replace("\n", " ")
+            print(f"{hit.title} | {(hit.date or '')[:16]} | #{hit.msg_id}: {snippet}")
+    search.close()
+
+
+if __name__ == "__main__":
+    main()
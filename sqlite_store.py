@@ -0,0 +1,301 @@
+#!/usr/bin/env python
+"""
+Almacenamiento SQLite de mensajes exportados.
+
+Una sola base de datos por carpeta de respaldo (`backup.sqlite`) con tablas de
+chats, temas, mensajes y multimedia, indexadas por chat, fecha, remitente y
+tipo de multimedia. La usan los exportadores con `--format sqlite` y también
+sirve para convertir exportaciones JSONL ya existentes:
+
+  python sqlite_store.py "C:\\Users\\Administrador\\Desktop\\TelegramBackups"
+"""
+import argparse
+import json
+import sqlite3
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from block_jsonl import find_block_file
+from jsonl_writer import dumps_record
+from parallel_jsonl import iter_objects
+
+DB_NAME = "backup.sqlite"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chats (
+    id INTEGER PRIMARY KEY,
+    title TEXT,
+    entity_type TEXT,
+    path TEXT
+);
+CREATE TABLE IF NOT EXISTS topics (
+    chat_id INTEGER NOT NULL,
+    topic_id INTEGER NOT NULL,
+    title TEXT,
+    messages_count INTEGER,
+    path TEXT,
+    PRIMARY KEY (chat_id, topic_id)
+);
+CREATE TABLE IF NOT EXISTS messages (
+    chat_id INTEGER NOT NULL,
+    topic_id INTEGER NOT NULL DEFAULT 0,
+    id INTEGER NOT NULL,
+    date TEXT,
+    sender_id INTEGER,
+    message TEXT,
+    media_type TEXT,
+    reply_to_msg_id INTEGER,
+    data TEXT NOT NULL,
+    PRIMARY KEY (chat_id, topic_id, id)
+);
+CREATE TABLE IF NOT EXISTS media (
+    chat_id INTEGER NOT NULL,
+    topic_id INTEGER NOT NULL DEFAULT 0,
+    message_id INTEGER NOT NULL,
+    media_type TEXT,
+    file TEXT NOT NULL,
+    PRIMARY KEY (chat_id, topic_id, message_id)
+);
+CREATE INDEX IF NOT EXISTS idx_messages_chat_date ON messages (chat_id, topic_id, date);
+CREATE INDEX IF NOT EXISTS idx_messages_date ON messages (date);
+CREATE INDEX IF NOT EXISTS idx_messages_sender ON messages (sender_id);
+CREATE INDEX IF NOT EXISTS idx_messages_media_type ON messages (media_type);
+CREATE INDEX IF NOT EXISTS idx_media_type ON media (media_type);
+"""
+
+DEFAULT_MAX_RECORDS = 500
+DEFAULT_MAX_DELAY = 2.0
+
+
+class SqliteStore:
+    """
+    Conexión compartida a la base de datos de un respaldo.
+
+    Todos los escritores de una ejecución usan la misma conexión: el event loop
+    es de un solo hilo y cada bloque se confirma sin ceder el control, así que
+    no hay transacciones abiertas compitiendo por el bloqueo.
+    """
+
+    def __init__(self, db_path: Path, fsync: str = "none") -> None:
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.fsync = fsync
+        self.conn = sqlite3.connect(str(self.db_path))
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # Con "flush" cada bloque confirmado llega a disco; si no, basta con WAL + NORMAL.
+        self.conn.execute(f"PRAGMA synchronous={'FULL' if fsync == 'flush' else 'NORMAL'}")
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+
+    def upsert_chat(self, chat_id: int, title: Optional[str], entity_type: Optional[str], path: str) -> None:
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO chats (id, title, entity_type, path) VALUES (?, ?, ?, ?)",
+                (chat_id, title, entity_type, path),
+            )
+
+    def upsert_topic(self, chat_id: int, topic_id: int, title: Optional[str], messages_count: Optional[int], path: str) -> None:
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO topics (chat_id, topic_id, title, messages_count, path) VALUES (?, ?, ?, ?, ?)",
+                (chat_id, topic_id, title, messages_count, path),
+            )
+
+    def last_id(self, chat_id: int, topic_id: int = 0) -> int:
+        row = self.conn.execute(
+            "SELECT MAX(id) FROM messages WHERE chat_id = ? AND topic_id = ?", (chat_id, topic_id)
+        ).fetchone()
+        return int(row[0] or 0)
+
+    def writer(self, chat_id: int, topic_id: int = 0) -> "SqliteWriter":
+        return SqliteWriter(self, chat_id, topic_id)
+
+    def iter_messages(self, chat_id: int, topic_id: int = 0) -> Iterator[Dict[str, Any]]:
+        """Mensajes de un chat/tema en orden de id, tal como se exportaron."""
+        cur = self.conn.execute(
+            "SELECT data FROM messages WHERE chat_id = ? AND topic_id = ? ORDER BY id", (chat_id, topic_id)
+        )
+        for (data,) in cur:
+            yield json.loads(data)
+
+    def close(self) -> None:
+        if self.fsync in ("close", "flush"):
+            self.conn.execute("PRAGMA wal_checkpoint(FULL)")
+        self.conn.close()
+
+
+class SqliteWriter:
+    """
+    Misma interfaz que `JsonlWriter` (write/flush/close), pero insertando en SQLite.
+
+    Los mensajes ya existentes se reemplazan, así que reexportar un chat no
+    genera duplicados. La política fsync la decide `SqliteStore`.
+    """
+
+    def __init__(
+        self,
+        store: SqliteStore,
+        chat_id: int,
+        topic_id: int = 0,
+        max_records: int = DEFAULT_MAX_RECORDS,
+        max_delay: float = DEFAULT_MAX_DELAY,
+    ) -> None:
+        self.store = store
+        self.chat_id = chat_id
+        self.topic_id = topic_id
+        self.max_records = max(1, max_records)
+        self.max_delay = max_delay
+        self._messages: List[Tuple] = []
+        self._media: List[Tuple] = []
+        self._last_flush = time.monotonic()
+        self.written = 0
+
+    def write(self, payload: Dict[str, Any]) -> None:
+        self.add(message_row(payload))
+
+    def add(self, row: Tuple) -> None:
+        """Añade una fila ya preparada con `message_row`."""
+        msg_id, date, sender_id, message, media_type, reply_to, data, media_file = row
+        self._messages.append(
+            (self.chat_id, self.topic_id, msg_id, date, sender_id, message, media_type, reply_to, data)
+        )
+        if media_file:
+            self._media.append((self.chat_id, self.topic_id, msg_id, media_type, media_file))
+        if len(self._messages) >= self.max_records or time.monotonic() - self._last_flush >= self.max_delay:
+            self.flush()
+
+    def flush(self) -> None:
+        self._last_flush = time.monotonic()
+        if not self._messages:
+            return
+        conn = self.store.conn
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO messages "
+                "(chat_id, topic_id, id, date, sender_id, message, media_type, reply_to_msg_id, data) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                self._messages,
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO media (chat_id, topic_id, message_id, media_type, file) VALUES (?, ?, ?, ?, ?)",
+                self._media,
+            )
+        self.written += len(self._messages)
+        self._messages.clear()
+        self._media.clear()
+
+    def close(self) -> None:
+        self.flush()
+
+    def __enter__(self) -> "SqliteWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+
+def message_row(payload: Optional[Dict[str, Any]]) -> Optional[Tuple]:
+    """Columnas de un mensaje exportado para `SqliteWriter.add` (None si no tiene id)."""
+    if not payload or "id" not in payload:
+        return None
+    return (
+        payload["id"],
+        payload.get("date"),
+        payload.get("sender_id"),
+        payload.get("message"),
+        payload.get("media_type"),
+        payload.get("reply_to_msg_id"),
+        dumps_record(payload),
+        payload.get("media_file"),
+    )
+
+
+def _read_json(path: Path) -> Dict[str, Any]:
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def _chat_id_from_name(name: str) -> Optional[int]:
+    head = name.split("_", 1)[0]
+    try:
+        return int(head)
+    except ValueError:
+        return None
+
+
+def _messages_file(folder: Path) -> Optional[Path]:
+    """`messages.jsonl` de la carpeta, o su versión comprimida por bloques."""
+    messages_path = folder / "messages.jsonl"
+    return messages_path if messages_path.exists() else find_block_file(folder)
+
+
+def _import_jsonl(
+    store: SqliteStore, messages_path: Path, chat_id: int, topic_id: int = 0, workers: Optional[int] = None
+) -> int:
+    writer = store.writer(chat_id, topic_id)
+    # Los procesos decodifican y preparan las filas; aquí solo se insertan.
+    for row in iter_objects(messages_path, message_row, workers):
+        if row is not None:
+            writer.add(row)
+    writer.close()
+    return writer.written
+
+
+def convert_backup(root: Path, db_path: Optional[Path] = None, workers: Optional[int] = None) -> Dict[str, int]:
+    """
+    Importa a SQLite todas las exportaciones JSONL (también `.jsonl.gz`/`.zst`) bajo `root`.
+
+    Reconoce las carpetas de `backup_telegram.py` (`<id>_<nombre>/chat.json`) y
+    las de `export_topics.py` (`<chat_id>/topic_<id>_<titulo>/topic.json`).
+    Los archivos grandes se decodifican en `workers` procesos (ver `parallel_jsonl.py`).
+    """
+    root = Path(root)
+    store = SqliteStore(db_path or root / DB_NAME)
+    totals = {"chats": 0, "topics": 0, "messages": 0}
+    try:
+        for d in sorted(p for p in root.iterdir() if p.is_dir()):
+            chat_id = _chat_id_from_name(d.name)
+            messages_path = _messages_file(d)
+            if messages_path is not None:
+                meta = _read_json(d / "chat.json")
+                chat_id = meta.get("id", chat_id)
+                if chat_id is None:
+                    continue
+                store.upsert_chat(chat_id, meta.get("title") or d.name, meta.get("entity_type"), str(d))
+                totals["messages"] += _import_jsonl(store, messages_path, chat_id, workers=workers)
+                totals["chats"] += 1
+            if chat_id is None:
+                continue
+            for sub in sorted(d.glob("topic_*")):
+                topic_messages = _messages_file(sub)
+                if topic_messages is None:
+                    continue
+                meta = _read_json(sub / "topic.json")
+                topic_id = meta.get("topic_id") or _chat_id_from_name(sub.name[len("topic_"):])
+                if topic_id is None:
+                    continue
+                store.upsert_topic(chat_id, topic_id, meta.get("title"), meta.get("messages_count"), str(sub))
+                totals["messages"] += _import_jsonl(store, topic_messages, chat_id, topic_id, workers)
+                totals["topics"] += 1
+    finally:
+        store.close()
+    return totals
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Convierte exportaciones JSONL a una base de datos SQLite.")
+    parser.add_argument("root", type=Path, help="Carpeta base del respaldo (TelegramBackups o TelegramBackupsTopics)")
+    parser.add_argument("--db", type=Path, default=None, help=f"Ruta de la base de datos (por defecto: <root>/{DB_NAME})")
+    parser.add_argument(
+        "--workers", type=int, default=None, help="Procesos para decodificar los JSONL grandes (por defecto: uno por núcleo)"
+    )
+    args = parser.parse_args()
+    totals = convert_backup(args.root.expanduser(), args.db, args.workers)
+    print(f"Importados {totals['chats']} chats, {totals['topics']} temas y {totals['messages']} mensajes.")
+
+
+if __name__ == "__main__":
+    main()
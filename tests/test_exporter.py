@@ -0,0 +1,104 @@
+import asyncio
+import ntpath
+import posixpath
+from types import SimpleNamespace
+
+from telethon import types
+from telethon.errors import FloodWaitError
+
+import chunked_download
+import exporter
+import scheduler as scheduler_module
+from exporter import _download_with_backoff, relative_path
+from media_store import MediaStore
+from metrics import ChatMetrics
+from scheduler import RequestScheduler
+
+
+def test_relative_path_same_drive():
+    assert relative_path(r"C:\Backups\media\a.jpg", r"C:\Backups\chat", ntpath) == r"..\media\a.jpg"
+
+
+def test_relative_path_other_drive_falls_back_to_absolute():
+    path = relative_path(r"D:\MediaStore", r"C:\Backups\chat", ntpath)
+    assert path == r"D:\MediaStore"
+    # Así `chat_dir / path` sigue apuntando al almacén.
+    assert ntpath.join(r"C:\Backups\chat", path) == r"D:\MediaStore"
+
+
+def test_relative_path_posix():
+    assert relative_path("/data/store", "/data/out/chat", posixpath) == "../../store"
+
+
+def test_shared_download_flood_wait_is_reported_once(tmp_path, monkeypatch):
+    document = types.Document(
+        id=7,
+        access_hash=0,
+        file_reference=b"",
+        date=None,
+        mime_type="video/mp4",
+        size=chunked_download.LARGE_FILE_SIZE,
+        dc_id=1,
+        attributes=[],
+    )
+    # El mismo documento dos veces: la segunda descarga espera a la primera.
+    msg = SimpleNamespace(media=types.MessageMediaDocument(document=document), client=None)
+    calls = []
+
+    async def fake_parts(client, msg, document, part_path, parallel_parts):
+        calls.append(part_path)
+        await asyncio.sleep(0.01)
+        if len(calls) == 1:
+            raise FloodWaitError(request=None, capture=0)
+        part_path.write_bytes(b"video")
+        return str(part_path)
+
+    monkeypatch.setattr(chunked_download, "_download_parts", fake_parts)
+    monkeypatch.setattr(scheduler_module, "FLOOD_WAIT_MARGIN", 0.0)
+
+    async def run():
+        scheduler = RequestScheduler(max_downloads=4)
+        metrics = ChatMetrics(1, "chat")
+        results = await asyncio.gather(
+            *(_download_with_backoff(msg, tmp_path, scheduler, metrics=metrics) for _ in range(2))
+        )
+        return scheduler, metrics, results
+
+    scheduler, metrics, results = asyncio.run(run())
+    assert scheduler.floods["download"] == 1
+    assert metrics.flood_waits == 1
+    assert results == [str(tmp_path / "7.part")] * 2
+
+
+def test_reused_media_bytes_are_not_counted(tmp_path, monkeypatch):
+    document = types.Document(
+        id=8,
+        access_hash=0,
+        file_reference=b"",
+        date=None,
+        mime_type="image/png",
+        size=5,
+        dc_id=1,
+        attributes=[],
+    )
+    msg = SimpleNamespace(media=types.MessageMediaDocument(document=document))
+
+    async def fake_download_media(msg, target):
+        path = target / "8.png"
+        path.write_bytes(b"image")
+        return str(path)
+
+    monkeypatch.setattr(exporter, "download_media", fake_download_media)
+
+    async def run():
+        store = MediaStore(tmp_path / "store")
+        scheduler = RequestScheduler()
+        metrics = ChatMetrics(1, "chat")
+        # El segundo chat reutiliza el archivo del almacén sin descargarlo.
+        for chat in ("a", "b"):
+            await _download_with_backoff(msg, tmp_path / chat, scheduler, store=store, metrics=metrics)
+        return store, metrics
+
+    store, metrics = asyncio.run(run())
+    assert store.reused == 1
+    assert metrics.media_bytes == 5
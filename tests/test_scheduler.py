@@ -0,0 +1,77 @@
+import asyncio
+import json
+
+from telethon.errors import FloodWaitError
+
+import backup_telegram
+from benchmark import BenchConfig, FakeTelegramClient
+from exporter import export_messages, open_sink, sign_in
+from scheduler import RequestScheduler
+
+# Tres páginas de historial: la tercera petición recibe un FloodWait corto.
+FLOOD_CONFIG = BenchConfig(dialogs=1, messages=250, media_every=0, flood_every=3, flood_seconds=1)
+
+
+async def _export(tmp_path, connect: bool) -> RequestScheduler:
+    client = FakeTelegramClient(FLOOD_CONFIG)
+    if connect:
+        await sign_in(client, None)
+    scheduler = RequestScheduler(max_history=4)
+    sink = open_sink(tmp_path)
+    try:
+        counters = await export_messages(
+            client, client.channels[0], tmp_path, sink, None, skip_media=True, scheduler=scheduler
+        )
+    finally:
+        sink.close()
+    assert counters["messages"] == FLOOD_CONFIG.messages
+    return scheduler
+
+
+def test_short_flood_wait_reaches_scheduler(tmp_path):
+    scheduler = asyncio.run(_export(tmp_path, connect=True))
+    assert scheduler.floods["history"] == 1
+    assert scheduler.limit("history") == 2
+
+
+class DialogFloodClient(FakeTelegramClient):
+    """Cliente falso cuya primera lista de chats recibe un FloodWait a medias."""
+
+    def __init__(self, config: BenchConfig) -> None:
+        super().__init__(config)
+        self.dialog_calls = 0
+
+    async def iter_dialogs(self):
+        self.dialog_calls += 1
+        async for dialog in super().iter_dialogs():
+            yield dialog
+            if self.dialog_calls == 1:
+                raise FloodWaitError(request=None, capture=1)
+
+
+def test_flood_wait_listing_dialogs_is_retried(tmp_path, monkeypatch, capsys):
+    config = BenchConfig(dialogs=2, messages=50, media_every=0)
+    clients = []
+
+    def make_client(*args, **kwargs):
+        clients.append(DialogFloodClient(config))
+        return clients[-1]
+
+    monkeypatch.setattr(backup_telegram, "TelegramClient", make_client)
+    asyncio.run(
+        backup_telegram.run_backup(
+            api_id=1,
+            api_hash="test",
+            phone=None,
+            session_name="test",
+            output_dir=tmp_path,
+            limit=None,
+            chats=None,
+            skip_media=True,
+            progress_interval=0,
+        )
+    )
+    assert clients[0].dialog_calls == 2
+    summary = json.loads((tmp_path / "resumen.json").read_text(encoding="utf-8"))
+    assert [info["messages"] for info in summary] == [50, 50]
+    assert "FloodWait (otras)" in capsys.readouterr().out
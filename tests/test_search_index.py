@@ -0,0 +1,35 @@
+import json
+import threading
+
+from search_index import SearchIndex
+
+
+def _index(tmp_path, count=5000):
+    path = tmp_path / "messages.jsonl"
+    lines = (json.dumps({"id": n, "message": f"curso número {n}"}) + "\n" for n in range(count))
+    path.write_text("".join(lines), encoding="utf-8")
+    index = SearchIndex(tmp_path / "messages.fts.sqlite", workers=1)
+    index.update(path)
+    return index, path
+
+
+def test_iter_search_reads_in_batches(tmp_path):
+    index, path = _index(tmp_path)
+    hits = index.iter_search("curso", path, ranked=False, cancelled=threading.Event())
+    assert [hit.msg_id for hit in hits] == list(range(5000))
+    index.close()
+
+
+def test_iter_search_stops_when_cancelled(tmp_path):
+    index, path = _index(tmp_path)
+    cancelled = threading.Event()
+    hits = index.iter_search("curso", path, ranked=True, cancelled=cancelled)
+    first = next(hits)
+    cancelled.set()
+    # Como mucho el resto de la tanda ya leída.
+    assert len([first, *hits]) < 5000
+    cancelled.set()
+    assert list(index.iter_search("curso", path, cancelled=cancelled)) == []
+    # La conexión sigue sirviendo después de una consulta cancelada.
+    assert len(index.search("curso", path)) == 5000
+    index.close()
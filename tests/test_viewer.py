@@ -0,0 +1,102 @@
+import json
+import time
+
+import pytest
+from PySide6.QtCore import QCoreApplication, QThreadPool
+
+from viewer import MessageIndex, MessageModel, filter_rows
+
+MESSAGES = [
+    {"id": 1, "date": "2020-01-01T10:00:00+00:00", "message": "hola", "sender_id": 1},
+    # Mensaje de servicio: sin texto ni multimedia.
+    {"id": 2, "date": "2020-01-01T10:01:00+00:00", "message": "", "action": {"_": "MessageActionChatAddUser"}},
+    {"id": 3, "date": "2020-01-02T09:00:00+00:00", "message": "adiós", "sender_id": 2},
+]
+
+
+@pytest.fixture
+def chat_dir(tmp_path):
+    lines = "".join(json.dumps(obj) + "\n" for obj in MESSAGES)
+    (tmp_path / "messages.jsonl").write_text(lines, encoding="utf-8")
+    return tmp_path
+
+
+@pytest.fixture
+def app():
+    return QCoreApplication.instance() or QCoreApplication([])
+
+
+def _ids(model):
+    return [model.data(model.index(n), MessageModel.ROLE_MAP["id"]) for n in range(model.rowCount())]
+
+
+def test_unfiltered_model_hides_empty_service_message(app, chat_dir):
+    model = MessageModel(MessageIndex(chat_dir, False))
+    # Antes de tener las columnas de filtrado, las filas se revisan al mostrarlas.
+    assert _ids(model) == [1, 3]
+    QThreadPool.globalInstance().waitForDone()
+    app.processEvents()
+    assert _ids(model) == [1, 3]
+    assert model.totalCount() == 2
+    assert model.filteredCount() == 2
+    # Quitar los filtros vuelve a la misma lista.
+    model.applyFilters("hola", "", "", "")
+    QThreadPool.globalInstance().waitForDone()
+    app.processEvents()
+    assert _ids(model) == [1]
+    model.applyFilters("", "", "", "")
+    assert _ids(model) == [1, 3]
+    model._index.close()
+
+
+def test_reveal_row_waits_for_background_scan(app, tmp_path):
+    # Uno de cada tres mensajes es de servicio; la fila pedida queda más allá de la primera página.
+    lines = [
+        {"id": n + 1, "date": "2020-01-01T10:00:00+00:00", "message": "" if n % 3 == 1 else f"mensaje {n}"}
+        for n in range(900)
+    ]
+    (tmp_path / "messages.jsonl").write_text("".join(json.dumps(obj) + "\n" for obj in lines), encoding="utf-8")
+    model = MessageModel(MessageIndex(tmp_path, False))
+    revealed = []
+    model.rowRevealed.connect(revealed.append)
+    assert model.revealRow(800) == -1
+    QThreadPool.globalInstance().waitForDone()
+    app.processEvents()
+    # Filas visibles antes de la 800: 800 menos las de servicio (n % 3 == 1).
+    assert revealed == [800 - len(range(1, 800, 3))]
+    assert model.data(model.index(revealed[0]), MessageModel.ROLE_MAP["id"]) == 801
+    model._index.close()
+
+
+def test_phrase_search_without_fts_index(chat_dir):
+    index = MessageIndex(chat_dir, False)
+    try:
+        rows = [row for chunk in filter_rows(index, '"ola"', "", "", "", use_fts=False) for row in chunk]
+        assert rows == [0]
+        # Con la comilla de cierre aún sin escribir.
+        rows = [row for chunk in filter_rows(index, '"adi', "", "", "", use_fts=False) for row in chunk]
+        assert rows == [2]
+    finally:
+        index.close()
+
+
+def test_cleared_and_cached_filters_do_not_reset_model(app, chat_dir):
+    index = MessageIndex(chat_dir, False)
+    # Con el índice de texto listo las dos búsquedas de "hola" usan la misma clave.
+    deadline = time.monotonic() + 10
+    while not index.fts_ready() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    model = MessageModel(index)
+    resets = []
+    model.modelReset.connect(lambda: resets.append(True))
+    model.applyFilters("hola", "", "", "")
+    QThreadPool.globalInstance().waitForDone()
+    app.processEvents()
+    assert _ids(model) == [1]
+    model.applyFilters("", "", "", "")
+    assert _ids(model) == [1, 3]
+    # Mismo filtro que antes: sale de los resultados recordados.
+    model.applyFilters("hola", "", "", "")
+    assert _ids(model) == [1]
+    assert resets == []
+    model._index.close()
@@ -0,0 +1,253 @@
+"""
+Miniaturas de la multimedia para las vistas previas del visor.
+
+`ThumbnailProvider` es un `QQuickAsyncImageProvider` (`image://thumbs/<ruta>`):
+cada miniatura se genera en un hilo aparte, así que desplazarse por un canal
+con miles de fotos no bloquea la interfaz. Las imágenes se decodifican ya
+reducidas (`QImageReader.setScaledSize`) y de los vídeos se extrae un fotograma
+con `ffmpeg`, si está instalado (si no, el vídeo se muestra sin vista previa).
+
+Cada miniatura se guarda en disco (`ThumbnailCache`), con la ruta, el tamaño y
+la fecha de modificación del archivo como clave, y las más recientes se
+mantienen también en memoria en una LRU acotada en bytes.
+"""
+import hashlib
+import os
+import shutil
+import subprocess
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+from urllib.parse import unquote
+
+from PySide6.QtCore import QObject, QRunnable, QSize, QStandardPaths, Qt, QThreadPool, Signal, Slot
+from PySide6.QtGui import QImage, QImageReader
+from PySide6.QtQuick import QQuickAsyncImageProvider, QQuickImageResponse, QQuickTextureFactory
+
+PROVIDER_NAME = "thumbs"
+THUMB_SIZE = 320
+THUMB_QUALITY = 85
+MEMORY_CACHE_BYTES = 64 * 1024 * 1024
+VIDEO_FRAME_AT = "1"
+VIDEO_TIMEOUT = 20
+VIDEO_SUFFIXES = frozenset({".mp4", ".mov", ".m4v", ".mkv", ".webm", ".avi", ".3gp"})
+IMAGE_SUFFIXES = frozenset("." + bytes(fmt).decode() for fmt in QImageReader.supportedImageFormats())
+# Sin ffmpeg los vídeos se muestran sin vista previa.
+_ffmpeg: Optional[str] = shutil.which("ffmpeg")
+
+
+def preview_kind(path: Optional[str]) -> str:
+    """"image", "video" o "" según si se puede mostrar una vista previa del archivo."""
+    if not path:
+        return ""
+    suffix = os.path.splitext(path)[1].lower()
+    if suffix in IMAGE_SUFFIXES:
+        return "image"
+    if suffix in VIDEO_SUFFIXES and _ffmpeg is not None:
+        return "video"
+    return ""
+
+
+def default_cache_dir() -> Path:
+    base = QStandardPaths.writableLocation(QStandardPaths.GenericCacheLocation) or str(Path.home() / ".cache")
+    return Path(base) / "telegram-viewer" / "thumbnails"
+
+
+def _scaled_size(size: QSize, max_side: int) -> QSize:
+    if size.width() <= max_side and size.height() <= max_side:
+        return size
+    return size.scaled(max_side, max_side, Qt.KeepAspectRatio)
+
+
+def decode_image(path: str, max_side: int) -> QImage:
+    """Decodifica `path` ya reducido a `max_side` píxeles por lado (sin cargarlo entero)."""
+    reader = QImageReader(path)
+    reader.setAutoTransform(True)
+    size = reader.size()
+    if size.isValid():
+        reader.setScaledSize(_scaled_size(size, max_side))
+    image = reader.read()
+    if image.isNull():
+        return image
+    if image.width() > max_side or image.height() > max_side:
+        image = image.scaled(max_side, max_side, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+    return image
+
+
+def decode_video_frame(path: str, max_side: int) -> QImage:
+    """Un fotograma del vídeo (al segundo `VIDEO_FRAME_AT`) con `ffmpeg`; vacío si no se puede."""
+    if _ffmpeg is None:
+        return QImage()
+    scale = f"scale='min({max_side},iw)':'min({max_side},ih)':force_original_aspect_ratio=decrease"
+    for start in (VIDEO_FRAME_AT, "0"):
+        # Los vídeos de menos de un segundo no tienen fotograma en `VIDEO_FRAME_AT`.
+        command = [_ffmpeg, "-v", "error", "-ss", start, "-i", path, "-frames:v", "1", "-vf", scale]
+        try:
+            result = subprocess.run(
+                command + ["-f", "image2pipe", "-c:v", "png", "-"],
+                capture_output=True,
+                timeout=VIDEO_TIMEOUT,
+                stdin=subprocess.DEVNULL,
+            )
+        except (OSError, subprocess.TimeoutExpired):
+            return QImage()
+        image = QImage.fromData(result.stdout, "PNG")
+        if not image.isNull():
+            return image
+    return QImage()
+
+
+class ThumbnailCache:
+    """
+    Miniaturas en disco (`<carpeta>/<xx>/<clave>.jpg|.png`) y en memoria.
+
+    La clave combina la ruta, el tamaño y la fecha de modificación del original,
+    de modo que un archivo reemplazado genera otra miniatura. Se puede usar
+    desde varios hilos a la vez.
+    """
+
+    def __init__(self, cache_dir: Path, memory_bytes: int = MEMORY_CACHE_BYTES) -> None:
+        self.cache_dir = Path(cache_dir)
+        self.memory_bytes = memory_bytes
+        self._memory: "OrderedDict[str, QImage]" = OrderedDict()
+        self._memory_used = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(path: str, max_side: int) -> Optional[str]:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        raw = f"{os.path.abspath(path)}\0{stat.st_size}\0{stat.st_mtime_ns}\0{max_side}"
+        return hashlib.sha1(raw.encode("utf-8", "surrogatepass")).hexdigest()
+
+    def _remember(self, key: str, image: QImage) -> None:
+        with self._lock:
+            old = self._memory.pop(key, None)
+            if old is not None:
+                self._memory_used -= old.sizeInBytes()
+            self._memory[key] = image
+            self._memory_used += image.sizeInBytes()
+            while self._memory_used > self.memory_bytes and len(self._memory) > 1:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_used -= evicted.sizeInBytes()
+
+    def _disk_path(self, key: str, suffix: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}{suffix}"
+
+    def get(self, path: str, max_side: int = THUMB_SIZE) -> QImage:
+        """Miniatura de `path`: de memoria, de disco o generándola (vacía si no se puede)."""
+        key = self.key(path, max_side)
+        if key is None:
+            return QImage()
+        with self._lock:
+            image = self._memory.get(key)
+            if image is not None:
+                self._memory.move_to_end(key)
+                return image
+        for suffix in (".jpg", ".png"):
+            cached = self._disk_path(key, suffix)
+            if cached.exists():
+                image = QImage(str(cached))
+                if not image.isNull():
+                    self._remember(key, image)
+                    return image
+        kind = preview_kind(path)
+        if kind == "image":
+            image = decode_image(path, max_side)
+        elif kind == "video":
+            image = decode_video_frame(path, max_side)
+        else:
+            image = QImage()
+        if image.isNull():
+            return image
+        self._save(key, image)
+        self._remember(key, image)
+        return image
+
+    def _save(self, key: str, image: QImage) -> None:
+        # JPEG ocupa mucho menos; PNG solo si hay transparencia (stickers).
+        suffix = ".png" if image.hasAlphaChannel() else ".jpg"
+        target = self._disk_path(key, suffix)
+        tmp = target.with_name(f"{target.stem}.{threading.get_ident()}.tmp")
+        try:
+            target.parent.mkdir(parents=True, exist_ok=True)
+            if image.save(str(tmp), suffix[1:].upper(), THUMB_QUALITY if suffix == ".jpg" else -1):
+                os.replace(tmp, target)
+        except OSError as e:
+            print(f"thumbnail cache error: {e}")
+        finally:
+            tmp.unlink(missing_ok=True)
+
+
+class _ThumbnailSignals(QObject):
+    done = Signal(QImage)
+
+
+class ThumbnailTask(QRunnable):
+    """Genera una miniatura fuera del hilo de la interfaz."""
+
+    def __init__(self, cache: ThumbnailCache, path: str, max_side: int) -> None:
+        super().__init__()
+        self.cache = cache
+        self.path = path
+        self.max_side = max_side
+        self.cancelled = threading.Event()
+        self.signals = _ThumbnailSignals()
+
+    def run(self) -> None:
+        image = QImage()
+        # Si la fila ya salió de la vista antes de empezar, no se decodifica nada.
+        if not self.cancelled.is_set():
+            try:
+                image = self.cache.get(self.path, self.max_side)
+            except Exception as e:
+                print(f"thumbnail error: {e}")
+        self.signals.done.emit(image)
+
+
+class ThumbnailResponse(QQuickImageResponse):
+    def __init__(self, task: ThumbnailTask) -> None:
+        super().__init__()
+        self._image = QImage()
+        self._task = task
+        task.signals.done.connect(self._on_done)
+
+    @Slot(QImage)
+    def _on_done(self, image: QImage) -> None:
+        self._image = image
+        self.finished.emit()
+
+    def cancel(self) -> None:  # type: ignore[override]
+        self._task.cancelled.set()
+
+    def errorString(self) -> str:  # type: ignore[override]
+        return "" if not self._image.isNull() else "Sin vista previa"
+
+    def textureFactory(self) -> QQuickTextureFactory:  # type: ignore[override]
+        return QQuickTextureFactory.textureFactoryForImage(self._image)
+
+
+class ThumbnailProvider(QQuickAsyncImageProvider):
+    """
+    Proveedor `image://thumbs/<ruta>` para QML.
+
+    Usa su propio grupo de hilos para que las miniaturas no hagan esperar a los
+    filtros del visor, que van en el grupo global.
+    """
+
+    def __init__(self, cache: ThumbnailCache, threads: int = 0) -> None:
+        super().__init__()
+        self.cache = cache
+        self.pool = QThreadPool()
+        self.pool.setMaxThreadCount(threads or max(2, QThreadPool.globalInstance().maxThreadCount() // 2))
+
+    def requestImageResponse(self, image_id: str, requested_size: QSize) -> QQuickImageResponse:  # type: ignore[override]
+        max_side = max(requested_size.width(), requested_size.height()) if requested_size.isValid() else 0
+        # QML pasa la ruta con `encodeURIComponent`.
+        task = ThumbnailTask(self.cache, unquote(image_id), max_side or THUMB_SIZE)
+        response = ThumbnailResponse(task)
+        self.pool.start(task)
+        return response
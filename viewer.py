@@ -5,22 +5,81 @@ Visor QML para navegar mensajes exportados.
 Uso:
   python viewer.py --chat-dir "C:\\Users\\Administrador\\Desktop\\TelegramBackups\\-1003146600095_METODOS ANGEL"
 
-Filtra por texto, sender_id, fecha (YYYY-MM-DD) y tipo de multimedia.
+Filtra por texto, remitente (id o nombre), fecha (YYYY-MM-DD) y tipo de multimedia.
 """
 import argparse
+import html
 import json
+import os
+import sqlite3
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
 from datetime import datetime
+from functools import partial
 from pathlib import Path
 import subprocess
-from typing import List, Dict, Any
+import threading
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
 
-from PySide6.QtCore import QAbstractListModel, QModelIndex, Qt, QByteArray, Slot, QUrl, QObject, Signal
+from PySide6.QtCore import (
+    Property,
+    QAbstractListModel,
+    QByteArray,
+    QModelIndex,
+    QObject,
+    QRunnable,
+    Qt,
+    QThreadPool,
+    QUrl,
+    Signal,
+    Slot,
+)
 from PySide6.QtGui import QGuiApplication
 from PySide6.QtQml import QQmlApplicationEngine
 
+from block_jsonl import BlockJsonlReader, find_block_file
+from catalog import catalog_chats, has_local_media, load_catalog, refresh_catalog
+from date_index import DATE_INDEX_NAME, DATE_MAX, DAY_WIDTH, DateIndex, bounds_within, date_bounds, in_bounds
+from entities import load_sender_names
+from parallel_jsonl import Transform, decode_line, iter_objects, pick_fields
+from search_index import HIGHLIGHT_END, HIGHLIGHT_START, ChatSearch, GlobalSearch, substring_text
+from sqlite_store import SqliteStore
+from thumbnails import PROVIDER_NAME, ThumbnailCache, ThumbnailProvider, default_cache_dir, preview_kind
+
+FETCH_PAGE = 200
+ROW_CACHE_SIZE = 2000
+SCAN_CHUNK = 1024 * 1024
+BLOCK_CACHE_SIZE = 4
+FILTER_CHUNK = 2000
+CANCEL_CHECK_EVERY = 256
+# Resultados de filtros recientes que se guardan para reutilizarlos.
+RESULT_CACHE_ENTRIES = 32
+RESULT_CACHE_BYTES = 16 * 1024 * 1024
+
+ROW_VISIBLE = 1
+ROW_MEDIA = 2
+# Columnas de filtrado: ancho de la fecha ISO y valor para ids/remitentes ausentes.
+DATE_WIDTH = 25
+NO_VALUE = -(2**63)
+
+# Campos de cada mensaje que usan `FilterColumns` y `MessageIndex.has_media`.
+FILTER_FIELDS = ("id", "sender_id", "date", "message", "media_file")
+
+# (texto, remitente, fecha, multimedia, por relevancia, con FTS)
+FilterKey = Tuple[str, str, str, str, bool, bool]
+
 
 class MessageModel(QAbstractListModel):
-    """Modelo de solo lectura para QML con filtros en memoria."""
+    """
+    Modelo de solo lectura para QML que carga las filas bajo demanda.
+
+    Solo se mantiene el índice de desplazamientos del chat; la vista pide
+    páginas con `canFetchMore`/`fetchMore` a medida que se desplaza y las filas
+    decodificadas viven en una caché acotada dentro de `MessageIndex`; fecha,
+    hora y ruta absoluta se calculan en `data()` al pedirlas. Los filtros se
+    calculan en segundo plano (`FilterTask`).
+    """
 
     ROLE_MAP = {
         "id": Qt.UserRole + 1,
@@ -32,138 +91,1100 @@ class MessageModel(QAbstractListModel):
         "media_abs": Qt.UserRole + 7,
         "date_display": Qt.UserRole + 8,
         "time_display": Qt.UserRole + 9,
+        "media_preview": Qt.UserRole + 10,
+        "sender_name": Qt.UserRole + 11,
     }
+    _role_keys = {role: key for key, role in ROLE_MAP.items()}
+    _role_keys[Qt.DisplayRole] = "message"
+
+    countsChanged = Signal()
+    filteringChanged = Signal()
+    timelineChanged = Signal()
+    # Posición de una fila pedida con `revealRow` que no se conocía aún (-1 si está oculta).
+    rowRevealed = Signal(int)
 
-    def __init__(self, messages: List[dict]) -> None:
+    def __init__(self, index: Optional["MessageIndex"] = None) -> None:
         super().__init__()
-        self._all = messages
-        self._filtered = list(messages)
+        self._index = index
+        # Números de fila de la lista. Sin filtros, las filas visibles del chat;
+        # mientras no se conocen todas, `_scanned` es la siguiente por revisar.
+        self._filtered = array("L")
+        self._scanned: Optional[int] = None
+        self._pending_reveal: Optional[int] = None
+        self._set_rows(None)
+        self._sort_by_relevance = False
+        self._last_filters = ("", "", "", "")
+        # Cada filtrado lleva un número de generación; los resultados de uno
+        # anterior que lleguen tarde se descartan.
+        self._generation = 0
+        self._task: Optional[FilterTask] = None
+        self._filtering = False
+        # Resultados completos de filtros recientes (LRU acotada en bytes).
+        self._results: "OrderedDict[FilterKey, array]" = OrderedDict()
+        self._results_bytes = 0
+        self._date_task: Optional[DateIndexTask] = None
+        self._timeline: Optional[List[Dict[str, Any]]] = None
+        self._start_date_index()
 
-    def rowCount(self, parent=QModelIndex()) -> int:  # type: ignore[override]
+    def _available(self) -> int:
+        """Filas de la lista; sin filtros y sin revisar todo el chat, como mucho."""
+        if self._scanned is not None:
+            return len(self._filtered) + len(self._index) - self._scanned
         return len(self._filtered)
 
+    def _set_rows(self, filtered: Optional[array]) -> None:
+        """Pone las filas de la lista (None = sin filtros) y carga la primera página."""
+        self._scanned = None
+        self._pending_reveal = None
+        if filtered is None and self._index is not None:
+            filtered = self._index.visible_rows()
+            if filtered is None:
+                # Sin columnas de filtrado todavía: se revisan las filas al ir mostrándolas.
+                self._scanned = 0
+        self._filtered = filtered if filtered is not None else array("L")
+        self._scan_visible(FETCH_PAGE)
+        self._loaded = min(FETCH_PAGE, len(self._filtered))
+
+    def _scan_visible(self, count: int, through_row: int = -1) -> None:
+        """Sin filtros: revisa filas hasta tener `count` visibles y haber pasado `through_row`."""
+        if self._scanned is None:
+            return
+        index, total = self._index, len(self._index)
+        while self._scanned < total and (len(self._filtered) < count or self._scanned <= through_row):
+            if index.is_visible(self._scanned):
+                self._filtered.append(self._scanned)
+            self._scanned += 1
+        if self._scanned >= total:
+            self._scanned = None
+
+    def _row(self, position: int) -> Dict[str, Any]:
+        return self._index.row(self._filtered[position])
+
+    def rowCount(self, parent=QModelIndex()) -> int:  # type: ignore[override]
+        return 0 if parent.isValid() else self._loaded
+
+    def canFetchMore(self, parent=QModelIndex()) -> bool:  # type: ignore[override]
+        return not parent.isValid() and self._loaded < self._available()
+
+    def fetchMore(self, parent=QModelIndex()) -> None:  # type: ignore[override]
+        if parent.isValid():
+            return
+        self._show_more(FETCH_PAGE)
+
+    def _show_more(self, count: int) -> None:
+        self._scan_visible(self._loaded + count)
+        count = min(count, len(self._filtered) - self._loaded)
+        if count <= 0:
+            return
+        self.beginInsertRows(QModelIndex(), self._loaded, self._loaded + count - 1)
+        self._loaded += count
+        self.endInsertRows()
+
     def data(self, index: QModelIndex, role: int = Qt.DisplayRole):  # type: ignore[override]
-        if not index.isValid():
+        if not index.isValid() or index.row() >= self._loaded:
             return None
-        msg = self._filtered[index.row()]
-        for key, role_id in self.ROLE_MAP.items():
-            if role == role_id:
-                return msg.get(key)
-        if role == Qt.DisplayRole:
-            return msg.get("message")
-        return None
+        key = self._role_keys.get(role)
+        if key is None:
+            return None
+        return row_value(self._row(index.row()), key, self._index.media, self._index.senders)
 
     def roleNames(self):  # type: ignore[override]
         return {role: QByteArray(name.encode()) for name, role in self.ROLE_MAP.items()}
 
+    def _reset(self, index: Optional["MessageIndex"], filtered: Optional[array]) -> None:
+        self._cancel_filter()
+        self.beginResetModel()
+        new_index = index is not self._index
+        if new_index:
+            if self._date_task is not None:
+                self._date_task.cancelled.set()
+                self._date_task = None
+            if self._index is not None:
+                self._index.close()
+            self._results.clear()
+            self._results_bytes = 0
+        self._index = index
+        self._set_rows(filtered)
+        self.endResetModel()
+        self.countsChanged.emit()
+        if new_index:
+            self._timeline = None
+            self.timelineChanged.emit()
+            self._start_date_index()
+
+    def _start_date_index(self) -> None:
+        """
+        Calcula en segundo plano las columnas de filtrado del chat (con ellas se
+        conocen las filas visibles) y su índice de fechas si no estaba guardado.
+        """
+        if self._index is None or (self._index.date_index is not None and self._index.visible_rows() is not None):
+            return
+        task = DateIndexTask(self._index)
+        task.signals.done.connect(self._on_date_index)
+        self._date_task = task
+        QThreadPool.globalInstance().start(task)
+
+    @Slot(object)
+    def _on_date_index(self, index: "MessageIndex") -> None:
+        if index is not self._index:
+            return
+        self._date_task = None
+        self._timeline = None
+        self.timelineChanged.emit()
+        if self._scanned is not None and index.visible_rows() is not None:
+            # Lista sin filtros a medio revisar: se pasa a todas las filas visibles.
+            pending = self._pending_reveal
+            visible = index.visible_rows()
+            if visible[: len(self._filtered)] == self._filtered:
+                self._filtered = visible
+                self._scanned = None
+                self.countsChanged.emit()
+            else:
+                self._reset(index, None)
+            if pending is not None:
+                self.rowRevealed.emit(self.revealRow(pending))
+
+    def _cancel_filter(self) -> None:
+        self._generation += 1
+        if self._task is not None:
+            self._task.cancelled.set()
+            self._task = None
+        self._set_filtering(False)
+
+    def _set_filtering(self, value: bool) -> None:
+        if value != self._filtering:
+            self._filtering = value
+            self.filteringChanged.emit()
+
     @Slot(str, result=bool)
     def loadFromPath(self, chat_dir: str) -> bool:
         try:
             path = Path(chat_dir)
-            media_dir = path / "media"
-            has_media_dir = media_dir.exists() and any(media_dir.rglob("*"))
-            messages = load_messages(path, has_media_dir)
+            index = MessageIndex(path, chat_has_media(path))
         except Exception as e:
             print(f"loadFromPath error: {e}")
             return False
-        self.beginResetModel()
-        self._all = messages
-        self._filtered = list(messages)
-        self.endResetModel()
+        self._reset(index, None)
         return True
 
     @Slot(str, str, str, str)
     def applyFilters(self, text_filter: str, sender_filter: str, date_filter: str, media_filter: str) -> None:
         """
-        text_filter: substring en message.
-        sender_filter: substring en sender_id.
-        date_filter: YYYY-MM-DD (fecha exacta) o vacío.
+        text_filter: palabras (por prefijo) o "frases" a buscar en message; usa el
+            índice de texto completo si ya está listo y, si no, busca el substring.
+        sender_filter: substring en sender_id o en el nombre del remitente
+            (sin distinguir mayúsculas, ver `entities.json`).
+        date_filter: prefijo de fecha (YYYY, YYYY-MM o YYYY-MM-DD), rango
+            "desde..hasta" (extremos incluidos, cualquiera puede faltar) o vacío.
         media_filter: "", "media", "nomedia".
+
+        El filtrado corre en el pool de hilos de Qt; los resultados llegan por
+        bloques y se insertan con `beginInsertRows`. Un filtro nuevo cancela el
+        que siguiera en curso.
         """
-        self.beginResetModel()
-        self._filtered = []
-        seen_ids = set()
-        text = text_filter.lower().strip()
-        sender = sender_filter.strip()
-        date_val = date_filter.strip()
-        media = media_filter.strip()
-        for msg in self._all:
-            has_media = bool(msg.get("media_abs"))
-            if text and text not in (msg.get("message") or "").lower():
-                continue
-            if sender and sender not in str(msg.get("sender", "")):
-                continue
-            if date_val:
-                if not msg.get("date", "").startswith(date_val):
-                    continue
-            if media == "media" and not has_media:
-                continue
-            if media == "nomedia" and has_media:
-                continue
-            msg_id = msg.get("id")
-            if msg_id in seen_ids:
-                continue
-            seen_ids.add(msg_id)
-            self._filtered.append(msg)
-        self.endResetModel()
+        filters = (text_filter, sender_filter, date_filter, media_filter)
+        self._last_filters = filters
+        self._pending_reveal = None
+        if self._index is None:
+            return
+        if not any(f.strip() for f in filters):
+            self._replace_rows(None)
+            return
+        use_fts = self._index.fts_ready()
+        key = filter_key(filters, self._sort_by_relevance, use_fts)
+        cached = self._results.get(key)
+        if cached is not None:
+            self._results.move_to_end(key)
+            self._replace_rows(cached)
+            return
+        # Si el filtro nuevo es más estricto que uno reciente, se parte de ese resultado.
+        candidates, pending = None, filters
+        for old_key in reversed(self._results):
+            residual = narrows(old_key, key)
+            if residual is not None:
+                candidates, pending = self._results[old_key], residual
+                break
+
+        self._cancel_filter()
+        # Se vacía la lista sin resetear el modelo; las filas nuevas se van insertando.
+        self._clear_rows()
+        self.countsChanged.emit()
+
+        task = FilterTask(self._generation, self._index, pending, self._sort_by_relevance, use_fts, key, candidates)
+        task.signals.chunk.connect(self._on_filter_chunk)
+        task.signals.done.connect(self._on_filter_done)
+        self._task = task
+        self._set_filtering(True)
+        QThreadPool.globalInstance().start(task)
+
+    def _clear_rows(self) -> None:
+        """Quita todas las filas de la lista con `beginRemoveRows` (sin resetear el modelo)."""
+        if self._loaded:
+            self.beginRemoveRows(QModelIndex(), 0, self._loaded - 1)
+            self._filtered = array("L")
+            self._loaded = 0
+            self.endRemoveRows()
+        else:
+            self._filtered = array("L")
+        self._scanned = None
+
+    def _replace_rows(self, filtered: Optional[array]) -> None:
+        """
+        Pone otras filas en la lista (None = sin filtros) como el filtrado por
+        bloques: quita las cargadas e inserta la primera página de las nuevas.
+        """
+        self._cancel_filter()
+        self._clear_rows()
+        self._set_rows(filtered)
+        count, self._loaded = self._loaded, 0
+        if count:
+            self.beginInsertRows(QModelIndex(), 0, count - 1)
+            self._loaded = count
+            self.endInsertRows()
+        self.countsChanged.emit()
+
+    @Slot(int, object)
+    def _on_filter_chunk(self, generation: int, rows: array) -> None:
+        if generation != self._generation:
+            return
+        self._filtered.extend(rows)
+        # Solo se muestra la primera página; el resto llega con fetchMore.
+        if self._loaded < FETCH_PAGE:
+            self._show_more(FETCH_PAGE - self._loaded)
+        self.countsChanged.emit()
+
+    @Slot(int)
+    def _on_filter_done(self, generation: int) -> None:
+        if generation != self._generation:
+            return
+        if self._task is not None:
+            self._remember(self._task.key, self._filtered)
+        self._task = None
+        self._set_filtering(False)
+
+    def _remember(self, key: FilterKey, rows: array) -> None:
+        size = rows.itemsize * len(rows)
+        if size > RESULT_CACHE_BYTES:
+            return
+        previous = self._results.pop(key, None)
+        if previous is not None:
+            self._results_bytes -= previous.itemsize * len(previous)
+        self._results[key] = rows
+        self._results_bytes += size
+        while len(self._results) > RESULT_CACHE_ENTRIES or self._results_bytes > RESULT_CACHE_BYTES:
+            _, evicted = self._results.popitem(last=False)
+            self._results_bytes -= evicted.itemsize * len(evicted)
+
+    @Slot(int, result=int)
+    def revealRow(self, row_no: int) -> int:
+        """
+        Carga las páginas necesarias para mostrar la fila `row_no` del chat y
+        devuelve su posición en la lista (-1 si los filtros actuales la ocultan).
+
+        Sin filtros y sin conocer todavía las filas visibles hasta `row_no`, no
+        se revisan aquí (en un chat grande bloquearía la interfaz): devuelve -1
+        y emite `rowRevealed` cuando el recorrido en segundo plano termina.
+        """
+        if self._index is None or not 0 <= row_no < len(self._index):
+            return -1
+        self._pending_reveal = None
+        if self._scanned is not None and row_no >= self._scanned:
+            self._pending_reveal = row_no
+            return -1
+        try:
+            position = self._filtered.index(row_no)
+        except ValueError:
+            return -1
+        self._show_more(position + 1 - self._loaded)
+        return position
+
+    @Slot(str, result=int)
+    def jumpToDate(self, date: str) -> int:
+        """
+        Carga las páginas necesarias y devuelve la posición en la lista del
+        primer mensaje de `date` (prefijo ISO) o posterior; si no hay ninguno,
+        la del último. -1 si la lista está vacía.
+        """
+        date = date.strip()
+        if self._index is None or not date or not self._available():
+            return -1
+        row_no = self._index.row_for_date(date)
+        self._scan_visible(0, row_no)
+        if self._sort_by_relevance:
+            # Por relevancia las filas no van en orden: la más cercana posterior.
+            later = [(row, pos) for pos, row in enumerate(self._filtered) if row >= row_no]
+            position = min(later)[1] if later else len(self._filtered)
+        else:
+            position = bisect_left(self._filtered, row_no)
+        self._scan_visible(position + 1)
+        if not self._filtered:
+            return -1
+        position = min(position, len(self._filtered) - 1)
+        self._show_more(position + 1 - self._loaded)
+        return position
+
+    def _get_timeline(self) -> List[Dict[str, Any]]:
+        if self._timeline is None:
+            date_index = self._index.date_index if self._index is not None else None
+            self._timeline = date_index.timeline() if date_index is not None else []
+        return self._timeline
+
+    @Slot(bool)
+    def setSortByRelevance(self, enabled: bool) -> None:
+        """Ordena las búsquedas de texto por relevancia en vez de cronológicamente."""
+        if enabled == self._sort_by_relevance:
+            return
+        self._sort_by_relevance = enabled
+        self.applyFilters(*self._last_filters)
 
     @Slot(result=int)
     def totalCount(self) -> int:
-        return len(self._all)
+        """Mensajes que se muestran sin filtros (hasta conocerlos, todas las filas del chat)."""
+        if self._index is None:
+            return 0
+        visible = self._index.visible_rows()
+        return len(visible) if visible is not None else len(self._index)
 
     @Slot(result=int)
     def filteredCount(self) -> int:
-        return len(self._filtered)
+        return self._available()
 
+    total = Property(int, totalCount, notify=countsChanged)
+    filtered = Property(int, filteredCount, notify=countsChanged)
+    filtering = Property(bool, lambda self: self._filtering, notify=filteringChanged)
+    # Mensajes por periodo para el histograma: [{"period", "count"}, ...].
+    timeline = Property(list, _get_timeline, notify=timelineChanged)
 
-def load_messages(chat_dir: Path, has_media_dir: bool) -> List[dict]:
-    messages_path = chat_dir / "messages.jsonl"
-    if not messages_path.exists():
-        raise FileNotFoundError(f"No se encontró {messages_path}")
-    messages: List[dict] = []
-    with messages_path.open(encoding="utf-8") as f:
-        for line in f:
-            try:
-                obj = json.loads(line)
-            except json.JSONDecodeError:
+
+class _DateIndexSignals(QObject):
+    done = Signal(object)
+
+
+class DateIndexTask(QRunnable):
+    """Prepara las columnas de filtrado de un chat y, con ellas, su índice de fechas."""
+
+    def __init__(self, index: "MessageIndex") -> None:
+        super().__init__()
+        self.index = index
+        self.cancelled = threading.Event()
+        self.signals = _DateIndexSignals()
+
+    def run(self) -> None:
+        try:
+            if self.index.filter_columns(self.cancelled) is not None:
+                self.index.visible_rows()
+        except Exception as e:
+            print(f"date index error: {e}")
+        finally:
+            if not self.cancelled.is_set():
+                self.signals.done.emit(self.index)
+
+
+class _FilterSignals(QObject):
+    chunk = Signal(int, object)
+    done = Signal(int)
+
+
+class FilterTask(QRunnable):
+    """Ejecuta `filter_rows` fuera del hilo de la interfaz y publica los bloques."""
+
+    def __init__(
+        self,
+        generation: int,
+        index: "MessageIndex",
+        filters: Tuple[str, str, str, str],
+        ranked: bool,
+        use_fts: bool,
+        key: FilterKey,
+        candidates: Optional[array] = None,
+    ) -> None:
+        super().__init__()
+        self.generation = generation
+        self.key = key
+        self.index = index
+        self.filters = filters
+        self.ranked = ranked
+        self.use_fts = use_fts
+        self.candidates = candidates
+        self.cancelled = threading.Event()
+        self.signals = _FilterSignals()
+
+    def run(self) -> None:
+        try:
+            for rows in filter_rows(
+                self.index,
+                *self.filters,
+                ranked=self.ranked,
+                cancelled=self.cancelled,
+                candidates=self.candidates,
+                use_fts=self.use_fts,
+            ):
+                if self.cancelled.is_set():
+                    return
+                self.signals.chunk.emit(self.generation, rows)
+        except Exception as e:
+            print(f"applyFilters error: {e}")
+        finally:
+            self.signals.done.emit(self.generation)
+
+
+def filter_key(filters: Tuple[str, str, str, str], ranked: bool, use_fts: bool) -> FilterKey:
+    """Forma normalizada de unos filtros, tal como los aplica `filter_rows`."""
+    text, sender, date_val, media = filters
+    text = text.lower().strip()
+    use_fts = bool(text) and use_fts
+    return (text, sender.strip(), date_val.strip(), media.strip(), ranked and use_fts, use_fts)
+
+
+def narrows(old: FilterKey, new: FilterKey) -> Optional[Tuple[str, str, str, str]]:
+    """
+    Si todo lo que cumple `new` cumple también `old`, devuelve los filtros que
+    aún hay que aplicar sobre el resultado de `old`; si no, None.
+
+    El texto solo se refina buscando el substring: con el índice de texto
+    completo (prefijos, sin acentos) únicamente se reutiliza la misma consulta.
+    """
+    old_text, old_sender, old_date, old_media, old_ranked, old_fts = old
+    text, sender, date_val, media, ranked, use_fts = new
+    if old_sender not in sender or not bounds_within(date_bounds(date_val), date_bounds(old_date)):
+        return None
+    if old_media not in ("", media):
+        return None
+    if old_text == text and old_fts == use_fts and old_ranked == ranked:
+        # Mismo texto: ya se cumple, solo faltan los demás filtros.
+        return ("", sender, date_val, media)
+    if use_fts or old_fts or substring_text(old_text) not in substring_text(text):
+        return None
+    return (text, sender, date_val, media)
+
+
+def filter_rows(
+    index: "MessageIndex",
+    text_filter: str,
+    sender_filter: str,
+    date_filter: str,
+    media_filter: str,
+    ranked: bool = False,
+    cancelled: Optional[threading.Event] = None,
+    candidates: Optional[Sequence[int]] = None,
+    use_fts: Optional[bool] = None,
+) -> Iterator[array]:
+    """
+    Números de fila que cumplen los filtros, en bloques de `FILTER_CHUNK`.
+
+    Usa el índice de texto completo si está listo (o según `use_fts`); si no,
+    recorre las columnas precalculadas del chat. Con `candidates` solo se
+    revisan esas filas, en ese orden. Con `cancelled` activado se detiene en
+    cuanto puede.
+    """
+    text = text_filter.lower().strip()
+    sender = sender_filter.strip()
+    date_val = date_filter.strip()
+    bounds = date_bounds(date_val)
+    media = media_filter.strip()
+    chunk = array("L")
+    seen_ids = set()
+    sender_matches = index.sender_matcher(sender)
+
+    if use_fts is None:
+        use_fts = index.fts_ready()
+    if text and use_fts and candidates is None:
+        total = len(index)
+        for hit in index.search.search(text, ranked=ranked, cancelled=cancelled):
+            if hit.row_no >= total:
                 continue
-            dt = obj.get("date")
-            date_disp = ""
-            time_disp = ""
-            if dt:
-                try:
-                    parsed = datetime.fromisoformat(dt.replace("Z", "+00:00"))
-                    date_disp = parsed.strftime("%Y-%m-%d")
-                    time_disp = parsed.strftime("%H:%M")
-                except Exception:
-                    date_disp = dt[:10]
-                    time_disp = dt[11:16] if len(dt) >= 16 else ""
-
-            media_file = obj.get("media_file")
-            media_abs = None
-            if has_media_dir and media_file:
-                candidate = chat_dir / media_file
-                if candidate.exists():
-                    media_abs = str(candidate.resolve())
-
-            # Evita agregar mensajes sin texto y sin media real (para que no aparezcan huecos)
-            text = obj.get("message")
-            if not text and not media_abs:
+            if sender and not sender_matches(hit.sender_id):
                 continue
+            if date_val and not in_bounds(hit.date or "", bounds):
+                continue
+            if media:
+                has_media = index.has_media({"media_file": hit.media_file})
+                if (media == "media") != has_media:
+                    continue
+            if hit.msg_id in seen_ids:
+                continue
+            seen_ids.add(hit.msg_id)
+            chunk.append(hit.row_no)
+            if len(chunk) >= FILTER_CHUNK:
+                if cancelled is not None and cancelled.is_set():
+                    return
+                yield chunk
+                chunk = array("L")
+        if chunk:
+            yield chunk
+        return
 
-            messages.append(
-                {
-                    "id": obj.get("id"),
-                    "date": obj.get("date"),  # ISO string
-                    "date_display": date_disp,
-                    "time_display": time_disp,
-                    "message": text,
-                    "sender": obj.get("sender_id"),
-                    "media_type": obj.get("media_type"),
-                    "media_file": media_file,
-                    "media_abs": media_abs,
-                }
+    columns = index.filter_columns(cancelled)
+    if columns is None:
+        return
+    needle = substring_text(text).encode("utf-8")
+    # Con el índice de fechas, el filtro de fecha se reduce a un tramo de filas;
+    # solo hace falta mirar cada fecha si el filtro es más fino que un día.
+    row_range = index.date_rows(bounds) if date_val else None
+    check_dates = bool(date_val) and (
+        row_range is None or len(bounds[0]) > DAY_WIDTH or (bounds[1] is not None and len(bounds[1]) > DAY_WIDTH + 1)
+    )
+    date_low = bounds[0].encode("utf-8")
+    date_high = bounds[1].encode("utf-8") if bounds[1] is not None else None
+    first_row, end_row = row_range if row_range is not None else (0, len(columns))
+    if candidates is not None:
+        rows: Iterable[int] = candidates
+    elif text:
+        # Sin candidatos, el texto se busca de una vez sobre todo el búfer (o el tramo de fechas).
+        rows = columns.rows_with_text(needle, first_row, end_row)
+        needle = b""
+    else:
+        rows = range(first_row, end_row)
+    flags, ids, senders = columns.flags, columns.ids, columns.senders
+    for n, row_no in enumerate(rows):
+        if cancelled is not None and n % CANCEL_CHECK_EVERY == 0 and cancelled.is_set():
+            return
+        row_flags = flags[row_no]
+        if not row_flags & ROW_VISIBLE:
+            continue
+        if needle and not columns.has_text(row_no, needle):
+            continue
+        if sender and not sender_matches(senders[row_no]):
+            continue
+        if row_range is not None and not first_row <= row_no < end_row:
+            continue
+        if check_dates and not columns.date_between(row_no, date_low, date_high):
+            continue
+        if media == "media" and not row_flags & ROW_MEDIA:
+            continue
+        if media == "nomedia" and row_flags & ROW_MEDIA:
+            continue
+        msg_id = ids[row_no]
+        if msg_id in seen_ids:
+            continue
+        seen_ids.add(msg_id)
+        chunk.append(row_no)
+        if len(chunk) >= FILTER_CHUNK:
+            yield chunk
+            chunk = array("L")
+    if chunk:
+        yield chunk
+
+
+class FilterColumns:
+    """
+    Campos por los que se filtra, guardados por columnas compactas.
+
+    - `ids` y `senders`: arrays de enteros (`NO_VALUE` si faltaba el dato).
+    - `dates`: la fecha ISO de cada fila con ancho fijo (`DATE_WIDTH`) en un
+      único búfer, para comparar prefijos sin crear cadenas.
+    - texto: el de todas las filas en minúsculas, en UTF-8, en un único búfer
+      separado por NUL y con el inicio de cada fila en `offsets`.
+    - `flags`: `ROW_VISIBLE` y `ROW_MEDIA`.
+    """
+
+    def __init__(self) -> None:
+        self.ids = array("q")
+        self.senders = array("q")
+        self.dates = bytearray()
+        self.text = bytearray()
+        self.offsets = array("Q", [0])
+        self.flags = bytearray()
+
+    def __len__(self) -> int:
+        return len(self.flags)
+
+    def append(self, obj: Dict[str, Any], has_media: bool) -> None:
+        message = obj.get("message") or ""
+        self.ids.append(_int_or_none(obj.get("id")))
+        self.senders.append(_int_or_none(obj.get("sender_id")))
+        date = (obj.get("date") or "").encode("utf-8")[:DATE_WIDTH]
+        self.dates += date.ljust(DATE_WIDTH, b"\0")
+        self.text += message.lower().encode("utf-8", "replace")
+        self.text.append(0)
+        self.offsets.append(len(self.text))
+        flags = ROW_MEDIA if has_media else 0
+        if message or has_media:
+            flags |= ROW_VISIBLE
+        self.flags.append(flags)
+
+    def rows_with_text(self, needle: bytes, start: int = 0, stop: Optional[int] = None) -> Iterator[int]:
+        """Filas de `start` a `stop` (sin incluirla) cuyo texto contiene `needle`, en orden."""
+        text, offsets = self.text, self.offsets
+        end = offsets[min(len(self), stop)] if stop is not None else len(text)
+        pos = text.find(needle, offsets[start], end)
+        while pos != -1:
+            row_no = bisect_right(offsets, pos) - 1
+            yield row_no
+            pos = text.find(needle, offsets[row_no + 1], end)
+
+    def has_text(self, row_no: int, needle: bytes) -> bool:
+        return self.text.find(needle, self.offsets[row_no], self.offsets[row_no + 1] - 1) != -1
+
+    def date_between(self, row_no: int, low: bytes, high: Optional[bytes]) -> bool:
+        """Si la fecha de la fila cumple `low <= fecha < high` (las filas sin fecha, nunca)."""
+        start = row_no * DATE_WIDTH
+        value = self.dates[start : start + DATE_WIDTH]
+        return value[0] != 0 and low <= value and (high is None or value < high)
+
+    def days(self) -> Iterator[str]:
+        """Día (`YYYY-MM-DD`, vacío si no tiene fecha) de cada fila, en orden."""
+        dates = self.dates
+        for start in range(0, len(dates), DATE_WIDTH):
+            yield dates[start : start + DAY_WIDTH].rstrip(b"\0").decode("ascii", "replace")
+
+
+def _int_or_none(value: Any) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return NO_VALUE
+
+
+class JsonlSource:
+    """Acceso por desplazamiento a las líneas de un `messages.jsonl`."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._file = None
+
+    def locators(self) -> array:
+        """Desplazamiento en bytes del inicio de cada línea (sin decodificar JSON)."""
+        offsets = array("Q")
+        size = self.path.stat().st_size
+        if size == 0:
+            return offsets
+        offsets.append(0)
+        with self.path.open("rb") as f:
+            base = 0
+            while True:
+                chunk = f.read(SCAN_CHUNK)
+                if not chunk:
+                    break
+                pos = chunk.find(b"\n")
+                while pos != -1:
+                    offsets.append(base + pos + 1)
+                    pos = chunk.find(b"\n", pos + 1)
+                base += len(chunk)
+        if offsets[-1] >= size:
+            offsets.pop()
+        return offsets
+
+    def read(self, locator: int) -> Optional[Dict[str, Any]]:
+        if self._file is None:
+            self._file = self.path.open("rb")
+        self._file.seek(locator)
+        return _decode(self._file.readline())
+
+    def scan(self, transform: Optional[Transform] = None) -> Iterator[Any]:
+        """
+        Decodifica todas las líneas en orden, en el mismo orden que `locators()`,
+        en varios procesos si el archivo es grande (ver `parallel_jsonl.py`).
+        Con `transform` se entrega `transform(mensaje)` en vez del mensaje.
+        """
+        return iter_objects(self.path, transform)
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class BlockSource:
+    """
+    Acceso a un `messages.jsonl.gz`/`.zst` por bloques: el localizador de cada
+    fila es `(bloque << 32) | línea` y al leer solo se descomprime su bloque.
+    """
+
+    def __init__(self, path: Path, cached_blocks: int = BLOCK_CACHE_SIZE) -> None:
+        self.path = path
+        self.reader = BlockJsonlReader(path)
+        self.cached_blocks = cached_blocks
+        self._blocks: "OrderedDict[int, List[bytes]]" = OrderedDict()
+
+    def locators(self) -> array:
+        locators = array("Q")
+        for block_no, block in enumerate(self.reader.blocks):
+            base = block_no << 32
+            locators.extend(range(base, base + block["lines"]))
+        return locators
+
+    def _block(self, block_no: int) -> List[bytes]:
+        lines = self._blocks.get(block_no)
+        if lines is not None:
+            self._blocks.move_to_end(block_no)
+            return lines
+        lines = self.reader.read_block(block_no)
+        self._blocks[block_no] = lines
+        if len(self._blocks) > self.cached_blocks:
+            self._blocks.popitem(last=False)
+        return lines
+
+    def read(self, locator: int) -> Optional[Dict[str, Any]]:
+        lines = self._block(locator >> 32)
+        line_no = locator & 0xFFFFFFFF
+        return _decode(lines[line_no]) if line_no < len(lines) else None
+
+    def scan(self, transform: Optional[Transform] = None) -> Iterator[Any]:
+        # Cada proceso usa su propio lector: el recorrido no toca el de `read`, que atiende a la vista.
+        return iter_objects(self.path, transform)
+
+    def row_for_date(self, date: str) -> int:
+        """Primera fila con fecha `date` (prefijo ISO) o posterior; solo descomprime un bloque."""
+        blocks = self.reader.blocks
+        if not blocks:
+            return 0
+        block_no = self.reader.block_for_date(date)
+        row_no = sum(block["lines"] for block in blocks[:block_no])
+        for line in self._block(block_no):
+            obj = _decode(line) or {}
+            if (obj.get("date") or "") >= date:
+                break
+            row_no += 1
+        return row_no
+
+    def close(self) -> None:
+        self.reader.close()
+        self._blocks.clear()
+
+
+class SqliteSource:
+    """Acceso por id a los mensajes de un chat exportado con `--format sqlite`."""
+
+    def __init__(self, store: SqliteStore, chat_id: int, topic_id: int) -> None:
+        self.store = store
+        self.chat_id = chat_id
+        self.topic_id = topic_id
+
+    def locators(self) -> array:
+        cur = self.store.conn.execute(
+            "SELECT id FROM messages WHERE chat_id = ? AND topic_id = ? ORDER BY id", (self.chat_id, self.topic_id)
+        )
+        return array("q", (row[0] for row in cur))
+
+    def read(self, locator: int) -> Optional[Dict[str, Any]]:
+        row = self.store.conn.execute(
+            "SELECT data FROM messages WHERE chat_id = ? AND topic_id = ? AND id = ?",
+            (self.chat_id, self.topic_id, locator),
+        ).fetchone()
+        return _decode(row[0]) if row else None
+
+    def scan(self, transform: Optional[Transform] = None) -> Iterator[Any]:
+        # Conexión propia: el recorrido corre en el pool de hilos y sqlite3 no
+        # permite usar la conexión del hilo de la interfaz desde otro.
+        conn = sqlite3.connect(str(self.store.db_path))
+        try:
+            cur = conn.execute(
+                "SELECT data FROM messages WHERE chat_id = ? AND topic_id = ? ORDER BY id", (self.chat_id, self.topic_id)
             )
+            for (data,) in cur:
+                obj = _decode(data)
+                yield obj if transform is None else transform(obj)
+        finally:
+            conn.close()
+
+    def close(self) -> None:
+        self.store.close()
+
+
+def open_source(chat_dir: Path):
+    """Fuente de mensajes de un chat: su `messages.jsonl` (comprimido o no) o la base SQLite del respaldo."""
+    messages_path = chat_dir / "messages.jsonl"
+    if messages_path.exists():
+        return JsonlSource(messages_path)
+    block_file = find_block_file(chat_dir)
+    if block_file is not None:
+        return BlockSource(block_file)
+    meta = read_chat_meta(chat_dir)
+    if not meta.get("sqlite"):
+        raise FileNotFoundError(f"No se encontró {messages_path}")
+    # chat.json guarda el id del chat en "id"; topic.json, "chat_id" + "topic_id".
+    chat_id = meta.get("chat_id", meta.get("id"))
+    topic_id = meta.get("topic_id", 0) if "chat_id" in meta else 0
+    return SqliteSource(SqliteStore(chat_dir / meta["sqlite"]), chat_id, topic_id)
+
+
+class MessageIndex:
+    """
+    Índice de filas de un chat: posición de cada mensaje en su fuente.
+
+    Abrirlo solo recorre los saltos de línea del archivo; las filas se
+    decodifican al pedirlas y se guardan en una caché LRU de tamaño fijo. El
+    índice de texto completo del chat se pone al día en segundo plano. El de
+    fechas (`date_index.py`) se lee de `date_index.json` o se calcula junto con
+    las columnas de filtrado.
+    """
+
+    def __init__(self, chat_dir: Path, has_media_dir: bool, cache_size: int = ROW_CACHE_SIZE) -> None:
+        self.chat_dir = chat_dir
+        self.has_media_dir = has_media_dir
+        self.media = MediaFiles(chat_dir) if has_media_dir else None
+        # Nombre de cada remitente según el `entities.json` del respaldo.
+        self.senders = load_sender_names(chat_dir)
+        self.cache_size = cache_size
+        self._source = open_source(chat_dir)
+        self._locators = self._source.locators()
+        self._cache: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._columns = FilterColumns()
+        self._columns_scan: Optional[Iterator[Tuple[int, Dict[str, Any]]]] = None
+        self._columns_lock = threading.Lock()
+        self._visible: Optional[array] = None
+        self._date_signature = self._source_signature()
+        self.date_index = DateIndex.load(chat_dir / DATE_INDEX_NAME, self._date_signature)
+        self.search: Optional[ChatSearch] = None
+        if isinstance(self._source, JsonlSource):
+            try:
+                self.search = ChatSearch(self._source.path)
+            except Exception as e:
+                # Sin permiso de escritura o sin FTS5: se filtra recorriendo el archivo.
+                print(f"search index unavailable: {e}")
+
+    def __len__(self) -> int:
+        return len(self._locators)
+
+    def _source_signature(self) -> List[int]:
+        """Identifica el contenido de la fuente al abrirla: filas, último localizador y, si es un archivo, tamaño y fecha."""
+        signature = [len(self._locators), int(self._locators[-1]) if len(self._locators) else 0]
+        path = getattr(self._source, "path", None)
+        if path is not None:
+            stat = path.stat()
+            signature += [stat.st_size, stat.st_mtime_ns]
+        return signature
+
+    def row(self, row_no: int) -> Dict[str, Any]:
+        """Mensaje crudo de la fila; los campos derivados los calcula `row_value`."""
+        cached = self._cache.get(row_no)
+        if cached is not None:
+            self._cache.move_to_end(row_no)
+            return cached
+        row = self._source.read(self._locators[row_no]) or {}
+        self._cache[row_no] = row
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return row
+
+    def iter_records(self, transform: Optional[Transform] = None) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        """Recorre los mensajes crudos (o `transform(mensaje)`) en orden de fila, sin pasar por la caché."""
+        for row_no, obj in enumerate(self._source.scan(transform)):
+            if row_no >= len(self._locators):
+                break
+            yield row_no, obj or {}
+
+    def filter_columns(self, cancelled: Optional[threading.Event] = None) -> Optional[FilterColumns]:
+        """
+        Columnas de filtrado de todo el chat. La primera llamada recorre la
+        fuente; si se cancela a medias, la siguiente continúa donde quedó.
+        """
+        with self._columns_lock:
+            columns = self._columns
+            if len(columns) < len(self):
+                if self._columns_scan is None:
+                    # Los procesos del recorrido solo devuelven los campos de las columnas.
+                    self._columns_scan = self.iter_records(partial(pick_fields, FILTER_FIELDS))
+                for row_no, obj in self._columns_scan:
+                    columns.append(obj, self.has_media(obj))
+                    if cancelled is not None and row_no % CANCEL_CHECK_EVERY == 0 and cancelled.is_set():
+                        return None
+                self._columns_scan = None
+                while len(columns) < len(self):
+                    columns.append({}, False)
+            if self.date_index is None:
+                self._build_date_index(columns)
+            return columns
+
+    def _build_date_index(self, columns: FilterColumns) -> None:
+        date_index = DateIndex.from_days(columns.days())
+        try:
+            date_index.save(self.chat_dir / DATE_INDEX_NAME, self._date_signature)
+        except OSError as e:
+            # Sin permiso de escritura: se usa igual, solo que no se guarda.
+            print(f"date index not saved: {e}")
+        self.date_index = date_index
+
+    def date_rows(self, bounds: Tuple[str, Optional[str]]) -> Optional[Tuple[int, int]]:
+        """Tramo de filas de las fechas en `bounds` según el índice de fechas (None si no lo hay)."""
+        date_index = self.date_index
+        return date_index.row_range(bounds) if date_index is not None else None
+
+    def row_for_date(self, date: str) -> int:
+        """Primera fila con fecha `date` (prefijo ISO) o posterior."""
+        day_rows = self.date_rows((date, date[:DAY_WIDTH] + DATE_MAX))
+        if day_rows is not None:
+            # El índice de fechas da el día; dentro del día solo se lee si hace falta la hora.
+            lo, hi = day_rows
+            if len(date) <= DAY_WIDTH or lo == hi:
+                return lo
+        else:
+            row_for_date = getattr(self._source, "row_for_date", None)
+            if row_for_date is not None:
+                return row_for_date(date)
+            lo, hi = 0, len(self)
+        # Los mensajes se exportan en orden cronológico: búsqueda binaria leyendo pocas filas.
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if (self.row(mid).get("date") or "") < date:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def sender_matcher(self, sender_filter: str) -> Callable[[Optional[int]], bool]:
+        """
+        Predicado para el filtro de remitente: el texto aparece en el id o,
+        sin distinguir mayúsculas, en el nombre. Cada id se evalúa una vez.
+        """
+        needle = sender_filter.strip()
+        lowered = needle.lower()
+        names = self.senders
+        results: Dict[Optional[int], bool] = {}
+
+        def matches(sender_id: Optional[int]) -> bool:
+            result = results.get(sender_id)
+            if result is None:
+                if sender_id is None or sender_id == NO_VALUE:
+                    result = False
+                else:
+                    result = needle in str(sender_id) or lowered in names.get(sender_id, "").lower()
+                results[sender_id] = result
+            return result
+
+        return matches
+
+    def fts_ready(self) -> bool:
+        return self.search is not None and self.search.ready
+
+    def has_media(self, obj: Dict[str, Any]) -> bool:
+        return self.media is not None and obj.get("media_file") in self.media
+
+    def is_visible(self, row_no: int) -> bool:
+        """Si la fila se muestra sin filtros: con texto o con multimedia en disco (como `ROW_VISIBLE`)."""
+        obj = self.row(row_no)
+        return bool(obj.get("message")) or self.has_media(obj)
+
+    def visible_rows(self) -> Optional[array]:
+        """Filas que se muestran sin filtros, o None si las columnas de filtrado aún no están completas."""
+        if self._visible is None and len(self._columns) >= len(self):
+            flags = self._columns.flags
+            self._visible = array("L", [row_no for row_no, row_flags in enumerate(flags) if row_flags & ROW_VISIBLE])
+        return self._visible
+
+    def close(self) -> None:
+        self._source.close()
+
+
+def read_chat_meta(chat_dir: Path) -> Dict[str, Any]:
+    """Devuelve chat.json o topic.json del chat (vacío si no hay)."""
+    for meta_name in ("chat.json", "topic.json"):
+        meta_path = chat_dir / meta_name
+        if not meta_path.exists():
+            continue
+        try:
+            return json.loads(meta_path.read_text(encoding="utf-8"))
+        except Exception:
+            continue
+    return {}
+
+
+def chat_has_media(chat_dir: Path) -> bool:
+    """Indica si el chat tiene multimedia local: carpeta media/ o almacén compartido."""
+    return has_local_media(chat_dir, read_chat_meta(chat_dir))
+
+
+def iter_records(chat_dir: Path) -> Iterator[Dict[str, Any]]:
+    """Recorre los mensajes exportados de un chat, desde JSONL o desde SQLite."""
+    source = open_source(chat_dir)
+    try:
+        for obj in source.scan():
+            if obj is not None:
+                yield obj
+    finally:
+        source.close()
+
+
+def _decode(raw) -> Optional[Dict[str, Any]]:
+    return decode_line(raw)
+
+
+class MediaFiles:
+    """
+    Archivos multimedia presentes en disco para un chat.
+
+    Cada carpeta (normalmente solo `media/`, o las del almacén compartido) se
+    lista una vez y se guarda como conjunto de nombres; comprobar un mensaje es
+    una búsqueda en memoria y la ruta absoluta se arma sin tocar el disco.
+    """
+
+    def __init__(self, chat_dir: Path) -> None:
+        self.chat_dir = chat_dir
+        self._root = os.path.abspath(chat_dir)
+        self._listings: Dict[str, frozenset] = {}
+
+    def _names(self, directory: str) -> frozenset:
+        names = self._listings.get(directory)
+        if names is None:
+            try:
+                names = frozenset(os.listdir(directory))
+            except OSError:
+                names = frozenset()
+            self._listings[directory] = names
+        return names
+
+    def __contains__(self, media_file: Optional[str]) -> bool:
+        if not media_file:
+            return False
+        directory, name = os.path.split(self.abs_path(media_file))
+        return name in self._names(directory)
+
+    def abs_path(self, media_file: str) -> str:
+        return os.path.normpath(os.path.join(self._root, media_file))
+
+
+def display_date(dt: Optional[str]) -> Tuple[str, str]:
+    """Fecha (YYYY-MM-DD) y hora (HH:MM) para mostrar a partir de la fecha ISO."""
+    if not dt:
+        return "", ""
+    try:
+        parsed = datetime.fromisoformat(dt.replace("Z", "+00:00"))
+        return parsed.strftime("%Y-%m-%d"), parsed.strftime("%H:%M")
+    except Exception:
+        return dt[:10], dt[11:16] if len(dt) >= 16 else ""
+
+
+def row_value(
+    obj: Dict[str, Any], key: str, media: Optional[MediaFiles], senders: Optional[Dict[int, str]] = None
+) -> Any:
+    """Valor de un campo de la fila de QML, calculado al pedirlo a partir del mensaje exportado."""
+    if key == "sender":
+        return obj.get("sender_id")
+    if key == "sender_name":
+        return (senders or {}).get(obj.get("sender_id"), "")
+    if key == "date_display":
+        return display_date(obj.get("date"))[0]
+    if key == "time_display":
+        return display_date(obj.get("date"))[1]
+    if key == "media_abs":
+        media_file = obj.get("media_file")
+        if media is not None and media_file in media:
+            return media.abs_path(media_file)
+        return None
+    if key == "media_preview":
+        return preview_kind(row_value(obj, "media_abs", media))
+    return obj.get(key)
+
+
+def build_row(
+    obj: Dict[str, Any], media: Optional[MediaFiles], senders: Optional[Dict[int, str]] = None
+) -> Dict[str, Any]:
+    """Convierte un mensaje exportado en la fila que muestra QML."""
+    return {key: row_value(obj, key, media, senders) for key in MessageModel.ROLE_MAP}
+
+
+def load_messages(chat_dir: Path, has_media_dir: bool) -> List[dict]:
+    """Carga todas las filas de un chat en memoria (el visor usa `MessageIndex`)."""
+    messages: List[dict] = []
+    media = MediaFiles(chat_dir) if has_media_dir else None
+    senders = load_sender_names(chat_dir)
+    for obj in iter_records(chat_dir):
+        row = build_row(obj, media, senders)
+        # Evita agregar mensajes sin texto y sin media real (para que no aparezcan huecos)
+        if not row["message"] and not row["media_abs"]:
+            continue
+        messages.append(row)
     return messages
 
 
@@ -177,12 +1198,12 @@ def main() -> None:
     )
     args = parser.parse_args()
     chat_dir = args.chat_dir.expanduser()
-    media_dir = chat_dir / "media"
-    has_media_dir = media_dir.exists() and any(media_dir.rglob("*"))
-    messages = load_messages(chat_dir, has_media_dir)
+    has_media_dir = chat_has_media(chat_dir)
+    index = MessageIndex(chat_dir, has_media_dir)
 
     app = QGuiApplication([])
     engine = QQmlApplicationEngine()
+    engine.addImageProvider(PROVIDER_NAME, ThumbnailProvider(ThumbnailCache(default_cache_dir())))
 
     class ClipboardHelper(QObject):
         copied = Signal()
@@ -216,6 +1237,9 @@ def main() -> None:
     class ChatLoader(QObject):
         chatsUpdated = Signal(list)
         currentTitleChanged = Signal(str)
+        globalResults = Signal(str, list)
+        # La búsqueda global de ese texto no pudo hacerse (sin carpeta base o índice con errores).
+        globalSearchFailed = Signal(str)
 
         def __init__(self, message_model: MessageModel, config_path: Path, engine_ref):
             super().__init__()
@@ -226,6 +1250,10 @@ def main() -> None:
             self.base_dir = cfg.get("base_dir") or self.default_base_dir()
             self.current_title = cfg.get("last_chat_title") or ""
             self.current_path = cfg.get("last_chat_path") or ""
+            self._refresh_id = 0
+            self._search_id = 0
+            self._global_search: Optional[GlobalSearch] = None
+            self._global_lock = threading.Lock()
 
         @Slot(str, result=bool)
         def setBaseDir(self, path: str) -> bool:
@@ -246,8 +1274,91 @@ def main() -> None:
 
         @Slot()
         def refreshChats(self) -> None:
-            chats = self._scan_chats()
-            self.chatsUpdated.emit(chats)
+            """
+            Muestra enseguida los chats del catálogo guardado y lo pone al día
+            en segundo plano; si cambió algo se vuelve a emitir la lista.
+            """
+            base = self._base_path()
+            cached = catalog_chats(base, load_catalog(base)) if base.exists() else []
+            self.chatsUpdated.emit(cached)
+            self._refresh_id += 1
+            threading.Thread(
+                target=self._refresh_catalog, args=(base, cached, self._refresh_id), name="catalog", daemon=True
+            ).start()
+
+        def _refresh_catalog(self, base: Path, cached: List[Dict[str, Any]], refresh_id: int) -> None:
+            chats = self._scan_chats(base)
+            if refresh_id == self._refresh_id and chats != cached:
+                self.chatsUpdated.emit(chats)
+            # Con el catálogo al día se indexa lo nuevo para la búsqueda global.
+            self._update_global(base)
+
+        def _global_index(self, base: Path) -> GlobalSearch:
+            if self._global_search is None or self._global_search.root != base.resolve():
+                self._global_search = GlobalSearch(base)
+            return self._global_search
+
+        def _update_global(self, base: Path) -> Optional[GlobalSearch]:
+            if not base.exists():
+                return None
+            # Un solo hilo indexa a la vez; los demás esperan y encuentran el índice al día.
+            with self._global_lock:
+                try:
+                    search = self._global_index(base)
+                    search.update(load_catalog(base))
+                except Exception as e:
+                    print(f"global search index error: {e}")
+                    return None
+            return search
+
+        @Slot(str)
+        def searchAll(self, text: str) -> None:
+            """
+            Busca `text` en todos los chats de la carpeta base en segundo plano y
+            emite `globalResults(texto, resultados)`, o `globalSearchFailed(texto)`
+            si no se pudo; una búsqueda nueva descarta la anterior.
+            """
+            self._search_id += 1
+            if not text.strip():
+                self.globalResults.emit(text, [])
+                return
+            threading.Thread(
+                target=self._search_all, args=(self._base_path(), text, self._search_id), name="global-search", daemon=True
+            ).start()
+
+        def _search_all(self, base: Path, text: str, search_id: int) -> None:
+            search = self._update_global(base)
+            if search_id != self._search_id:
+                return
+            if search is None:
+                self.globalSearchFailed.emit(text)
+                return
+            # Todos los chats de la carpeta base suelen compartir el mismo entities.json.
+            names: Dict[str, Dict[int, str]] = {}
+
+            def sender_name(chat_dir: str, sender_id: Optional[int]) -> str:
+                if chat_dir not in names:
+                    names[chat_dir] = load_sender_names(Path(chat_dir))
+                return names[chat_dir].get(sender_id, "")
+
+            results = [
+                {
+                    "title": hit.title,
+                    "path": hit.chat_dir,
+                    "row": hit.row_no,
+                    "sender": hit.sender_id,
+                    "sender_name": sender_name(hit.chat_dir, hit.sender_id),
+                    "date": display_date(hit.date)[0],
+                    "time": display_date(hit.date)[1],
+                    "snippet": html.escape(hit.snippet)
+                    .replace(HIGHLIGHT_START, "<b>")
+                    .replace(HIGHLIGHT_END, "</b>")
+                    .replace("\n", " "),
+                }
+                for hit in search.search(text)
+            ]
+            if search_id == self._search_id:
+                self.globalResults.emit(text, results)
 
         @Slot(str, result=bool)
         def loadChat(self, path: str) -> bool:
@@ -263,21 +1374,18 @@ def main() -> None:
                 self._save_config()
             return ok
 
-        def _scan_chats(self) -> List[Dict[str, Any]]:
-            base = Path(self.base_dir) if self.base_dir else Path(self.default_base_dir())
-            chats: List[Dict[str, Any]] = []
+        def _base_path(self) -> Path:
+            return Path(self.base_dir) if self.base_dir else Path(self.default_base_dir())
+
+        def _scan_chats(self, base: Optional[Path] = None) -> List[Dict[str, Any]]:
+            base = base or self._base_path()
             if not base.exists():
-                return chats
-            for d in base.iterdir():
-                if not d.is_dir():
-                    continue
-                msg_file = d / "messages.jsonl"
-                if msg_file.exists():
-                    chats.append({"title": d.name, "path": str(d)})
-                for sub in d.glob("topic_*"):
-                    if (sub / "messages.jsonl").exists():
-                        chats.append({"title": f"{d.name} / {sub.name}", "path": str(sub)})
-            return chats
+                return []
+            try:
+                return catalog_chats(base, refresh_catalog(base))
+            except Exception as e:
+                print(f"catalog error: {e}")
+                return []
 
         def _load_config(self) -> Dict[str, Any]:
             if self.config_path.exists():
@@ -303,7 +1411,7 @@ def main() -> None:
             desktop = Path.home() / "Desktop"
             return str(desktop / "TelegramBackups") if desktop.exists() else str(Path.cwd() / "TelegramBackups")
 
-    model = MessageModel(messages)
+    model = MessageModel(index)
     engine.rootContext().setContextProperty("messageModel", model)
     engine.rootContext().setContextProperty("chatTitle", chat_dir.name)
     engine.rootContext().setContextProperty("mediaBasePath", str(chat_dir))